@@ -9,11 +9,15 @@
 #include <WiFiClientSecure.h>
 #include <ArduinoJson.h>
 #include <time.h>
+#include "mbedtls/md.h"
 
 // ========== WIFI CONFIGURATION ==========
 const char* ssid = "WifiName";           
 const char* password = "WifiPassword";
 const char* serverUrl = "http://your_device_ip:8000/api/attendance-scan/";  
+const char* deviceId = "ESP32_GATE_001";
+// Secret from the Device entry in Django admin; leave empty to send unsigned requests
+const char* deviceSecret = "";
 
 // Get certificate from: https://letsencrypt.org/certs/isrgrootx1.pem
 const char* rootCACertificate = \
@@ -401,6 +405,27 @@ void loop() {
   showWaitingMessage();
 }
 
+// ========== REQUEST SIGNING ==========
+// X-Device-Signature = hex HMAC-SHA256(deviceSecret, "<unix time>\n" + body)
+String signPayload(const String& unixTime, const String& body) {
+  String message = unixTime + "\n" + body;
+  unsigned char hmac[32];
+
+  mbedtls_md_context_t ctx;
+  mbedtls_md_init(&ctx);
+  mbedtls_md_setup(&ctx, mbedtls_md_info_from_type(MBEDTLS_MD_SHA256), 1);
+  mbedtls_md_hmac_starts(&ctx, (const unsigned char*)deviceSecret, strlen(deviceSecret));
+  mbedtls_md_hmac_update(&ctx, (const unsigned char*)message.c_str(), message.length());
+  mbedtls_md_hmac_finish(&ctx, hmac);
+  mbedtls_md_free(&ctx);
+
+  char hex[65];
+  for (int i = 0; i < 32; i++) {
+    sprintf(hex + i * 2, "%02x", hmac[i]);
+  }
+  return String(hex);
+}
+
 // ========== SEND TO DJANGO SERVER (UPDATED FOR NEW BACKEND) ==========
 void sendToServer(String uid, RtcDateTime dt) {
   Serial.println("→ Sending to Django server...");
@@ -425,11 +450,19 @@ void sendToServer(String uid, RtcDateTime dt) {
     
     String jsonPayload = "{";
     jsonPayload += "\"card_uid\":\"" + uid + "\",";
-    jsonPayload += "\"device_id\":\"ESP32_GATE_001\",";
+    jsonPayload += "\"device_id\":\"" + String(deviceId) + "\",";
     jsonPayload += "\"timestamp\":\"" + String(timestamp) + "\"";
     jsonPayload += "}";
     
     Serial.println("  Payload: " + jsonPayload);
+
+    if (strlen(deviceSecret) > 0) {
+      // The RTC keeps local time; the server compares against UTC
+      String unixTime = String(Rtc.GetDateTime().Unix32Time() - gmtOffset_sec);
+      http.addHeader("X-Device-Id", deviceId);
+      http.addHeader("X-Device-Timestamp", unixTime);
+      http.addHeader("X-Device-Signature", signPayload(unixTime, jsonPayload));
+    }
     
     int httpResponseCode = http.POST(jsonPayload);
     
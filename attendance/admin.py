@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     AcademicYear, Class, Teachers, Students, Parents,
-    Attendance, SchoolPeriod, ClassSchedule, AttendancePeriod, ExcusedAbsence
+    Attendance, SchoolPeriod, ClassSchedule, AttendancePeriod, ExcusedAbsence,
+    ScanWindowOverride, ScanEvent, Device, ClassDailyStats, generate_device_secret
 )
 
 
@@ -236,6 +237,69 @@ class SchoolPeriodAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ScanWindowOverride)
+class ScanWindowOverrideAdmin(admin.ModelAdmin):
+    list_display = ['day_of_week', 'grade_level', 'morning_start', 'late_cutoff', 'morning_end', 'afternoon_start', 'afternoon_end', 'is_active']
+    list_filter = ['is_active', 'day_of_week', 'grade_level']
+    ordering = ['day_of_week', 'grade_level']
+    readonly_fields = ['override_id', 'created_at']
+
+    fieldsets = (
+        ('Applies To', {
+            'fields': ('day_of_week', 'grade_level'),
+            'description': 'Leave empty to apply to every day / every grade'
+        }),
+        ('Scan Windows', {
+            'fields': ('morning_start', 'late_cutoff', 'morning_end', 'afternoon_start', 'afternoon_end'),
+            'description': 'Only filled-in times replace the ones derived from the school periods'
+        }),
+        ('Status', {
+            'fields': ('is_active',)
+        }),
+        ('System', {
+            'fields': ('override_id', 'created_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+
+@admin.register(Device)
+class DeviceAdmin(admin.ModelAdmin):
+    list_display = ['device_id', 'device_name', 'is_active', 'updated_at']
+    list_filter = ['is_active']
+    search_fields = ['device_id', 'device_name']
+    ordering = ['device_id']
+    readonly_fields = ['secret', 'created_at', 'updated_at']
+    actions = ['rotate_secret']
+
+    fieldsets = (
+        ('Device', {
+            'fields': ('device_id', 'device_name', 'is_active')
+        }),
+        ('Signing', {
+            'fields': ('secret',),
+            'description': 'Flash this secret into the reader; requests signed with an old secret are rejected after rotation'
+        }),
+        ('System', {
+            'fields': ('created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj:
+            return self.readonly_fields + ['device_id']
+        return self.readonly_fields
+
+    @admin.action(description='Rotate signing secret')
+    def rotate_secret(self, request, queryset):
+        # Saved one by one so the post_save signal reloads the key cache
+        for device in queryset:
+            device.secret = generate_device_secret()
+            device.save(update_fields=['secret', 'updated_at'])
+        self.message_user(request, f'Rotated {queryset.count()} device secrets')
+
+
 @admin.register(ClassSchedule)
 class ClassScheduleAdmin(admin.ModelAdmin):
     list_display = [
@@ -448,3 +512,39 @@ class ExcusedAbsenceInline(admin.TabularInline):
     def has_add_permission(self, request, obj=None):
         return False
 
+
+@admin.register(ScanEvent)
+class ScanEventAdmin(admin.ModelAdmin):
+    """Read-only: the event log is append-only"""
+    list_display = ['scanned_at', 'card_uid', 'student', 'device_id', 'session', 'outcome', 'received_at']
+    list_filter = ['outcome', 'session', 'scan_date', 'device_id']
+    search_fields = ['card_uid', 'student__student_full_name', 'device_id']
+    date_hierarchy = 'scan_date'
+    list_select_related = ['student']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ClassDailyStats)
+class ClassDailyStatsAdmin(admin.ModelAdmin):
+    """Read-only: maintained by the scan path; fix drift with `manage.py reconcile_class_stats`"""
+    list_display = ['stats_date', 'class_obj', 'total_active', 'morning_scanned', 'afternoon_scanned', 'late', 'excused', 'updated_at']
+    list_filter = ['stats_date', 'class_obj__grade_level']
+    date_hierarchy = 'stats_date'
+    list_select_related = ['class_obj', 'class_obj__academic_year']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -1,360 +1,319 @@
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
 from django.utils import timezone
-from .models import Students, Attendance, AcademicYear, ExcusedAbsence
+from django.utils.crypto import constant_time_compare
+from django.conf import settings
 import json
-from datetime import datetime, time
-from zoneinfo import ZoneInfo
 from django.contrib.auth.decorators import login_required
+from .utils.lcd import to_ascii_vietnamese
+from .scan_service import process_scan, aprocess_scan, process_scan_batch, DEFAULT_DEVICE_ID
+from .scan_journal import journal_scan
+from . import scan_feed
+from .device_auth import device_signed
+from .scan_profiles import scan_response, batch_response
+from .utils.scan_metrics import start_timer, count_scan, render_metrics
+from .utils.dashboard_stats import get_dashboard_stats, dashboard_etag
+from .utils.cache_version import cache_is_shared
+from .utils.scan_dedup import (
+	scan_event_key, claim, remember, release, aclaim, aremember, arelease, claim_many, remember_many, release_many
+)
+from asgiref.sync import sync_to_async
+import asyncio
 
 
-def to_ascii_vietnamese(text):
-	"""Convert Vietnamese characters to ASCII-friendly equivalents for LCD display"""
-	replacements = {
-		'à': 'a', 'á': 'a', 'ả': 'a', 'ã': 'a', 'ạ': 'a',
-		'ă': 'a', 'ằ': 'a', 'ắ': 'a', 'ẳ': 'a', 'ẵ': 'a', 'ặ': 'a',
-		'â': 'a', 'ầ': 'a', 'ấ': 'a', 'ẩ': 'a', 'ẫ': 'a', 'ậ': 'a',
-		'đ': 'd',
-		'è': 'e', 'é': 'e', 'ẻ': 'e', 'ẽ': 'e', 'ẹ': 'e',
-		'ê': 'e', 'ề': 'e', 'ế': 'e', 'ể': 'e', 'ễ': 'e', 'ệ': 'e',
-		'ì': 'i', 'í': 'i', 'ỉ': 'i', 'ĩ': 'i', 'ị': 'i',
-		'ò': 'o', 'ó': 'o', 'ỏ': 'o', 'õ': 'o', 'ọ': 'o',
-		'ô': 'o', 'ồ': 'o', 'ố': 'o', 'ổ': 'o', 'ỗ': 'o', 'ộ': 'o',
-		'ơ': 'o', 'ờ': 'o', 'ớ': 'o', 'ở': 'o', 'ỡ': 'o', 'ợ': 'o',
-		'ù': 'u', 'ú': 'u', 'ủ': 'u', 'ũ': 'u', 'ụ': 'u',
-		'ư': 'u', 'ừ': 'u', 'ứ': 'u', 'ử': 'u', 'ữ': 'u', 'ự': 'u',
-		'ỳ': 'y', 'ý': 'y', 'ỷ': 'y', 'ỹ': 'y', 'ỵ': 'y',
+# Fields of a scan body that must be strings when given (a bad timestamp falls back to server time)
+SCAN_STRING_FIELDS = ('card_uid', 'device_id')
+
+
+def _invalid_scan_body(data):
+	"""Error payload for a body that isn't a scan object, or None when it is one"""
+	if not isinstance(data, dict):
+		message = 'A JSON object is required'
+	else:
+		wrong = [field for field in SCAN_STRING_FIELDS if data.get(field) is not None and not isinstance(data[field], str)]
+		if not wrong:
+			return None
+		message = f"{', '.join(wrong)} must be a string"
+	return {
+		'status': 'error',
+		'message': message,
+		'lcd_message': to_ascii_vietnamese('Lỗi dữ liệu')
 	}
-	result = text
-	for vn_char, ascii_char in replacements.items():
-		result = result.replace(vn_char, ascii_char)
-		result = result.replace(vn_char.upper(), ascii_char.upper())
-	return result
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@device_signed
 def attendance_scan(request):
+	timer = start_timer()
+	device_id = event_key = None
 	try:
 		data = json.loads(request.body)
-		card_uid = data.get('card_uid')
-		device_id = data.get('device_id', 'gate_reader_01')
-		timestamp_str = data.get('timestamp')  # From Arduino/ESP32
+		invalid = _invalid_scan_body(data)
+		if invalid:
+			timer.finish('error')
+			return scan_response(request, invalid, 400, data)
+		# A signed request speaks for its own device, whatever the body says
+		device_id = request.device_id or data.get('device_id', DEFAULT_DEVICE_ID)
+		timer.mark('parse')
+		# A retried tap gets the answer it would have seen the first time
+		event_key = scan_event_key(data, device_id)
+		replay = claim(event_key)
+		if replay:
+			payload, status = replay
+			timer.mark('replay')
+		else:
+			scan = journal_scan if settings.SCAN_FAST_ACK else process_scan
+			payload, status = scan(
+				data.get('card_uid'),
+				device_id,
+				data.get('timestamp'),  # From Arduino/ESP32
+				timer
+			)
+			remember(event_key, payload, status)
+		response = scan_response(request, payload, status, data)
+		timer.mark('render')
+		timer.finish(payload['status'], device_id)
+		return response
 
-		if not card_uid:
-			return JsonResponse({
-				'status': 'error',
-				'message': 'Card UID is required',
-				'lcd_message': to_ascii_vietnamese('Lỗi: Không có thẻ')
-			}, status=400)
+	except json.JSONDecodeError:
+		timer.finish('error', device_id)
+		return scan_response(request, {
+			'status': 'error',
+			'message': 'Invalid JSON data',
+			'lcd_message': to_ascii_vietnamese('Lỗi dữ liệu')
+		}, 400)
+	except Exception as e:
+		release(event_key)
+		timer.finish('error', device_id)
+		return scan_response(request, {
+			'status': 'error',
+			'message': str(e),
+			'lcd_message': to_ascii_vietnamese('Lỗi hệ thống')
+		}, 500)
 
-		# Find student by Card UID
-		try:
-			student = Students.objects.get(
-				student_card_uid=card_uid,
-				student_active_status=True
-			)
-		except Students.DoesNotExist:
-			return JsonResponse({
-				'status': 'error',
-				'message': 'Card not found or inactive',
-				'lcd_message': to_ascii_vietnamese('Thẻ không hợp lệ')
-			}, status=404)
-
-		# Get current academic year
-		try:
-			academic_year = AcademicYear.objects.get(academic_year_active_status=True)
-		except AcademicYear.DoesNotExist:
-			return JsonResponse({
-				'status': 'error',
-				'message': 'No active academic year',
-				'lcd_message': to_ascii_vietnamese('Lỗi hệ thống')
-			}, status=400)
 
-		# Parse timestamp from ESP32 or use server time
-		vn_tz = ZoneInfo("Asia/Ho_Chi_Minh")
-		if timestamp_str:
-			try:
-				# Parse: "2026-01-05 06:15:44"
-				naive_dt = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-				scan_datetime = naive_dt.replace(tzinfo=vn_tz)
-			except ValueError:
-				# Fallback to server time if timestamp format is wrong
-				scan_datetime = timezone.now()
+@csrf_exempt
+@require_http_methods(["POST"])
+@device_signed
+async def attendance_scan_async(request):
+	"""Same contract as attendance_scan, served without holding a worker thread under ASGI"""
+	timer = start_timer()
+	device_id = event_key = None
+	try:
+		data = json.loads(request.body)
+		invalid = _invalid_scan_body(data)
+		if invalid:
+			timer.finish('error')
+			return scan_response(request, invalid, 400, data)
+		# A signed request speaks for its own device, whatever the body says
+		device_id = request.device_id or data.get('device_id', DEFAULT_DEVICE_ID)
+		timer.mark('parse')
+		event_key = scan_event_key(data, device_id)
+		replay = await aclaim(event_key)
+		if replay:
+			payload, status = replay
+			timer.mark('replay')
 		else:
-			# Use server time (already in Asia/Ho_Chi_Minh timezone)
-			scan_datetime = timezone.now()
+			if settings.SCAN_FAST_ACK:
+				scan = sync_to_async(journal_scan, thread_sensitive=False)
+			else:
+				scan = aprocess_scan
+			payload, status = await scan(
+				data.get('card_uid'),
+				device_id,
+				data.get('timestamp'),
+				timer
+			)
+			await aremember(event_key, payload, status)
+		response = scan_response(request, payload, status, data)
+		timer.mark('render')
+		timer.finish(payload['status'], device_id)
+		return response
 
-		scan_date = scan_datetime.date()
-		scan_time = scan_datetime.time()
+	except json.JSONDecodeError:
+		timer.finish('error', device_id)
+		return scan_response(request, {
+			'status': 'error',
+			'message': 'Invalid JSON data',
+			'lcd_message': to_ascii_vietnamese('Lỗi dữ liệu')
+		}, 400)
+	except Exception as e:
+		await arelease(event_key)
+		timer.finish('error', device_id)
+		return scan_response(request, {
+			'status': 'error',
+			'message': str(e),
+			'lcd_message': to_ascii_vietnamese('Lỗi hệ thống')
+		}, 500)
 
-		# Determine if this is morning or afternoon scan
-		morning_start = time(6, 0)   # 6:00 AM
-		morning_end = time(11, 0)     # 11:00 AM
-		afternoon_start = time(13, 0) # 1:00 PM
-		afternoon_end = time(20, 0)   # 5:00 PM
-		late_cutoff = time(7, 0)      # 7:00 AM - late if after this
 
-		is_morning_period = morning_start <= scan_time <= morning_end
-		is_afternoon_period = afternoon_start <= scan_time <= afternoon_end
+@csrf_exempt
+@require_http_methods(["POST"])
+@device_signed
+def attendance_scan_batch(request):
+	"""Buffered gate scans: a list of {card_uid, device_id, timestamp} events, answered in order"""
+	timer = start_timer()
+	claimed = []
+	try:
+		data = json.loads(request.body)
+		events = data.get('events') if isinstance(data, dict) else data
 
-		# Check if scanning outside allowed times
-		if not is_morning_period and not is_afternoon_period:
+		if not isinstance(events, list) or not events:
 			return JsonResponse({
-				'status': 'warning',
-				'message': 'Scan outside allowed time',
-				'lcd_message': to_ascii_vietnamese('Ngoài giờ quét thẻ'),
-				'student': student.student_full_name,
-				'scan_time': scan_datetime.strftime('%H:%M:%S')
-			})
-
-		# Check for excused absence
-		excused = ExcusedAbsence.objects.filter(
-			student=student,
-			start_date__lte=scan_date,
-			end_date__gte=scan_date,
-			approved_by_homeroom=True
-		).first()
-
-		if excused:
-			# Student has approved excuse but still came to school
-			lcd_msg = to_ascii_vietnamese(f'Xin chào {student.student_full_name}!\nBạn có phép nghỉ')
-			return JsonResponse({
-				'status': 'info',
-				'message': 'Student has excused absence but scanned',
-				'lcd_message': lcd_msg,
-				'student': student.student_full_name,
-				'class': str(student.student_class),
-				'scan_time': scan_datetime.strftime('%H:%M:%S'),
-				'excuse_reason': excused.reason
-			})
-
-		# Get or create attendance record for today
-		attendance, created = Attendance.objects.get_or_create(
-			student=student,
-			check_in_date=scan_date,
-			defaults={
-				'academic_year': academic_year,
-				'device_id': device_id,
-				'status': 'no_scan'
-			}
-		)
-
-		# Handle morning scan
-		if is_morning_period:
-			if attendance.morning_gate_scan_time:
-				# Already scanned this morning
-				existing_time = timezone.localtime(attendance.morning_gate_scan_time)
-				lcd_msg = to_ascii_vietnamese(f'Đã quét buổi sáng!\n{existing_time.strftime("%H:%M")}')
-				return JsonResponse({
-					'status': 'warning',
-					'message': 'Already scanned this morning',
-					'lcd_message': lcd_msg,
-					'student': student.student_full_name,
-					'class': str(student.student_class),
-					'first_scan_time': existing_time.strftime('%H:%M:%S'),
-					'current_scan_time': scan_datetime.strftime('%H:%M:%S')
-				})
-
-			# Save morning scan
-			attendance.morning_gate_scan_time = scan_datetime
-			attendance.morning_scanned_card_uid = card_uid
-			
-			# Check if late
-			is_late = scan_time > late_cutoff
-			
-			if is_late:
-				attendance.status = 'late_arrival'
-				status_message = to_ascii_vietnamese('Trễ')
-				lcd_greeting = to_ascii_vietnamese(f'Bạn đến trễ!\n{student.student_full_name}')
-			else:
-				attendance.status = 'scanned_morning'
-				status_message = to_ascii_vietnamese('Đã quét sáng')
-				lcd_greeting = to_ascii_vietnamese(f'Chào buổi sáng!\n{student.student_full_name}')
-			
-			# Keep old fields for backward compatibility
-			if not attendance.check_in_time:
-				attendance.check_in_time = scan_datetime
-				attendance.scanned_card_uid = card_uid
-			
-			attendance.save()
+				'status': 'error',
+				'message': 'A non-empty list of events is required'
+			}, status=400)
 
+		max_events = getattr(settings, 'SCAN_BATCH_MAX_EVENTS', 200)
+		if len(events) > max_events:
 			return JsonResponse({
-				'status': 'success',
-				'message': 'Morning gate scan recorded',
-				'lcd_message': lcd_greeting,
-				'student': student.student_full_name,
-				'class': str(student.student_class),
-				'student_role': student.get_student_role_display(),
-				'to_number': attendance.student.to_number,
-				'seat_number': attendance.student.seat_number,
-				'scan_time': scan_datetime.strftime('%H:%M:%S'),
-				'scan_status': status_message,
-				'is_late': is_late
-			})
-
-		# Handle afternoon scan
-		elif is_afternoon_period:
-			if not attendance.morning_gate_scan_time:
-				# Scanned afternoon but not morning - unusual
-				lcd_msg = to_ascii_vietnamese(f'Chào buổi chiều!\n{student.student_full_name}\nChưa quét buổi sáng')
-				return JsonResponse({
-					'status': 'warning',
-					'message': 'Afternoon scan without morning scan',
-					'lcd_message': lcd_msg,
-					'student': student.student_full_name,
-					'class': str(student.student_class),
-					'scan_time': scan_datetime.strftime('%H:%M:%S'),
-					'note': 'Student did not scan in morning'
-				})
-
-			if attendance.afternoon_gate_scan_time:
-				# Already scanned this afternoon
-				existing_time = timezone.localtime(attendance.afternoon_gate_scan_time)
-				lcd_msg = to_ascii_vietnamese(f'Đã quét buổi chiều!\n{existing_time.strftime("%H:%M")}')
-				return JsonResponse({
-					'status': 'warning',
-					'message': 'Already scanned this afternoon',
-					'lcd_message': lcd_msg,
-					'student': student.student_full_name,
-					'class': str(student.student_class),
-					'first_scan_time': existing_time.strftime('%H:%M:%S'),
-					'current_scan_time': scan_datetime.strftime('%H:%M:%S')
-				})
-
-			# Save afternoon scan
-			attendance.afternoon_gate_scan_time = scan_datetime
-			attendance.afternoon_scanned_card_uid = card_uid
-			attendance.status = 'scanned_both'  # Has both morning and afternoon
-			attendance.save()
-
-			lcd_greeting = to_ascii_vietnamese(f'Chào buổi chiều!\n{student.student_full_name}')
-			status_message = to_ascii_vietnamese('Đã quét chiều')
-			
-			return JsonResponse({
-				'status': 'success',
-				'message': 'Afternoon gate scan recorded',
-				'lcd_message': lcd_greeting,
-				'student': student.student_full_name,
-				'class': str(student.student_class),
-				'student_role': student.get_student_role_display(),
-				'to_number': attendance.student.to_number,
-				'seat_number': attendance.student.seat_number,
-				'scan_time': scan_datetime.strftime('%H:%M:%S'),
-				'scan_status': status_message,
-				'morning_scan': timezone.localtime(attendance.morning_gate_scan_time).strftime('%H:%M:%S'),
-				'afternoon_scan': scan_datetime.strftime('%H:%M:%S')
-			})
+				'status': 'error',
+				'message': f'At most {max_events} events per batch'
+			}, status=400)
+
+		# A device id on the envelope applies to events that don't carry their own
+		if isinstance(data, dict) and data.get('device_id'):
+			for event in events:
+				if isinstance(event, dict):
+					event.setdefault('device_id', data['device_id'])
+		# A signed batch speaks for its own device, whatever the events say
+		if request.device_id:
+			for event in events:
+				if isinstance(event, dict):
+					event['device_id'] = request.device_id
+
+		# Events answered before (a re-sent buffer) are replayed, the rest claimed and processed
+		event_keys = [scan_event_key(event) for event in events]
+		replays = claim_many(event_keys)
+		fresh = [index for index, key in enumerate(event_keys) if key not in replays]
+		claimed = [event_keys[index] for index in fresh]
+		results = [replays.get(key) for key in event_keys]
+		for index, result in zip(fresh, process_scan_batch([events[index] for index in fresh])):
+			results[index] = result
+		answers = {}
+		for index in fresh:
+			answers.setdefault(event_keys[index], results[index])
+		remember_many(answers)
+		timer.mark('batch')
+		for event, (payload, status) in zip(events, results):
+			device_id = event.get('device_id', DEFAULT_DEVICE_ID) if isinstance(event, dict) else None
+			count_scan(payload['status'], device_id)
+		response = batch_response(request, results, data)
+		timer.mark('batch_render')
+		timer.finish(total='batch_total')
+		return response
 
 	except json.JSONDecodeError:
 		return JsonResponse({
 			'status': 'error',
-			'message': 'Invalid JSON data',
-			'lcd_message': to_ascii_vietnamese('Lỗi dữ liệu')
+			'message': 'Invalid JSON data'
 		}, status=400)
 	except Exception as e:
+		release_many(claimed)
 		return JsonResponse({
 			'status': 'error',
-			'message': str(e),
-			'lcd_message': to_ascii_vietnamese('Lỗi hệ thống')
+			'message': str(e)
 		}, status=500)
 
 
+@require_http_methods(["GET"])
+def scan_metrics(request):
+	"""
+	Scan pipeline histograms and counters for this process, in Prometheus text format.
+	With SCAN_METRICS_TOKEN set, scrapers must send "Authorization: Bearer <token>".
+	Without it, REMOTE_ADDR is checked against SCAN_METRICS_ALLOWED_IPS; behind
+	nginx that is always the proxy's address, so every client passes - set the
+	token (or block /metrics in nginx) in that setup.
+	"""
+	token = getattr(settings, 'SCAN_METRICS_TOKEN', None)
+	if token:
+		allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+	else:
+		allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'SCAN_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+	if not allowed:
+		return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+	return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _homeroom_class_ids(user):
+	if not hasattr(user, 'teacher_profile'):
+		return None
+	return list(user.teacher_profile.homeroom_classes.values_list('class_id', flat=True))
+
+
+def _dashboard_stats_etag(request):
+	class_ids = _homeroom_class_ids(request.user)
+	if class_ids is None:
+		return None
+	# Remembered for the view, which runs only if the browser's copy is stale
+	request.dashboard_class_ids = class_ids
+	request.dashboard_day = timezone.localdate()
+	request.dashboard_etag = None
+	# Versions kept per worker can't vouch for scans recorded by the others
+	if cache_is_shared():
+		request.dashboard_etag = dashboard_etag(class_ids, request.dashboard_day)
+	return request.dashboard_etag
+
+
+# Not @use_replica: a 304 or a cached copy must reflect what the primary has recorded
 @login_required
 @require_http_methods(["GET"])
+@condition(etag_func=_dashboard_stats_etag)
 def teacher_dashboard_stats(request):
 	"""API endpoint for real-time dashboard stats - UPDATED for dual scan system"""
 	
 	if not hasattr(request.user, 'teacher_profile'):
 		return JsonResponse({'error': 'Access denied'}, status=403)
-	
-	teacher = request.user.teacher_profile
-	teacher_classes = teacher.homeroom_classes.all()
-	
-	if not teacher_classes.exists():
-		return JsonResponse({
-			'total_students': 0,
-			'present_count': 0,
-			'late_count': 0,
-			'absent_count': 0,
-			'morning_scanned': 0,
-			'afternoon_scanned': 0,
-			'recent_scans': []
-		})
-	
-	today = timezone.now().date()
-	
-	# Get stats
-	total_students = Students.objects.filter(
-		student_class__in=teacher_classes,
-		student_active_status=True
-	).count()
-	
-	today_attendance = Attendance.objects.filter(
-		student__student_class__in=teacher_classes,
-		check_in_date=today
-	)
-	
-	# Count different statuses
-	morning_scanned = today_attendance.filter(
-		morning_gate_scan_time__isnull=False
-	).count()
-	
-	afternoon_scanned = today_attendance.filter(
-		afternoon_gate_scan_time__isnull=False
-	).count()
-	
-	late_count = today_attendance.filter(status='late_arrival').count()
-	
-	# Absent = total students - students who scanned morning
-	absent_count = total_students - morning_scanned
-	
-	# Recent scans (last 10, either morning or afternoon)
-	recent_scans_morning = Attendance.objects.filter(
-		student__student_class__in=teacher_classes,
-		check_in_date=today,
-		morning_gate_scan_time__isnull=False
-	).select_related('student', 'student__student_class').order_by('-morning_gate_scan_time')[:5]
-	
-	recent_scans_afternoon = Attendance.objects.filter(
-		student__student_class__in=teacher_classes,
-		check_in_date=today,
-		afternoon_gate_scan_time__isnull=False
-	).select_related('student', 'student__student_class').order_by('-afternoon_gate_scan_time')[:5]
-	
-	recent_scans_data = []
-	
-	# Add morning scans
-	for scan in recent_scans_morning:
-		recent_scans_data.append({
-			'student_name': scan.student.student_full_name,
-			'class_name': scan.student.student_class.class_name,
-			'time': timezone.localtime(scan.morning_gate_scan_time).strftime('%H:%M:%S'),
-			'status': scan.status,
-			'scan_type': 'morning'
-		})
-	
-	# Add afternoon scans
-	for scan in recent_scans_afternoon:
-		recent_scans_data.append({
-			'student_name': scan.student.student_full_name,
-			'class_name': scan.student.student_class.class_name,
-			'time': timezone.localtime(scan.afternoon_gate_scan_time).strftime('%H:%M:%S'),
-			'status': scan.status,
-			'scan_type': 'afternoon'
-		})
-	
-	# Sort by time (most recent first)
-	recent_scans_data = sorted(recent_scans_data, key=lambda x: x['time'], reverse=True)[:10]
-	
-	return JsonResponse({
-		'total_students': total_students,
-		'morning_scanned': morning_scanned,
-		'afternoon_scanned': afternoon_scanned,
-		'late_count': late_count,
-		'absent_count': absent_count,
-		'present_count': morning_scanned,  # Consider morning scan as "present"
-		'recent_scans': recent_scans_data,
-		'timestamp': timezone.now().isoformat()
-	})
\ No newline at end of file
+
+	# Counts and the recent-scans feed, shared with other teachers of the same classes
+	stats = get_dashboard_stats(request.dashboard_class_ids, request.dashboard_day, request.dashboard_etag)
+	response = JsonResponse(dict(stats, timestamp=timezone.now().isoformat()))
+	# Let the browser keep it, but always ask whether it is still current
+	response['Cache-Control'] = 'private, no-cache'
+	return response
+
+
+# Seconds between keep-alive comments, so proxies don't close a quiet stream
+STREAM_HEARTBEAT = 15
+
+
+async def _dashboard_events(class_ids):
+	subscription = scan_feed.subscribe(class_ids)
+	try:
+		# Browsers reconnect on their own after this many milliseconds
+		yield 'retry: 5000\n\n'
+		while True:
+			try:
+				event = await asyncio.wait_for(subscription.get(), STREAM_HEARTBEAT)
+			except asyncio.TimeoutError:
+				yield ': keep-alive\n\n'
+				continue
+			yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+	finally:
+		scan_feed.unsubscribe(subscription)
+
+
+@login_required
+@require_http_methods(["GET"])
+async def teacher_dashboard_stream(request):
+	"""
+	Server-Sent Events: one 'scan' event per gate scan recorded for the teacher's classes.
+	Only under ASGI: a WSGI worker would drain the endless generator through async_to_sync
+	before sending a byte and stay blocked on it. There the answer is 204, which tells
+	EventSource not to reconnect, and the dashboard polls instead.
+	"""
+	if not isinstance(request, ASGIRequest):
+		return HttpResponse(status=204)
+	user = await request.auser()
+	class_ids = await sync_to_async(_homeroom_class_ids)(user)
+	if class_ids is None:
+		return JsonResponse({'error': 'Access denied'}, status=403)
+
+	response = StreamingHttpResponse(_dashboard_events(class_ids), content_type='text/event-stream')
+	response['Cache-Control'] = 'no-cache'
+	# Stop nginx from buffering the stream
+	response['X-Accel-Buffering'] = 'no'
+	return response
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class AttendanceConfig(AppConfig):
     name = 'attendance'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .scan_journal import start_drainer_at_startup
+
+        start_drainer_at_startup()
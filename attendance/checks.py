@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .utils.cache_version import cache_is_shared
+
+
+@register(Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+	"""Several workers on a process-local cache never see each other's version bumps"""
+	if cache_is_shared():
+		return []
+	return [Warning(
+		f"WEB_CONCURRENCY is {settings.WEB_CONCURRENCY} but the default cache is process-local "
+		f"({settings.CACHES['default']['BACKEND']}).",
+		hint=(
+			'Set CACHE_URL to a Redis or database cache. Until then roster, excuse, scan window '
+			'and device key changes reach other workers only after LOCAL_CACHE_TTL seconds, the '
+			'dashboard sends no ETags and recent scans are read from the database on every poll.'
+		),
+		id='attendance.W001',
+	)]
+
+
+@register(Tags.security, deploy=True)
+def metrics_token_check(app_configs, **kwargs):
+	"""Behind the proxy the /metrics IP allowlist lets every client through"""
+	if not getattr(settings, 'SCAN_METRICS_ENABLED', True) or getattr(settings, 'SCAN_METRICS_TOKEN', None):
+		return []
+	return [Warning(
+		'SCAN_METRICS_TOKEN is not set, so /metrics is only guarded by SCAN_METRICS_ALLOWED_IPS.',
+		hint=(
+			'Behind nginx REMOTE_ADDR is the proxy for every request. Set SCAN_METRICS_TOKEN '
+			'and scrape with "Authorization: Bearer <token>", or block /metrics in nginx.'
+		),
+		id='attendance.W002',
+	)]
@@ -0,0 +1,177 @@
+"""
+Optional read replica for the read-heavy pages.
+
+With a `replica` database configured (DB_REPLICA_HOST), views decorated with
+@use_replica - the dashboards, attendance histories, reports and timetables -
+read from it. Everything else, the scan endpoints and the period-save path
+included, reads and writes on the primary.
+
+The replica is skipped, falling back to the primary, when:
+  - the request already wrote something (read-after-write in the same request),
+  - the browser wrote within the last REPLICA_MAX_LAG_SECONDS (PrimaryPinMiddleware
+    sets a short-lived cookie after a logged-in write, so a teacher who just
+    saved a period sees it on the next page),
+  - the replica is more than REPLICA_MAX_LAG_SECONDS behind or unreachable
+    (checked at most every REPLICA_LAG_CHECK_INTERVAL seconds per process).
+"""
+from asgiref.sync import iscoroutinefunction
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+from functools import wraps
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+REPLICA = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+LAG_SQL = """
+	SELECT CASE
+		WHEN NOT pg_is_in_recovery() THEN 0
+		WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+		ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+	END
+"""
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_request_state = ContextVar('replica_request_state', default=None)
+
+_lag_lock = threading.Lock()
+_lag = 0.0
+_lag_checked_at = None
+
+
+class _RequestState:
+	__slots__ = ('pinned', 'wrote')
+
+	def __init__(self, pinned):
+		self.pinned = pinned
+		self.wrote = False
+
+
+def _max_lag():
+	return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+
+
+def _replica_lag():
+	"""Last measured lag in seconds; one thread re-measures when the reading is stale"""
+	global _lag, _lag_checked_at
+
+	interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5)
+	now = time.monotonic()
+	if _lag_checked_at is not None and now - _lag_checked_at < interval:
+		return _lag
+	if not _lag_lock.acquire(blocking=False):
+		# Someone else is measuring; until then the previous reading stands
+		return _lag if _lag_checked_at is not None else float('inf')
+	try:
+		try:
+			if connections[REPLICA].vendor != 'postgresql':
+				# No streaming replication to measure (e.g. a test mirror)
+				_lag = 0.0
+			else:
+				with connections[REPLICA].cursor() as cursor:
+					cursor.execute(LAG_SQL)
+					_lag = float(cursor.fetchone()[0])
+		except DatabaseError:
+			logger.warning('Replica lag check failed, reading from the primary', exc_info=True)
+			_lag = float('inf')
+		_lag_checked_at = time.monotonic()
+		return _lag
+	finally:
+		_lag_lock.release()
+
+
+def replica_usable():
+	if REPLICA not in settings.DATABASES:
+		return False
+	state = _request_state.get()
+	if state is not None and (state.pinned or state.wrote):
+		return False
+	return _replica_lag() <= _max_lag()
+
+
+def use_replica(view):
+	"""Let the view's reads go to the replica (when configured and fresh enough)"""
+	if iscoroutinefunction(view):
+		@wraps(view)
+		async def wrapper(*args, **kwargs):
+			token = _replica_reads.set(True)
+			try:
+				return await view(*args, **kwargs)
+			finally:
+				_replica_reads.reset(token)
+	else:
+		@wraps(view)
+		def wrapper(*args, **kwargs):
+			token = _replica_reads.set(True)
+			try:
+				return view(*args, **kwargs)
+			finally:
+				_replica_reads.reset(token)
+	return wrapper
+
+
+# DatabaseCache's table: shared state that must never be read stale or count as a write
+CACHE_APP_LABEL = 'django_cache'
+
+
+class ReplicaRouter:
+	def db_for_read(self, model, **hints):
+		if model._meta.app_label == CACHE_APP_LABEL:
+			return DEFAULT_DB_ALIAS
+		if _replica_reads.get() and replica_usable():
+			return REPLICA
+		return DEFAULT_DB_ALIAS
+
+	def db_for_write(self, model, **hints):
+		state = _request_state.get()
+		if state is not None and model._meta.app_label != CACHE_APP_LABEL:
+			state.wrote = True
+		# Always the primary, also for objects that were read from the replica
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Same data on both aliases
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		# The replica gets its schema through replication
+		return db != REPLICA
+
+
+def _pin(request, response, state):
+	# Readers write on every scan without a session; only logged-in browsers come back to read
+	if state.wrote and settings.SESSION_COOKIE_NAME in request.COOKIES:
+		response.set_cookie(PIN_COOKIE, '1', max_age=max(1, round(_max_lag())), httponly=True, samesite='Lax')
+	return response
+
+
+@sync_and_async_middleware
+def PrimaryPinMiddleware(get_response):
+	"""Tracks writes per request and keeps a browser on the primary for a moment after one"""
+	if iscoroutinefunction(get_response):
+		async def middleware(request):
+			state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+			token = _request_state.set(state)
+			try:
+				response = await get_response(request)
+			finally:
+				_request_state.reset(token)
+			return _pin(request, response, state)
+	else:
+		def middleware(request):
+			state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+			token = _request_state.set(state)
+			try:
+				response = get_response(request)
+			finally:
+				_request_state.reset(token)
+			return _pin(request, response, state)
+	return middleware
@@ -0,0 +1,153 @@
+"""
+Signed requests from gate readers.
+
+A registered reader (Device) signs every scan request with its secret:
+
+	X-Device-Id:        ESP32_GATE_001
+	X-Device-Timestamp: 1791540000                 (unix seconds)
+	X-Device-Signature: hex HMAC-SHA256(secret, "<timestamp>\\n" + raw body)
+
+The check runs before the body is parsed or any model is touched: the key
+comes from the in-process cache in utils/device_keys.py, the timestamp must be
+within DEVICE_AUTH_MAX_SKEW seconds of the server clock, and each signature is
+accepted once (remembered in Django's cache for twice the skew). A reader
+retrying a tap signs it again with a fresh timestamp; the scan itself is then
+recognised by utils/scan_dedup.py and answered as the first time.
+
+With DEVICE_AUTH_REQUIRED off (the default while readers are being
+re-flashed), unsigned requests still pass; signed ones are always checked.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from asgiref.sync import sync_to_async
+from functools import wraps
+import hashlib
+import hmac
+import inspect
+import time
+
+from .scan_profiles import scan_response
+from .scan_service import error_payload
+from .utils.device_keys import get_device_secret
+from .utils.scan_metrics import count_scan
+
+
+KEY_PREFIX = 'attendance:device-sig:'
+
+
+class DeviceAuthError(Exception):
+	def __init__(self, message, device_id=None):
+		super().__init__(message)
+		self.device_id = device_id
+
+
+def _max_skew():
+	return getattr(settings, 'DEVICE_AUTH_MAX_SKEW', 300)
+
+
+def sign_request(secret, timestamp, body):
+	"""Hex signature for a request body; what the firmware computes"""
+	if isinstance(secret, str):
+		secret = secret.encode()
+	return hmac.new(secret, f'{timestamp}\n'.encode() + body, hashlib.sha256).hexdigest()
+
+
+def verify_request(request):
+	"""
+	The verified device id, or None for an unsigned request that is allowed through.
+	Raises DeviceAuthError for anything else.
+	"""
+	device_id = request.headers.get('X-Device-Id')
+	timestamp = request.headers.get('X-Device-Timestamp')
+	signature = request.headers.get('X-Device-Signature')
+
+	if not (device_id or timestamp or signature):
+		if getattr(settings, 'DEVICE_AUTH_REQUIRED', False):
+			raise DeviceAuthError('Unsigned request')
+		return None
+	if not (device_id and timestamp and signature):
+		raise DeviceAuthError('Incomplete device signature headers', device_id)
+
+	try:
+		skew = abs(time.time() - int(timestamp))
+	except ValueError:
+		raise DeviceAuthError('Invalid device timestamp', device_id)
+	if skew > _max_skew():
+		raise DeviceAuthError('Device timestamp outside the allowed window', device_id)
+
+	secret = get_device_secret(device_id)
+	if secret is None:
+		raise DeviceAuthError('Unknown or disabled device', device_id)
+	if not hmac.compare_digest(sign_request(secret, timestamp, request.body), signature.lower()):
+		raise DeviceAuthError('Invalid device signature', device_id)
+
+	# Once per signature; the timestamp check bounds how long one has to be remembered
+	cache = caches[getattr(settings, 'DEVICE_AUTH_CACHE', 'default')]
+	if not cache.add(KEY_PREFIX + signature.lower(), 1, _max_skew() * 2):
+		raise DeviceAuthError('Replayed request', device_id)
+	return device_id
+
+
+def _verify_request_in_thread(request):
+	# A device key cache miss queries Device, and worker threads don't see request_finished
+	close_old_connections()
+	try:
+		return verify_request(request)
+	finally:
+		close_old_connections()
+
+
+async def averify_request(request):
+	"""verify_request for async views; the key lookup and the replay check block, so like aprocess_scan they run on the shared thread pool"""
+	if not any(header in request.headers for header in ('X-Device-Id', 'X-Device-Timestamp', 'X-Device-Signature')):
+		# Unsigned: only a settings check, no I/O
+		return verify_request(request)
+	return await sync_to_async(_verify_request_in_thread, thread_sensitive=False)(request)
+
+
+def verify_frame(device_id, signed, tag):
+	"""
+	Check the truncated HMAC-SHA256 tag of a binary gate frame (see gate_protocol.py).
+	Returns True for a valid tag, False for an allowed unsigned frame; raises DeviceAuthError.
+	"""
+	if not tag:
+		if getattr(settings, 'DEVICE_AUTH_REQUIRED', False):
+			raise DeviceAuthError('Unsigned frame', device_id)
+		return False
+	secret = get_device_secret(device_id)
+	if secret is None:
+		raise DeviceAuthError('Unknown or disabled device', device_id)
+	expected = hmac.new(secret, signed, hashlib.sha256).digest()[:len(tag)]
+	if not hmac.compare_digest(expected, tag):
+		raise DeviceAuthError('Invalid device signature', device_id)
+	return True
+
+
+def _rejected(request, error):
+	count_scan('unauthorized', error.device_id)
+	return scan_response(request, error_payload(str(error), 'Thiết bị\nkhông hợp lệ'), 401)
+
+
+def device_signed(view):
+	"""
+	Verify the reader's signature before the view runs; the view finds the verified
+	id (or None for an allowed unsigned request) on request.device_id.
+	"""
+	if inspect.iscoroutinefunction(view):
+		@wraps(view)
+		async def wrapper(request, *args, **kwargs):
+			try:
+				request.device_id = await averify_request(request)
+			except DeviceAuthError as e:
+				return _rejected(request, e)
+			return await view(request, *args, **kwargs)
+	else:
+		@wraps(view)
+		def wrapper(request, *args, **kwargs):
+			try:
+				request.device_id = verify_request(request)
+			except DeviceAuthError as e:
+				return _rejected(request, e)
+			return view(request, *args, **kwargs)
+	return wrapper
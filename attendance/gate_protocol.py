@@ -0,0 +1,194 @@
+"""
+Binary frame protocol for gate readers (`manage.py run_gate_listener`).
+
+A lighter transport than HTTP + JSON for schools with many gates: one fixed
+frame per tap over TCP (frames back to back on a kept-open connection) or UDP
+(one frame per datagram), answered with one fixed reply frame. Scans go
+through the same path as attendance_scan: device signature, replay of retried
+taps, fast-ack journal or process_scan, metrics.
+
+Scan frame, big-endian, 39 bytes (55 when signed):
+
+	magic     2s   b'GS'
+	version   B    1
+	flags     B    bit 0: signed
+	sequence  I    reader's counter, echoed in the reply; a resent frame keeps it
+	rtc       I    reader clock, seconds since 1970-01-01 in local time (RtcDateTime::Unix32Time)
+	uid_len   B    card UID length in bytes (4, 7 or 10)
+	uid       10s  card UID bytes, sent on as upper-case hex like the HTTP firmware does
+	device    16s  device id, ASCII, NUL-padded
+	tag       16s  signed frames only: HMAC-SHA256(device secret, the 39 bytes above), truncated
+
+Reply frame, 41 bytes:
+
+	magic     2s   b'GR'
+	version   B    1
+	status    B    scan_profiles.STATUS_CODES (0 success, 1 info, 2 warning, 3 error)
+	sequence  I    from the scan frame (0 if it couldn't be read)
+	flags     B    bit 0: late, bit 1: queued (fast-ack)
+	row1      16s  LCD rows, ASCII, space-padded
+	row2      16s
+
+A retried frame is recognised by device + card + reader timestamp, like the
+HTTP path, and gets the original answer. Signed frames must carry a reader
+timestamp within DEVICE_AUTH_MAX_SKEW of the server clock, so an old captured
+frame can't be replayed once its answer has left the dedup window.
+"""
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+import calendar
+import hashlib
+import hmac
+import struct
+
+from .device_auth import DeviceAuthError, verify_frame
+from .scan_journal import journal_scan
+from .scan_profiles import STATUS_CODES, lcd_rows
+from .scan_service import process_scan, error_payload
+from .utils.lcd import to_ascii_vietnamese
+from .utils.scan_dedup import scan_event_key, claim, remember, release
+from .utils.scan_metrics import start_timer, count_scan
+
+
+VERSION = 1
+SCAN_MAGIC = b'GS'
+REPLY_MAGIC = b'GR'
+
+SCAN = struct.Struct('>2sBBIIB10s16s')
+REPLY = struct.Struct('>2sBBIB16s16s')
+TAG_SIZE = 16
+HEADER_SIZE = 4
+
+FLAG_SIGNED = 0x01
+FLAG_LATE = 0x01
+FLAG_QUEUED = 0x02
+
+ScanFrame = namedtuple('ScanFrame', ['sequence', 'device_id', 'card_uid', 'rtc', 'timestamp', 'signed', 'tag'])
+
+
+class FrameError(ValueError):
+	pass
+
+
+def frame_size(header):
+	"""Full length of a scan frame, from its first HEADER_SIZE bytes"""
+	magic, version, flags = header[:2], header[2], header[3]
+	if magic != SCAN_MAGIC or version != VERSION:
+		raise FrameError('Not a scan frame')
+	return SCAN.size + (TAG_SIZE if flags & FLAG_SIGNED else 0)
+
+
+def rtc_to_timestamp(rtc):
+	"""Reader clock seconds -> the 'YYYY-MM-DD HH:MM:SS' local time the HTTP firmware sends"""
+	return datetime.fromtimestamp(rtc, dt_timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def local_rtc(now=None):
+	"""The current local wall-clock time the way a reader's RTC counts it"""
+	return calendar.timegm(timezone.localtime(now).timetuple())
+
+
+def encode_scan(device_id, card_uid, rtc, sequence, secret=None):
+	"""Build a scan frame; used by the emulator and handy for firmware tests"""
+	uid = bytes.fromhex(card_uid)
+	if not 0 < len(uid) <= 10:
+		raise FrameError('Card UID must be 1-10 bytes')
+	device = device_id.encode('ascii')
+	if len(device) > 16:
+		raise FrameError('Device id must be at most 16 characters')
+	flags = FLAG_SIGNED if secret else 0
+	frame = SCAN.pack(SCAN_MAGIC, VERSION, flags, sequence, rtc, len(uid), uid, device)
+	if secret:
+		if isinstance(secret, str):
+			secret = secret.encode()
+		frame += hmac.new(secret, frame, hashlib.sha256).digest()[:TAG_SIZE]
+	return frame
+
+
+def decode_scan(frame):
+	if len(frame) < HEADER_SIZE or len(frame) != frame_size(frame[:HEADER_SIZE]):
+		raise FrameError('Bad frame length')
+	_, _, flags, sequence, rtc, uid_len, uid, device = SCAN.unpack_from(frame)
+	if not 0 < uid_len <= len(uid):
+		raise FrameError('Bad card UID length')
+	try:
+		device_id = device.rstrip(b'\0').decode('ascii')
+	except UnicodeDecodeError:
+		raise FrameError('Bad device id')
+	signed = bool(flags & FLAG_SIGNED)
+	return ScanFrame(
+		sequence=sequence,
+		device_id=device_id,
+		card_uid=uid[:uid_len].hex().upper(),
+		rtc=rtc,
+		timestamp=rtc_to_timestamp(rtc),
+		signed=signed,
+		tag=frame[SCAN.size:] if signed else b'',
+	)
+
+
+def encode_reply(sequence, payload):
+	name = to_ascii_vietnamese(payload['student']) if payload.get('student') else None
+	rows = lcd_rows(payload.get('lcd_message'), name) + ['', '']
+	flags = (FLAG_LATE if payload.get('is_late') else 0) | (FLAG_QUEUED if payload.get('queued') else 0)
+	return REPLY.pack(
+		REPLY_MAGIC, VERSION,
+		STATUS_CODES.get(payload.get('status'), STATUS_CODES['error']),
+		sequence, flags,
+		rows[0].encode('ascii', 'replace').ljust(16), rows[1].encode('ascii', 'replace').ljust(16),
+	)
+
+
+def decode_reply(frame):
+	magic, version, status, sequence, flags, row1, row2 = REPLY.unpack(frame)
+	if magic != REPLY_MAGIC or version != VERSION:
+		raise FrameError('Not a reply frame')
+	return {
+		'status': status,
+		'sequence': sequence,
+		'late': bool(flags & FLAG_LATE),
+		'queued': bool(flags & FLAG_QUEUED),
+		'lcd': [row1.decode('ascii').rstrip(), row2.decode('ascii').rstrip()],
+	}
+
+
+def handle_frame(frame):
+	"""Answer one scan frame; the binary counterpart of api_views.attendance_scan"""
+	timer = start_timer()
+	try:
+		scan = decode_scan(frame)
+	except FrameError as e:
+		timer.finish('error')
+		return encode_reply(0, error_payload(str(e), 'Lỗi dữ liệu'))
+	timer.mark('parse')
+
+	try:
+		verify_frame(scan.device_id, frame[:SCAN.size], scan.tag)
+		if scan.signed and abs(scan.rtc - local_rtc()) > getattr(settings, 'DEVICE_AUTH_MAX_SKEW', 300):
+			raise DeviceAuthError('Reader clock outside the allowed window', scan.device_id)
+	except DeviceAuthError as e:
+		count_scan('unauthorized', scan.device_id)
+		return encode_reply(scan.sequence, error_payload(str(e), 'Thiết bị\nkhông hợp lệ'))
+
+	event_key = None
+	try:
+		event_key = scan_event_key({'card_uid': scan.card_uid, 'timestamp': scan.timestamp}, scan.device_id)
+		replay = claim(event_key)
+		if replay:
+			payload, status = replay
+			timer.mark('replay')
+		else:
+			process = journal_scan if settings.SCAN_FAST_ACK else process_scan
+			payload, status = process(scan.card_uid, scan.device_id, scan.timestamp, timer)
+			remember(event_key, payload, status)
+	except Exception as e:
+		release(event_key)
+		timer.finish('error', scan.device_id)
+		return encode_reply(scan.sequence, error_payload(str(e), 'Lỗi hệ thống'))
+
+	reply = encode_reply(scan.sequence, payload)
+	timer.mark('render')
+	timer.finish(payload['status'], scan.device_id)
+	return reply
@@ -0,0 +1,133 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import ConnectionHandler
+from django.utils import timezone
+from attendance.models import Attendance
+from attendance.utils.bench import latency_summary
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import json
+import time
+
+
+MODES = ['connect', 'persistent', 'pool']
+
+# The read a scan does before its upsert; the benchmark never writes
+SCAN_QUERY = f'SELECT attendance_id FROM {Attendance._meta.db_table} WHERE check_in_date = %s LIMIT 1'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what connection setup adds to each request: new connection per request '
+        '(connect), CONN_MAX_AGE reuse (persistent) and the psycopg pool (pool). Every simulated '
+        'request opens or checks out a connection, runs the scan read and hands it back the way '
+        "Django's request signals do. Reports per-mode latency as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per worker and mode')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent worker threads')
+        parser.add_argument('--modes', default=','.join(MODES), help=f'Comma-separated subset of {", ".join(MODES)}')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        base = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if 'postgresql' not in base['ENGINE']:
+            raise CommandError('Connection pooling needs PostgreSQL; the default database is %s' % base['ENGINE'])
+        if options['requests'] < 1 or options['workers'] < 1:
+            raise CommandError('--requests and --workers must be at least 1')
+
+        modes = [mode.strip() for mode in options['modes'].split(',') if mode.strip()]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f'Unknown modes: {", ".join(sorted(unknown))}')
+
+        report = {
+            'host': base.get('HOST'),
+            'sslmode': base.get('OPTIONS', {}).get('sslmode'),
+            'workers': options['workers'],
+            'requests_per_worker': options['requests'],
+            'modes': {},
+        }
+        for mode in modes:
+            if mode == 'pool':
+                try:
+                    import psycopg_pool  # noqa: F401
+                except ImportError:
+                    self.stderr.write(self.style.WARNING('psycopg_pool is not installed - skipping pool'))
+                    continue
+            report['modes'][mode] = self.run_mode(mode, self.database_settings(base, mode, options), options)
+
+        results = report['modes']
+        if 'connect' in results:
+            baseline = results['connect']['total']['p50_ms']
+            report['saved_p50_ms'] = {
+                mode: round(baseline - result['total']['p50_ms'], 2)
+                for mode, result in results.items() if mode != 'connect'
+            }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def database_settings(self, base, mode, options):
+        database = copy.deepcopy(base)
+        pool = database['OPTIONS'].pop('pool', None)
+        if mode == 'connect':
+            database.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+        elif mode == 'persistent':
+            database.update(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        else:
+            if not isinstance(pool, dict):
+                # Pooling isn't switched on (DB_POOL): one connection per worker thread
+                pool = {'min_size': options['workers'], 'max_size': options['workers']}
+            database.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+            database['OPTIONS']['pool'] = pool
+        return database
+
+    def run_mode(self, mode, database, options):
+        # Own alias per mode: Django keeps one pool per alias for the whole process
+        alias = f'bench_{mode}'
+        handler = ConnectionHandler({alias: database})
+        today = timezone.localdate()
+
+        def worker(_):
+            connection = handler[alias]
+            acquire, query, total = [], [], []
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                # request_started / request_finished both run close_if_unusable_or_obsolete()
+                connection.close_if_unusable_or_obsolete()
+                connection.ensure_connection()
+                connected = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(SCAN_QUERY, [today])
+                    cursor.fetchone()
+                queried = time.perf_counter()
+                connection.close_if_unusable_or_obsolete()
+                acquire.append((connected - started) * 1000)
+                query.append((queried - connected) * 1000)
+                total.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            return acquire, query, total
+
+        if mode == 'pool':
+            # Open the pool before timing, as a worker does on its first request
+            handler[alias].ensure_connection()
+            handler[alias].close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(worker, range(options['workers'])))
+        elapsed = time.perf_counter() - started
+
+        if mode == 'pool':
+            handler[alias].close_pool()
+
+        return {
+            stage: latency_summary([sample for result in results for sample in result[index]], elapsed)
+            for index, stage in enumerate(['acquire', 'query', 'total'])
+        }
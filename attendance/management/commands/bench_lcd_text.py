@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from attendance.scan_service import LCD_GOOD_MORNING
+from attendance.utils.lcd import to_ascii_vietnamese, _ASCII_TABLE
+import json
+import timeit
+
+
+def legacy_to_ascii_vietnamese(text):
+    """The replace-per-character loop to_ascii_vietnamese used before the translate table"""
+    replacements = {
+        'à': 'a', 'á': 'a', 'ả': 'a', 'ã': 'a', 'ạ': 'a',
+        'ă': 'a', 'ằ': 'a', 'ắ': 'a', 'ẳ': 'a', 'ẵ': 'a', 'ặ': 'a',
+        'â': 'a', 'ầ': 'a', 'ấ': 'a', 'ẩ': 'a', 'ẫ': 'a', 'ậ': 'a',
+        'đ': 'd',
+        'è': 'e', 'é': 'e', 'ẻ': 'e', 'ẽ': 'e', 'ẹ': 'e',
+        'ê': 'e', 'ề': 'e', 'ế': 'e', 'ể': 'e', 'ễ': 'e', 'ệ': 'e',
+        'ì': 'i', 'í': 'i', 'ỉ': 'i', 'ĩ': 'i', 'ị': 'i',
+        'ò': 'o', 'ó': 'o', 'ỏ': 'o', 'õ': 'o', 'ọ': 'o',
+        'ô': 'o', 'ồ': 'o', 'ố': 'o', 'ổ': 'o', 'ỗ': 'o', 'ộ': 'o',
+        'ơ': 'o', 'ờ': 'o', 'ớ': 'o', 'ở': 'o', 'ỡ': 'o', 'ợ': 'o',
+        'ù': 'u', 'ú': 'u', 'ủ': 'u', 'ũ': 'u', 'ụ': 'u',
+        'ư': 'u', 'ừ': 'u', 'ứ': 'u', 'ử': 'u', 'ữ': 'u', 'ự': 'u',
+        'ỳ': 'y', 'ý': 'y', 'ỷ': 'y', 'ỹ': 'y', 'ỵ': 'y',
+    }
+    result = text
+    for vn_char, ascii_char in replacements.items():
+        result = result.replace(vn_char, ascii_char)
+        result = result.replace(vn_char.upper(), ascii_char.upper())
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark LCD message transliteration (old replace loop vs translate table vs cached)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help='Calls per variant')
+        parser.add_argument('--name', default='Nguyễn Thị Phương Thảo')
+
+    def handle(self, *args, **options):
+        name = options['name']
+        message = f'Chào buổi sáng!\n{name}'
+        ascii_name = to_ascii_vietnamese(name)
+        number = options['number']
+
+        assert legacy_to_ascii_vietnamese(message) == message.translate(_ASCII_TABLE)
+
+        variants = {
+            # What a greeting cost per scan before
+            'legacy_replace_loop': lambda: legacy_to_ascii_vietnamese(message),
+            # One translate() pass, uncached
+            'translate_table': lambda: message.translate(_ASCII_TABLE),
+            # Memoised call, as for repeated names and phrases
+            'cached_call': lambda: to_ascii_vietnamese(message),
+            # What the scan path does now: fixed phrase + the roster's ascii_name
+            'precomputed_concat': lambda: f'{LCD_GOOD_MORNING}\n{ascii_name}',
+        }
+
+        report = {}
+        for label, func in variants.items():
+            seconds = min(timeit.repeat(func, number=number, repeat=3))
+            report[label] = {'us_per_call': round(seconds / number * 1e6, 3)}
+
+        baseline = report['legacy_replace_loop']['us_per_call']
+        for result in report.values():
+            result['speedup'] = round(baseline / result['us_per_call'], 1) if result['us_per_call'] else None
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from attendance.models import Students
+from attendance.utils.bench import latency_summary, scan_outcome, unparsed_outcomes
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import http.client
+import itertools
+import json
+import time
+import uuid
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the sync (WSGI) and async (ASGI) scan endpoints under concurrent load. '
+        'Start both servers first, e.g. gunicorn on :8000 and uvicorn on :8001. '
+        'Each endpoint gets its own half of the active cards, so neither replays scans the other recorded, '
+        'and every request carries its own event_id, so none is answered from the replay cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', default='http://127.0.0.1:8000/api/attendance-scan/')
+        parser.add_argument('--async-url', default='http://127.0.0.1:8001/api/attendance-scan/async/')
+        parser.add_argument('--requests', type=int, default=2000, help='Scans sent to each endpoint')
+        parser.add_argument('--concurrency', type=int, default=100, help='Simultaneous gate connections')
+        parser.add_argument('--scan-time', default='06:30:00', help='Local time put in every scan timestamp')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        card_uids = list(
+            Students.objects.filter(student_active_status=True)
+            .order_by('student_card_uid')
+            .values_list('student_card_uid', flat=True)[:options['requests'] * 2]
+        )
+        if len(card_uids) < 2:
+            raise CommandError('Need at least two active students with cards - seed some first')
+        half = len(card_uids) // 2
+        sync_cards, async_cards = card_uids[:half], card_uids[half:half * 2]
+
+        today = timezone.localdate().strftime('%Y-%m-%d')
+        timestamp = f"{today} {options['scan_time']}"
+
+        report = {
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'cards_per_endpoint': half,
+            'sync': self.run(options['sync_url'], sync_cards, timestamp, options),
+            'async': self.run(options['async_url'], async_cards, timestamp, options),
+        }
+        for name in ('sync', 'async'):
+            unparsed = unparsed_outcomes(report[name]['outcomes'])
+            if unparsed:
+                # e.g. SECURE_SSL_REDIRECT answering a plain-http URL with 301s
+                raise CommandError(f'{name}: got responses that are not scan replies: {unparsed}')
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run(self, url, card_uids, timestamp, options):
+        """Fire the scans from `concurrency` keep-alive connections and collect latencies"""
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        cards = itertools.cycle(card_uids)
+        # Unique per run and request: a dedup replay would measure a cache hit, not the scan path
+        run_id = uuid.uuid4().hex
+        bodies = [
+            json.dumps({
+                'card_uid': next(cards),
+                'device_id': f'ESP32_GATE_{i % 100:03d}',
+                'timestamp': timestamp,
+                'event_id': f'bench-{run_id}-{i}',
+            })
+            for i in range(options['requests'])
+        ]
+        concurrency = max(1, options['concurrency'])
+
+        def client(worker_bodies):
+            samples, outcomes, errors = [], Counter(), 0
+            conn = connection_class(parts.netloc, timeout=30)
+            for body in worker_bodies:
+                started = time.perf_counter()
+                try:
+                    conn.request('POST', parts.path, body, {'Content-Type': 'application/json'})
+                    response = conn.getresponse()
+                    content = response.read()
+                    if response.status >= 500:
+                        errors += 1
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    outcomes['connection_error'] += 1
+                    conn.close()
+                    conn = connection_class(parts.netloc, timeout=30)
+                    continue
+                samples.append((time.perf_counter() - started) * 1000)
+                outcomes[scan_outcome(response.status, content)] += 1
+            conn.close()
+            return samples, outcomes, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(client, [bodies[i::concurrency] for i in range(concurrency)]))
+        elapsed = time.perf_counter() - started
+
+        samples = [sample for worker_samples, _, _ in results for sample in worker_samples]
+        errors = sum(worker_errors for _, _, worker_errors in results)
+        outcomes = Counter()
+        for _, worker_outcomes, _ in results:
+            outcomes.update(worker_outcomes)
+        return dict(latency_summary(samples, elapsed, errors), url=url, outcomes=dict(outcomes))
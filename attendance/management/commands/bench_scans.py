@@ -0,0 +1,263 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from attendance.models import AcademicYear, Class, Students, ScanEvent
+from attendance.scan_events import flush_scan_events
+from attendance.utils.bench import latency_summary, scan_outcome, unparsed_outcomes
+from attendance.utils.roster_cache import invalidate_roster
+from attendance.utils.academic_year import invalidate_academic_year
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import http.client
+import json
+import random
+import time
+
+
+CARD_PREFIX = 'BN'
+CLASS_PREFIX = 'BENCH'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed benchmark classes and students, replay a morning-rush arrival curve from '
+        'simulated gate readers against the scan endpoint and report throughput, latency '
+        'percentiles and queries per scan as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=20, help='Benchmark classes to seed')
+        parser.add_argument('--students', type=int, default=40, help='Students per class')
+        parser.add_argument('--devices', type=int, default=4, help='Simulated ESP32_GATE_xxx readers')
+        parser.add_argument('--date', help='Day to simulate (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--rush-start', default='06:15', help='First arrivals')
+        parser.add_argument('--rush-peak', default='06:50', help='Busiest minute')
+        parser.add_argument('--rush-end', default='07:15', help='Last arrivals (after 07:00 is late)')
+        parser.add_argument('--double-tap', type=float, default=0.05,
+                            help='Share of students who tap twice (duplicate scans)')
+        parser.add_argument('--speed', type=float, default=0,
+                            help='Replay speed-up over the real arrival curve; 0 sends as fast as possible')
+        parser.add_argument('--url',
+                            help='Send real HTTP to this scan URL instead of using the test client')
+        parser.add_argument('--profile', choices=['verbose', 'compact'], default='verbose')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for a repeatable curve')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data afterwards')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        if options['classes'] < 1 or options['students'] < 1 or options['devices'] < 1:
+            raise CommandError('--classes, --students and --devices must be at least 1')
+
+        rng = random.Random(options['seed'])
+        day = options['date'] or timezone.localdate().strftime('%Y-%m-%d')
+
+        created_year = self.seed(options)
+        try:
+            scans = self.arrival_curve(rng, day, options)
+            if options['url']:
+                run = self.run_http(scans, options)
+            else:
+                run = self.run_client(scans, options)
+        finally:
+            if not options['keep']:
+                self.cleanup(created_year)
+
+        unparsed = unparsed_outcomes(run['outcomes'])
+        if unparsed:
+            # Redirects, HTML error pages etc. never reached the scan view; the numbers would be meaningless
+            raise CommandError(f'Got responses that are not scan replies: {unparsed}')
+
+        report = {
+            'mode': 'http' if options['url'] else 'test_client',
+            'url': options['url'],
+            'profile': options['profile'],
+            'date': day,
+            'classes': options['classes'],
+            'students': options['classes'] * options['students'],
+            'devices': options['devices'],
+            'speed': options['speed'],
+            'seed': options['seed'],
+            'scans': len(scans),
+            **run,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def seed(self, options):
+        """Create the benchmark roster; returns the academic year if one had to be created"""
+        self.cleanup(None)
+
+        academic_year = AcademicYear.objects.filter(academic_year_active_status=True).first()
+        created_year = None
+        if academic_year is None:
+            academic_year = created_year = AcademicYear.objects.create(
+                academic_start_year='BENCH', academic_end_year='BENCH'
+            )
+            invalidate_academic_year()
+
+        classes = Class.objects.bulk_create([
+            Class(class_name=f'{CLASS_PREFIX}{i:03d}', grade_level=6 + i % 4, academic_year=academic_year)
+            for i in range(options['classes'])
+        ])
+        Students.objects.bulk_create([
+            Students(
+                student_card_uid=f'{CARD_PREFIX}{c * options["students"] + s:06d}',
+                student_full_name=f'Học sinh {c:03d}-{s:02d}',
+                student_class=student_class,
+                to_number=s % 4 + 1,
+                seat_number=s // 4 + 1,
+            )
+            for c, student_class in enumerate(classes)
+            for s in range(options['students'])
+        ], batch_size=500)
+
+        # bulk_create skips the post_save signals
+        invalidate_roster()
+        return created_year
+
+    def cleanup(self, created_year):
+        flush_scan_events()
+        ScanEvent.objects.filter(card_uid__startswith=CARD_PREFIX).delete()
+        Students.objects.filter(student_card_uid__startswith=CARD_PREFIX).delete()
+        Class.objects.filter(class_name__startswith=CLASS_PREFIX).delete()
+        if created_year is not None:
+            created_year.delete()
+            invalidate_academic_year()
+        invalidate_roster()
+
+    def arrival_curve(self, rng, day, options):
+        """One tap per student (plus some double taps), spread over a triangular rush, in arrival order"""
+        base = datetime.strptime(day, '%Y-%m-%d')
+        start, peak, end = (
+            (datetime.strptime(options[key], '%H:%M') - datetime.strptime('00:00', '%H:%M')).total_seconds()
+            for key in ('rush_start', 'rush_peak', 'rush_end')
+        )
+        if not start <= peak <= end:
+            raise CommandError('Expected --rush-start <= --rush-peak <= --rush-end')
+
+        scans = []
+        total = options['classes'] * options['students']
+        for n in range(total):
+            card_uid = f'{CARD_PREFIX}{n:06d}'
+            device_id = f'ESP32_GATE_{rng.randrange(options["devices"]) + 1:03d}'
+            offset = rng.triangular(start, end, peak)
+            scans.append((offset, card_uid, device_id))
+            if rng.random() < options['double_tap']:
+                scans.append((offset + rng.uniform(1, 20), card_uid, device_id))
+        scans.sort()
+
+        return [
+            {
+                'offset': offset - scans[0][0],
+                'device_id': device_id,
+                'body': {
+                    'card_uid': card_uid,
+                    'device_id': device_id,
+                    'timestamp': (base + timedelta(seconds=offset)).strftime('%Y-%m-%d %H:%M:%S'),
+                },
+            }
+            for offset, card_uid, device_id in scans
+        ]
+
+    def pace(self, scan, started, speed):
+        if speed > 0:
+            delay = scan['offset'] / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    def run_client(self, scans, options):
+        """Replay in-process through the scan view, counting the queries each scan runs"""
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'testserver')
+        client = Client(HTTP_HOST=host)
+        headers = {'X-Scan-Profile': 'compact'} if options['profile'] == 'compact' else {}
+
+        samples, queries, outcomes, errors = [], [], Counter(), 0
+        started = time.perf_counter()
+        for scan in scans:
+            self.pace(scan, started, options['speed'])
+            sent = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                # Over https, or SECURE_SSL_REDIRECT answers every scan with a 301
+                response = client.post(
+                    '/api/attendance-scan/', json.dumps(scan['body']),
+                    content_type='application/json', headers=headers, secure=True
+                )
+            samples.append((time.perf_counter() - sent) * 1000)
+            queries.append(len(captured.captured_queries))
+            outcomes[scan_outcome(response.status_code, response.content)] += 1
+            if response.status_code >= 500:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+        return {
+            'latency': latency_summary(samples, elapsed, errors),
+            'queries_per_scan': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'max': max(queries) if queries else None,
+                'total': sum(queries),
+            },
+            'outcomes': dict(outcomes),
+        }
+
+    def run_http(self, scans, options):
+        """One keep-alive connection per simulated reader, each replaying its own taps in order"""
+        parts = urlsplit(options['url'])
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        headers = {'Content-Type': 'application/json'}
+        if options['profile'] == 'compact':
+            headers['X-Scan-Profile'] = 'compact'
+
+        by_device = defaultdict(list)
+        for scan in scans:
+            by_device[scan['device_id']].append(scan)
+
+        def reader(device_scans):
+            samples, outcomes, errors = [], Counter(), 0
+            conn = connection_class(parts.netloc, timeout=30)
+            for scan in device_scans:
+                self.pace(scan, started, options['speed'])
+                sent = time.perf_counter()
+                try:
+                    conn.request('POST', parts.path, json.dumps(scan['body']), headers)
+                    response = conn.getresponse()
+                    content = response.read()
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    outcomes['connection_error'] += 1
+                    conn.close()
+                    conn = connection_class(parts.netloc, timeout=30)
+                    continue
+                samples.append((time.perf_counter() - sent) * 1000)
+                outcomes[scan_outcome(response.status, content)] += 1
+                if response.status >= 500:
+                    errors += 1
+            conn.close()
+            return samples, outcomes, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(by_device)) as pool:
+            results = list(pool.map(reader, by_device.values()))
+        elapsed = time.perf_counter() - started
+
+        outcomes = Counter()
+        for _, device_outcomes, _ in results:
+            outcomes.update(device_outcomes)
+        return {
+            'latency': latency_summary(
+                [sample for samples, _, _ in results for sample in samples],
+                elapsed,
+                sum(errors for _, _, errors in results)
+            ),
+            # Queries run in the server process and can't be counted from here
+            'queries_per_scan': None,
+            'outcomes': dict(outcomes),
+        }
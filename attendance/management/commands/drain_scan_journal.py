@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from attendance.scan_journal import get_journal, drain_journal, purge_journal
+import time
+
+
+class Command(BaseCommand):
+    help = 'Apply journaled fast-ack gate scans to Attendance (replays anything left pending)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is pending and exit')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the journal is empty')
+        parser.add_argument('--purge-days', type=int, help='Delete applied entries older than this many days, then exit')
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            removed = purge_journal(options['purge_days'])
+            self.stdout.write(self.style.SUCCESS(f'Purged {removed} applied journal entries'))
+            return
+
+        journal = get_journal()
+        self.stdout.write(f'Pending journal entries: {journal.pending_count()}')
+        dead = journal.dead_letter_count()
+        if dead:
+            self.stderr.write(self.style.WARNING(f'Dead-lettered journal entries (not drained): {dead}'))
+
+        total = 0
+        while True:
+            try:
+                applied = drain_journal(options['batch_size'])
+            finally:
+                close_old_connections()
+            total += applied
+
+            if applied:
+                self.stdout.write(f'Applied {applied} scans')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done - applied {total} scans'))
@@ -0,0 +1,105 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from attendance import gate_protocol
+from attendance.models import Device
+from attendance.scan_profiles import STATUS_CODES
+from attendance.utils.bench import latency_summary
+from datetime import datetime
+import calendar
+import json
+import socket
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Emulate a gate reader against run_gate_listener: send binary scan frames for the given '
+        'cards over TCP or UDP and print the decoded LCD replies, then a latency summary.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('cards', nargs='+', help='Card UIDs as hex, e.g. A1B2C3D4')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=getattr(settings, 'GATE_LISTENER_PORT', 9750))
+        parser.add_argument('--udp', action='store_true', help='Send datagrams instead of a TCP stream')
+        parser.add_argument('--device', default='ESP32_GATE_001')
+        parser.add_argument('--secret',
+                            help="Signing secret; defaults to the device's secret when it is registered")
+        parser.add_argument('--unsigned', action='store_true', help='Send unsigned frames')
+        parser.add_argument('--timestamp', help='Reader clock as YYYY-MM-DD HH:MM:SS, defaults to now')
+        parser.add_argument('--repeat', type=int, default=1, help='Send each card this many times')
+        parser.add_argument('--resend', action='store_true',
+                            help='Send every frame twice, as a reader does after a lost reply')
+        parser.add_argument('--timeout', type=float, default=2.0, help='Seconds to wait for a reply')
+
+    def handle(self, *args, **options):
+        secret = None
+        if not options['unsigned']:
+            secret = options['secret']
+            if secret is None:
+                secret = Device.objects.filter(device_id=options['device'], is_active=True).values_list(
+                    'secret', flat=True
+                ).first()
+
+        if options['timestamp']:
+            try:
+                rtc = calendar.timegm(datetime.strptime(options['timestamp'], '%Y-%m-%d %H:%M:%S').timetuple())
+            except ValueError:
+                raise CommandError('--timestamp must be YYYY-MM-DD HH:MM:SS')
+        else:
+            rtc = None
+
+        if options['udp']:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.settimeout(options['timeout'])
+            sock.connect((options['host'], options['port']))
+        else:
+            try:
+                sock = socket.create_connection((options['host'], options['port']), timeout=options['timeout'])
+            except OSError as e:
+                raise CommandError(f"Cannot connect to {options['host']}:{options['port']}: {e}")
+
+        codes = {code: name for name, code in STATUS_CODES.items()}
+        samples, errors, sequence = [], 0, 0
+        started = time.perf_counter()
+        try:
+            for _ in range(options['repeat']):
+                for card_uid in options['cards']:
+                    sequence += 1
+                    frame = gate_protocol.encode_scan(
+                        options['device'], card_uid, rtc if rtc is not None else gate_protocol.local_rtc(),
+                        sequence, secret
+                    )
+                    for _ in range(2 if options['resend'] else 1):
+                        sent = time.perf_counter()
+                        try:
+                            reply = self.exchange(sock, frame, options['udp'])
+                        except OSError as e:
+                            errors += 1
+                            self.stdout.write(self.style.ERROR(f'#{sequence} {card_uid}: {e}'))
+                            continue
+                        elapsed_ms = (time.perf_counter() - sent) * 1000
+                        samples.append(elapsed_ms)
+                        answer = gate_protocol.decode_reply(reply)
+                        flags = ''.join(f' [{flag}]' for flag in ('late', 'queued') if answer[flag])
+                        self.stdout.write(
+                            f"#{answer['sequence']} {card_uid}: {codes.get(answer['status'], answer['status'])}{flags} "
+                            f"| {answer['lcd'][0]:<16} | {answer['lcd'][1]:<16} | {elapsed_ms:.1f} ms"
+                        )
+        finally:
+            sock.close()
+
+        self.stdout.write(json.dumps(latency_summary(samples, time.perf_counter() - started, errors), indent=2))
+
+    def exchange(self, sock, frame, udp):
+        if udp:
+            sock.send(frame)
+            return sock.recv(gate_protocol.REPLY.size)
+        sock.sendall(frame)
+        reply = b''
+        while len(reply) < gate_protocol.REPLY.size:
+            chunk = sock.recv(gate_protocol.REPLY.size - len(reply))
+            if not chunk:
+                raise ConnectionError('Listener closed the connection')
+            reply += chunk
+        return reply
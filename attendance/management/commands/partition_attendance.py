@@ -0,0 +1,245 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.utils import timezone
+from attendance.models import Attendance, AttendancePeriod
+from datetime import date, datetime
+import re
+
+
+# Table -> partition key. Both are filtered by date on every dashboard query.
+PARTITIONED = [
+    (Attendance._meta.db_table, 'check_in_date'),
+    (AttendancePeriod._meta.db_table, 'period_date'),
+]
+
+UPPER_BOUND = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+class Command(BaseCommand):
+    help = (
+        'PostgreSQL range partitioning for attendance and attendance_periods. '
+        '--convert turns the existing tables into partitioned ones (one transaction, take a backup first); '
+        'without it, partitions for the coming months/years are pre-created. '
+        '--detach-before detaches old partitions so they can be archived or dropped. '
+        'PostgreSQL cannot keep foreign keys that point at a converted table (its primary key '
+        'gains the partition key), so --convert refuses to run while other tables reference it '
+        'unless --drop-foreign-keys is given; the dropped constraints are printed so they can '
+        'be restored if the tables are ever converted back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert the current tables to partitioned tables, copying all rows')
+        parser.add_argument('--interval', choices=['month', 'year'],
+                            default=getattr(settings, 'ATTENDANCE_PARTITION_INTERVAL', 'month'),
+                            help='One partition per calendar month or per academic year')
+        parser.add_argument('--ahead', type=int,
+                            help='Future partitions to keep ready (default 3 months or 1 academic year)')
+        parser.add_argument('--detach-before', help='Detach partitions that end on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--drop-foreign-keys', action='store_true',
+                            help='With --convert, drop foreign keys from other tables that reference the converted ones')
+        parser.add_argument('--dry-run', action='store_true', help='Print the DDL and roll everything back')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning needs PostgreSQL; this database is %s' % connection.vendor)
+
+        self.dry_run = options['dry_run']
+        self.drop_foreign_keys = options['drop_foreign_keys']
+        self.interval = options['interval']
+        ahead = options['ahead'] if options['ahead'] is not None else (3 if self.interval == 'month' else 1)
+        detach_before = None
+        if options['detach_before']:
+            try:
+                detach_before = datetime.strptime(options['detach_before'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--detach-before must be YYYY-MM-DD')
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self.cursor = cursor
+                for table, column in PARTITIONED:
+                    if options['convert']:
+                        if self.is_partitioned(table):
+                            self.stdout.write(f'{table} is already partitioned')
+                        else:
+                            self.convert(table, column)
+                    elif not self.is_partitioned(table):
+                        self.stdout.write(self.style.WARNING(f'{table} is not partitioned - run with --convert first'))
+                        continue
+
+                    self.create_partitions(table, column, timezone.localdate(), ahead)
+                    if detach_before:
+                        self.detach(table, detach_before)
+
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+    # Period arithmetic
+
+    def period_start(self, day):
+        if self.interval == 'month':
+            return date(day.year, day.month, 1)
+        start_month = getattr(settings, 'ACADEMIC_YEAR_START_MONTH', 8)
+        year = day.year if day.month >= start_month else day.year - 1
+        return date(year, start_month, 1)
+
+    def next_start(self, start):
+        if self.interval == 'month':
+            return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return date(start.year + 1, start.month, 1)
+
+    def partition_name(self, table, start):
+        if self.interval == 'month':
+            return f'{table}_p{start:%Y_%m}'
+        return f'{table}_y{start.year}_{start.year + 1}'
+
+    # SQL helpers
+
+    def q(self, name):
+        return connection.ops.quote_name(name)
+
+    def run(self, sql, params=None):
+        self.stdout.write(sql + ';' if not params else f'{sql}; -- {params}')
+        self.cursor.execute(sql, params)
+
+    def try_run(self, sql, warning):
+        """Run a statement that PostgreSQL may refuse on a partitioned table; warn instead of failing"""
+        try:
+            with transaction.atomic():
+                self.run(sql)
+        except DatabaseError as e:
+            self.stdout.write(self.style.WARNING(f'{warning}: {e}'.strip()))
+
+    def is_partitioned(self, table):
+        self.cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table]
+        )
+        return self.cursor.fetchone() is not None
+
+    def partitions(self, table):
+        """(name, upper bound or None for the default partition)"""
+        self.cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [table])
+        result = []
+        for name, bound in self.cursor.fetchall():
+            match = UPPER_BOUND.search(bound or '')
+            result.append((name, date.fromisoformat(match.group(1)) if match else None))
+        return result
+
+    # Steps
+
+    def convert(self, table, column):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Converting {table} (partitioned by {column}, {self.interval})'))
+        self.run(f'LOCK TABLE {self.q(table)} IN ACCESS EXCLUSIVE MODE')
+
+        self.cursor.execute("""
+            SELECT conname, conrelid::regclass::text, pg_get_constraintdef(oid)
+            FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = 'f'
+            ORDER BY conrelid::regclass::text, conname
+        """, [table])
+        incoming = self.cursor.fetchall()
+        if incoming and not self.drop_foreign_keys:
+            raise CommandError(
+                f'{table} is referenced by foreign keys that cannot survive the conversion: '
+                + ', '.join(f'{name} on {referencing}' for name, referencing, _ in incoming)
+                + '. Rerun with --drop-foreign-keys to drop them (Django still cascades deletes itself).'
+            )
+
+        # Everything attached to the old table has to be recreated on the new parent
+        self.cursor.execute("""
+            SELECT conname, contype, pg_get_constraintdef(oid)
+            FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f', 'c')
+            ORDER BY contype = 'f', conname
+        """, [table])
+        constraints = self.cursor.fetchall()
+        self.cursor.execute("""
+            SELECT pg_get_indexdef(x.indexrelid)
+            FROM pg_index x
+            WHERE x.indrelid = to_regclass(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+        """, [table])
+        indexes = [row[0] for row in self.cursor.fetchall()]
+        self.cursor.execute(f'SELECT MIN({self.q(column)}), MAX({self.q(column)}) FROM {self.q(table)}')
+        first_day, last_day = self.cursor.fetchone()
+
+        staging = f'{table}__partitioned'
+        self.run(
+            f'CREATE TABLE {self.q(staging)} (LIKE {self.q(table)} INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE ({self.q(column)})'
+        )
+        # Partitions for the existing rows; the current and future ones are added afterwards
+        if first_day:
+            start = self.period_start(first_day)
+            while start <= last_day:
+                self.create_partition(staging, column, start, partition_table=table)
+                start = self.next_start(start)
+        self.run(f'CREATE TABLE {self.q(table + "_default")} PARTITION OF {self.q(staging)} DEFAULT')
+
+        self.run(f'INSERT INTO {self.q(staging)} SELECT * FROM {self.q(table)}')
+        for name, referencing, _ in incoming:
+            self.run(f'ALTER TABLE {referencing} DROP CONSTRAINT {self.q(name)}')
+        # No CASCADE: anything else still depending on the table (a view, say) stops the conversion
+        self.run(f'DROP TABLE {self.q(table)}')
+        self.run(f'ALTER TABLE {self.q(staging)} RENAME TO {self.q(table)}')
+
+        for name, kind, definition in constraints:
+            if kind == 'p' and column not in definition:
+                # Unique keys on a partitioned table must include the partition key
+                definition = definition.replace(')', f', {self.q(column)})', 1)
+            self.try_run(
+                f'ALTER TABLE {self.q(table)} ADD CONSTRAINT {self.q(name)} {definition}',
+                f'Could not recreate constraint {name} on {table}'
+            )
+        for definition in indexes:
+            self.try_run(definition, f'Could not recreate index on {table}')
+        for name, referencing, definition in incoming:
+            self.stdout.write(self.style.WARNING(
+                f'Dropped foreign key {name} from {referencing}: PostgreSQL cannot reference a '
+                f'partitioned table without the partition key (Django still cascades deletes itself). '
+                f'To restore it on an unpartitioned table: '
+                f'ALTER TABLE {referencing} ADD CONSTRAINT {self.q(name)} {definition};'
+            ))
+
+    def create_partitions(self, table, column, today, ahead, partition_table=None):
+        """Partitions for the period containing `today` and the next `ahead` periods"""
+        start = self.period_start(today)
+        for _ in range(ahead + 1):
+            self.create_partition(table, column, start, partition_table)
+            start = self.next_start(start)
+
+    def create_partition(self, table, column, start, partition_table=None):
+        name = self.partition_name(partition_table or table, start)
+        end = self.next_start(start)
+        self.cursor.execute('SELECT to_regclass(%s)', [name])
+        if self.cursor.fetchone()[0] is not None:
+            return
+
+        default = f'{partition_table or table}_default'
+        self.cursor.execute('SELECT to_regclass(%s)', [default])
+        has_default = self.cursor.fetchone()[0] is not None
+        bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+
+        if not has_default:
+            self.run(f'CREATE TABLE {self.q(name)} PARTITION OF {self.q(table)} FOR VALUES {bounds}')
+            return
+
+        # Rows that landed in the default partition move into the new one before it is attached
+        self.run(f'CREATE TABLE {self.q(name)} (LIKE {self.q(table)} INCLUDING DEFAULTS)')
+        self.run(
+            f'WITH moved AS (DELETE FROM {self.q(default)} '
+            f'WHERE {self.q(column)} >= %s AND {self.q(column)} < %s RETURNING *) '
+            f'INSERT INTO {self.q(name)} SELECT * FROM moved',
+            [start, end]
+        )
+        self.run(f'ALTER TABLE {self.q(table)} ATTACH PARTITION {self.q(name)} FOR VALUES {bounds}')
+
+    def detach(self, table, before):
+        for name, upper in sorted(self.partitions(table), key=lambda p: p[1] or date.max):
+            if upper is not None and upper <= before:
+                self.run(f'ALTER TABLE {self.q(table)} DETACH PARTITION {self.q(name)}')
+                self.stdout.write(f'Detached {name}; archive or DROP it when no longer needed')
@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from attendance.models import AcademicYear, Attendance, Class, Students, generate_uuid7
+from attendance.utils.academic_year import get_active_academic_year
+from attendance.utils.class_stats import prepare_class_days
+from datetime import datetime
+
+
+class Command(BaseCommand):
+    help = (
+        "Create today's 'no_scan' Attendance row for every active student, and every class's "
+        'ClassDailyStats row, before the gates open, so the morning rush only updates existing '
+        'rows. Safe to re-run: students and classes that already have a row for the day are left '
+        'alone. Run it from cron, e.g. '
+        '"30 5 * * 1-6 manage.py prepare_day".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to prepare (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per INSERT')
+        parser.add_argument('--force', action='store_true', help='Also prepare a Sunday')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD')
+        else:
+            day = timezone.localdate()
+
+        if day.isoweekday() == 7 and not options['force']:
+            self.stdout.write(f'{day} is a Sunday - nothing to prepare (use --force to override)')
+            return
+
+        try:
+            academic_year = get_active_academic_year()
+        except AcademicYear.DoesNotExist:
+            raise CommandError('No active academic year')
+
+        chunk_size = max(1, options['chunk_size'])
+        existing = Attendance.objects.filter(check_in_date=day).count()
+        # Only students placed in a class of the active year; others get no roll for it
+        student_ids = Students.objects.filter(
+            student_active_status=True,
+            student_class__academic_year=academic_year,
+        ).order_by().values_list('student_id', flat=True)
+
+        students = 0
+        chunk = []
+        for student_id in student_ids.iterator(chunk_size=chunk_size):
+            students += 1
+            chunk.append(Attendance(
+                attendance_id=generate_uuid7(),
+                student_id=student_id,
+                academic_year=academic_year,
+                check_in_date=day,
+                status='no_scan',
+                is_verified_by_teacher=False,
+            ))
+            if len(chunk) >= chunk_size:
+                self.insert(chunk)
+                chunk = []
+        if chunk:
+            self.insert(chunk)
+
+        created = Attendance.objects.filter(check_in_date=day).count() - existing
+        class_ids = list(Class.objects.filter(academic_year=academic_year).values_list('class_id', flat=True))
+        class_rows = prepare_class_days(class_ids, day)
+        self.stdout.write(self.style.SUCCESS(
+            f'Prepared {day}: {created} rows created for {students} active students '
+            f'({existing} rows already existed), {class_rows} class counter rows created'
+        ))
+
+    def insert(self, rows):
+        # A scan or a teacher may have got there first; their row wins
+        Attendance.objects.bulk_create(rows, ignore_conflicts=True)
@@ -0,0 +1,179 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from attendance.models import Attendance, Class, ClassDailyStats, ScanEvent, Students, generate_uuid7
+from attendance.scan_events import dropped_scan_events
+from attendance.scan_service import project_day, PROJECTED_FIELDS
+from attendance.utils.excuse_index import excuse_for_day
+from attendance.utils.class_stats import reconcile_day
+from attendance.utils.dashboard_stats import attendance_changed
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-derive Attendance from the scan event log for a date range, using the current '
+        'scan windows. Rows verified by a teacher and excused days are left alone, and so '
+        'are days the log is known to have dropped taps for and rows holding a scan time '
+        'the log has no tap for.'
+    )
+
+    # Scan times on a row; each must match a logged tap before the row may be rebuilt
+    SCAN_TIME_FIELDS = ['check_in_time', 'morning_gate_scan_time', 'afternoon_gate_scan_time']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', required=True, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', required=True, help='Last day (YYYY-MM-DD), inclusive')
+        parser.add_argument('--chunk-days', type=int, default=7, help='Days rebuilt per chunk')
+        parser.add_argument('--workers', type=int,
+                            help='Chunks rebuilt in parallel (default 4, 1 on SQLite)')
+        parser.add_argument('--include-verified', action='store_true',
+                            help='Also overwrite rows a teacher has verified')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without writing')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = datetime.strptime(options['date_from'], '%Y-%m-%d').date()
+            date_to = datetime.strptime(options['date_to'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--from and --to must be YYYY-MM-DD')
+        if date_from > date_to:
+            raise CommandError('--from must not be after --to')
+
+        chunk_days = max(1, options['chunk_days'])
+        chunks = []
+        start = date_from
+        while start <= date_to:
+            end = min(start + timedelta(days=chunk_days - 1), date_to)
+            chunks.append((start, end))
+            start = end + timedelta(days=1)
+
+        workers = options['workers'] or (1 if connection.vendor == 'sqlite' else 4)
+        totals = Counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (start, end), counts in zip(chunks, pool.map(lambda chunk: self.rebuild_chunk(*chunk, options), chunks)):
+                totals.update(counts)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{start} .. {end}: {dict(counts)}')
+
+        if not options['dry_run']:
+            totals['class_stats'] = self.reconcile_class_stats(date_from, date_to)
+
+        prefix = 'Would rebuild' if options['dry_run'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {date_from} .. {date_to} in {len(chunks)} chunks: "
+            f"{totals['events']} events, {totals['projected']} rows written, {totals['cleared']} cleared, "
+            f"{totals['verified']} verified and {totals['excused']} excused days skipped, "
+            f"{totals['lossy']} on days with dropped events and {totals['unlogged']} rows with unlogged scans kept, "
+            f"{totals['class_stats']} class counter rows repaired"
+        ))
+
+    def reconcile_class_stats(self, date_from, date_to):
+        """The counters of the rebuilt days no longer match Attendance; recount the rows that exist"""
+        days = ClassDailyStats.objects.filter(stats_date__range=(date_from, date_to)).values_list('stats_date', flat=True)
+        class_ids = list(Class.objects.values_list('class_id', flat=True))
+        repaired = 0
+        for day in sorted(set(days)):
+            repaired += reconcile_day(class_ids, day, create=False)[1]
+        if repaired:
+            for class_id in class_ids:
+                attendance_changed(class_id)
+        return repaired
+
+    def rebuild_chunk(self, start, end, options):
+        # Each worker thread has its own connection
+        close_old_connections()
+        try:
+            return self._rebuild_chunk(start, end, options)
+        finally:
+            close_old_connections()
+
+    def _rebuild_chunk(self, start, end, options):
+        counts = Counter()
+        days = defaultdict(list)
+        academic_years = {}
+        for student_id, scan_date, academic_year_id, scanned_at, card_uid, device_id in (
+            ScanEvent.objects.filter(
+                scan_date__range=(start, end),
+                student__isnull=False,
+                academic_year__isnull=False,
+            ).order_by('scanned_at', 'event_id').values_list(
+                'student_id', 'scan_date', 'academic_year_id', 'scanned_at', 'card_uid', 'device_id'
+            ).iterator(chunk_size=2000)
+        ):
+            days[student_id, scan_date].append((scanned_at, card_uid, device_id))
+            academic_years.setdefault((student_id, scan_date), academic_year_id)
+            counts['events'] += 1
+        if not days:
+            return counts
+
+        grades = dict(
+            Students.objects.filter(student_id__in={student_id for student_id, _ in days})
+            .values_list('student_id', 'student_class__grade_level')
+        )
+        existing = {
+            (student_id, check_in_date): (verified, [value for value in scan_times if value is not None])
+            for student_id, check_in_date, verified, *scan_times in Attendance.objects.filter(
+                check_in_date__range=(start, end)
+            ).values_list('student_id', 'check_in_date', 'is_verified_by_teacher', *self.SCAN_TIME_FIELDS)
+        }
+        # The log drops taps in long outages (see scan_events.py); a rebuild there would lose scans
+        lossy = dropped_scan_events(sorted({scan_date for _, scan_date in days}))
+
+        now = timezone.now()
+        rows, cleared = [], []
+        for (student_id, scan_date), taps in days.items():
+            if scan_date in lossy:
+                counts['lossy'] += 1
+                continue
+            verified, scan_times = existing.get((student_id, scan_date), (False, []))
+            if verified and not options['include_verified']:
+                counts['verified'] += 1
+                continue
+            logged = {scanned_at for scanned_at, _, _ in taps}
+            if any(scan_time not in logged for scan_time in scan_times):
+                # The row holds a scan the log never got; rebuilding would downgrade it
+                counts['unlogged'] += 1
+                continue
+            if excuse_for_day(student_id, scan_date):
+                # Excused taps never write Attendance
+                counts['excused'] += 1
+                continue
+            fields = project_day(taps, grades.get(student_id))
+            if fields is None:
+                cleared.append((student_id, scan_date))
+                continue
+            rows.append(Attendance(
+                attendance_id=generate_uuid7(),
+                student_id=student_id,
+                academic_year_id=academic_years[student_id, scan_date],
+                check_in_date=scan_date,
+                is_verified_by_teacher=False,
+                created_at=now,
+                updated_at=now,
+                **fields
+            ))
+        counts['projected'] = len(rows)
+
+        if options['dry_run']:
+            counts['cleared'] = len(cleared)
+            return counts
+
+        with transaction.atomic():
+            Attendance.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['student', 'check_in_date'],
+                update_fields=PROJECTED_FIELDS + ['updated_at'],
+                batch_size=500,
+            )
+            # No tap falls in a window any more: keep the row (period records point at it) but empty it
+            empty = dict.fromkeys(PROJECTED_FIELDS, None)
+            empty.update(status='no_scan', updated_at=now)
+            for student_id, scan_date in cleared:
+                counts['cleared'] += Attendance.objects.filter(
+                    student_id=student_id, check_in_date=scan_date
+                ).update(**empty)
+        return counts
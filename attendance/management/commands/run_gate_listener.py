@@ -0,0 +1,117 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections
+from attendance import gate_protocol
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import signal
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve gate readers over the binary frame protocol (attendance/gate_protocol.py) on TCP '
+        'and/or UDP. Scans run the same logic as the HTTP scan endpoint, on a small thread pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--port', type=int, default=getattr(settings, 'GATE_LISTENER_PORT', 9750))
+        parser.add_argument('--no-tcp', action='store_true', help='Only listen on UDP')
+        parser.add_argument('--no-udp', action='store_true', help='Only listen on TCP')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Threads running scans (each holds one database connection)')
+        parser.add_argument('--idle-timeout', type=float, default=300,
+                            help='Close TCP connections idle for this many seconds')
+
+    def handle(self, *args, **options):
+        self.executor = ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='gate-scan')
+        try:
+            asyncio.run(self.serve(options))
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def answer(self, frame):
+        # Worker threads outlive requests, so tidy their connections like the request signals would
+        close_old_connections()
+        try:
+            return gate_protocol.handle_frame(frame)
+        finally:
+            close_old_connections()
+
+    async def serve(self, options):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:  # Windows
+                pass
+
+        servers = []
+        if not options['no_tcp']:
+            tcp = await asyncio.start_server(
+                lambda reader, writer: self.serve_tcp(reader, writer, options['idle_timeout']),
+                options['host'], options['port']
+            )
+            servers.append(tcp)
+            self.stdout.write(f"Gate listener on tcp://{options['host']}:{options['port']}")
+        if not options['no_udp']:
+            udp, _ = await loop.create_datagram_endpoint(
+                lambda: GateDatagramProtocol(self), local_addr=(options['host'], options['port'])
+            )
+            self.stdout.write(f"Gate listener on udp://{options['host']}:{options['port']}")
+
+        await stop.wait()
+        self.stdout.write('Stopping gate listener')
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        if not options['no_udp']:
+            udp.close()
+
+    async def serve_tcp(self, reader, writer, idle_timeout):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                header = await asyncio.wait_for(reader.readexactly(gate_protocol.HEADER_SIZE), idle_timeout)
+                try:
+                    size = gate_protocol.frame_size(header)
+                except gate_protocol.FrameError:
+                    # Lost framing on a stream can't be recovered; answer once and hang up
+                    writer.write(await loop.run_in_executor(self.executor, self.answer, header))
+                    await writer.drain()
+                    break
+                frame = header + await asyncio.wait_for(reader.readexactly(size - len(header)), idle_timeout)
+                writer.write(await loop.run_in_executor(self.executor, self.answer, frame))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class GateDatagramProtocol(asyncio.DatagramProtocol):
+    """One scan frame per datagram, answered to the sender"""
+
+    def __init__(self, command):
+        self.command = command
+        self.pending = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        task = asyncio.ensure_future(self.reply(data, addr))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def reply(self, data, addr):
+        loop = asyncio.get_running_loop()
+        try:
+            self.transport.sendto(await loop.run_in_executor(self.command.executor, self.command.answer, data), addr)
+        except Exception:
+            logger.exception('Answering gate frame from %s failed', addr)
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:12
+
+from django.db import migrations
+from django.db.models import Count
+
+
+SCAN_FIELDS = [
+    "check_in_time",
+    "scanned_card_uid",
+    "morning_gate_scan_time",
+    "morning_scanned_card_uid",
+    "afternoon_gate_scan_time",
+    "afternoon_scanned_card_uid",
+]
+
+
+def merge_duplicate_attendance(apps, schema_editor):
+    """Fold duplicate (student, check_in_date) rows into the oldest one before adding the constraint"""
+    Attendance = apps.get_model("attendance", "Attendance")
+    AttendancePeriod = apps.get_model("attendance", "AttendancePeriod")
+
+    duplicates = (
+        Attendance.objects.values("student_id", "check_in_date")
+        .annotate(row_count=Count("attendance_id"))
+        .filter(row_count__gt=1)
+    )
+
+    for duplicate in duplicates:
+        rows = list(
+            Attendance.objects.filter(
+                student_id=duplicate["student_id"],
+                check_in_date=duplicate["check_in_date"],
+            ).order_by("created_at")
+        )
+        keep, extras = rows[0], rows[1:]
+
+        for extra in extras:
+            for field in SCAN_FIELDS:
+                if getattr(keep, field) is None and getattr(extra, field) is not None:
+                    setattr(keep, field, getattr(extra, field))
+            if keep.status == "no_scan":
+                keep.status = extra.status
+            keep.is_verified_by_teacher = keep.is_verified_by_teacher or extra.is_verified_by_teacher
+            keep.notes = keep.notes or extra.notes
+        keep.save()
+
+        AttendancePeriod.objects.filter(attendance__in=extras).update(attendance=keep)
+        Attendance.objects.filter(attendance_id__in=[extra.attendance_id for extra in extras]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0016_alter_attendanceperiod_attendance"),
+    ]
+
+    operations = [
+        # The unique constraint comes in 0018: PostgreSQL can't alter a table with
+        # pending trigger events left by the deletes in the same transaction
+        migrations.RunPython(merge_duplicate_attendance, reverse_code=migrations.RunPython.noop),
+    ]
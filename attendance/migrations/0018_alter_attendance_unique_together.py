@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("attendance", "0017_merge_duplicate_attendance"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="attendance",
+            unique_together={("student", "check_in_date")},
+        ),
+    ]
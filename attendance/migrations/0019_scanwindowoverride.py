@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:21
+
+import attendance.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0018_alter_attendance_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanWindowOverride',
+            fields=[
+                ('override_id', attendance.models.UUIDv7Field(default=attendance.models.generate_uuid7, editable=False, primary_key=True, serialize=False)),
+                ('day_of_week', models.IntegerField(blank=True, choices=[(1, 'Thứ Hai'), (2, 'Thứ Ba'), (3, 'Thứ Tư'), (4, 'Thứ Năm'), (5, 'Thứ Sáu'), (6, 'Thứ Bảy')], help_text='Empty = every day', null=True)),
+                ('grade_level', models.IntegerField(blank=True, help_text='Empty = every grade', null=True)),
+                ('morning_start', models.TimeField(blank=True, null=True)),
+                ('morning_end', models.TimeField(blank=True, null=True)),
+                ('late_cutoff', models.TimeField(blank=True, null=True)),
+                ('afternoon_start', models.TimeField(blank=True, null=True)),
+                ('afternoon_end', models.TimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'scan_window_overrides',
+                'ordering': ['day_of_week', 'grade_level'],
+                'unique_together': {('day_of_week', 'grade_level')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:25
+
+import attendance.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0019_scanwindowoverride'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanEvent',
+            fields=[
+                ('event_id', attendance.models.UUIDv7Field(default=attendance.models.generate_uuid7, editable=False, primary_key=True, serialize=False)),
+                ('card_uid', models.CharField(blank=True, max_length=32)),
+                ('device_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('scanned_at', models.DateTimeField()),
+                ('scan_date', models.DateField()),
+                ('session', models.CharField(blank=True, max_length=10, null=True)),
+                ('outcome', models.CharField(choices=[('recorded', 'Đã ghi nhận'), ('duplicate', 'Quét trùng'), ('no_morning_scan', 'Chưa quét buổi sáng'), ('outside_window', 'Ngoài giờ quét thẻ'), ('excused', 'Có phép'), ('unknown_card', 'Thẻ không hợp lệ'), ('missing_card', 'Không có thẻ'), ('no_academic_year', 'Không có năm học')], max_length=20)),
+                ('received_at', models.DateTimeField()),
+                ('academic_year', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='scan_events', to='attendance.academicyear')),
+                ('student', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='scan_events', to='attendance.students')),
+            ],
+            options={
+                'db_table': 'scan_events',
+                'ordering': ['scanned_at'],
+                'indexes': [models.Index(fields=['scan_date', 'student'], name='scan_events_scan_da_dfdb06_idx'), models.Index(fields=['card_uid'], name='scan_events_card_ui_f080ce_idx'), models.Index(fields=['received_at'], name='scan_events_receive_427315_idx')],
+            },
+        ),
+    ]
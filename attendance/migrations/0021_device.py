@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:28
+
+import attendance.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0020_scanevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Device',
+            fields=[
+                ('device_id', models.CharField(help_text='e.g. ESP32_GATE_001', max_length=50, primary_key=True, serialize=False)),
+                ('device_name', models.CharField(blank=True, help_text='Where the reader is mounted', max_length=100)),
+                ('secret', models.CharField(default=attendance.models.generate_device_secret, help_text="HMAC key flashed into the reader's firmware", max_length=64)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'devices',
+                'ordering': ['device_id'],
+            },
+        ),
+    ]
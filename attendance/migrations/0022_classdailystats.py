@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:40
+
+import attendance.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0021_device'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassDailyStats',
+            fields=[
+                ('class_stats_id', attendance.models.UUIDv7Field(default=attendance.models.generate_uuid7, editable=False, primary_key=True, serialize=False)),
+                ('stats_date', models.DateField()),
+                ('morning_scanned', models.IntegerField(default=0)),
+                ('afternoon_scanned', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('excused', models.IntegerField(default=0)),
+                ('total_active', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='attendance.class')),
+            ],
+            options={
+                'verbose_name': 'Class daily stats',
+                'verbose_name_plural': 'Class daily stats',
+                'db_table': 'class_daily_stats',
+                'ordering': ['-stats_date'],
+                'unique_together': {('class_obj', 'stats_date')},
+            },
+        ),
+    ]
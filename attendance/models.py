@@ -1,7 +1,9 @@
 from django.db import models
 import uuid_utils
 import uuid
+import secrets
 from django.core.validators import RegexValidator, FileExtensionValidator
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.contrib.auth.models import User
 
@@ -294,6 +296,73 @@ class ClassSchedule(models.Model):
 
 
 
+class ScanWindowOverride(models.Model):
+    """Gate scan hours that differ from the bell schedule for a weekday and/or grade"""
+    override_id = UUIDv7Field(primary_key=True, editable=False)
+    day_of_week = models.IntegerField(
+        choices=ClassSchedule.WEEKDAY_CHOICES, null=True, blank=True,
+        help_text="Empty = every day"
+    )
+    grade_level = models.IntegerField(null=True, blank=True, help_text="Empty = every grade")
+
+    # Only the filled-in times replace the ones derived from SchoolPeriod
+    morning_start = models.TimeField(null=True, blank=True)
+    morning_end = models.TimeField(null=True, blank=True)
+    late_cutoff = models.TimeField(null=True, blank=True)
+    afternoon_start = models.TimeField(null=True, blank=True)
+    afternoon_end = models.TimeField(null=True, blank=True)
+
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'scan_window_overrides'
+        unique_together = [['day_of_week', 'grade_level']]
+        ordering = ['day_of_week', 'grade_level']
+
+    def __str__(self):
+        day = self.get_day_of_week_display() if self.day_of_week else 'Mọi ngày'
+        grade = f"Khối {self.grade_level}" if self.grade_level else 'Mọi khối'
+        return f"{day} - {grade}"
+
+    def clean(self):
+        from .utils.scan_policy import ORDER_MESSAGE, WINDOW_FIELDS, misordered_scopes, windows_in_order
+
+        if not windows_in_order({field: getattr(self, field) for field in WINDOW_FIELDS}):
+            raise ValidationError(ORDER_MESSAGE)
+        if not self.is_active:
+            return
+        # The times left unset come from the bell schedule and broader overrides; the result must stay ordered too
+        scopes = misordered_scopes(self)
+        if scopes:
+            where = ', '.join(
+                f"weekday {day} grade {grade if grade is not None else 'any'}" for day, grade in scopes[:5]
+            )
+            raise ValidationError(f'{ORDER_MESSAGE} (with the bell schedule and other overrides: {where})')
+
+
+def generate_device_secret():
+    return secrets.token_hex(32)
+
+
+class Device(models.Model):
+    """Gate reader allowed to submit scans; requests are signed with its secret (see attendance/device_auth.py)"""
+    device_id = models.CharField(max_length=50, primary_key=True, help_text="e.g. ESP32_GATE_001")
+    device_name = models.CharField(max_length=100, blank=True, help_text="Where the reader is mounted")
+    secret = models.CharField(max_length=64, default=generate_device_secret,
+                              help_text="HMAC key flashed into the reader's firmware")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'devices'
+        ordering = ['device_id']
+
+    def __str__(self):
+        return f"{self.device_id} - {self.device_name}" if self.device_name else self.device_id
+
+
 class Attendance(models.Model):
     """Daily attendance - SAFE MIGRATION with old fields preserved"""
     ATTENDANCE_STATUS_CHOICES = [
@@ -339,8 +408,8 @@ class Attendance(models.Model):
 
     class Meta:
         db_table = 'attendance'
-        # Remove unique_together temporarily to allow migration
-        # unique_together = [['student', 'check_in_date']]
+        # Gate scans upsert on this key (see scan_service.py)
+        unique_together = [['student', 'check_in_date']]
         ordering = ['-check_in_date']
         indexes = [
             models.Index(fields=['check_in_date']),
@@ -351,19 +420,100 @@ class Attendance(models.Model):
     def __str__(self):
         return f"{self.student.student_full_name} - {self.check_in_date} ({self.status})"
     
-    def mark_late_if_needed(self, cutoff_time="07:00:00"):
-        """Backwards compatible method"""
-        from datetime import time
-        cutoff = timezone.datetime.strptime(cutoff_time, "%H:%M:%S").time()
-        
+    def mark_late_if_needed(self, cutoff_time=None):
+        """Backwards compatible method; the cutoff defaults to the scan policy's for this day and grade"""
+        from .utils.scan_policy import get_scan_policy
+
         # Check new field first, fall back to old field
         scan_time = self.morning_gate_scan_time or self.check_in_time
-        
-        if scan_time and scan_time.time() > cutoff:
+        if not scan_time:
+            return
+        scan_time = timezone.localtime(scan_time).time()
+
+        if cutoff_time is not None:
+            is_late = scan_time > timezone.datetime.strptime(cutoff_time, "%H:%M:%S").time()
+        else:
+            student_class = self.student.student_class
+            policy = get_scan_policy(self.check_in_date.isoweekday(), student_class.grade_level if student_class else None)
+            is_late = policy.is_late(scan_time)
+
+        if is_late:
             self.status = 'late_arrival' if self.morning_gate_scan_time else 'late'
             self.save()
 
 
+class ScanEvent(models.Model):
+    """Every gate tap as received, accepted or not (append-only; Attendance is derived from it)"""
+    OUTCOME_CHOICES = [
+        ('recorded', 'Đã ghi nhận'),
+        ('duplicate', 'Quét trùng'),
+        ('no_morning_scan', 'Chưa quét buổi sáng'),
+        ('outside_window', 'Ngoài giờ quét thẻ'),
+        ('excused', 'Có phép'),
+        ('unknown_card', 'Thẻ không hợp lệ'),
+        ('missing_card', 'Không có thẻ'),
+        ('no_academic_year', 'Không có năm học'),
+    ]
+
+    event_id = UUIDv7Field(primary_key=True, editable=False)
+    card_uid = models.CharField(max_length=32, blank=True)
+    # No DB constraint: the log keeps the ids it was written with, even for deleted students
+    student = models.ForeignKey(
+        Students, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='scan_events'
+    )
+    academic_year = models.ForeignKey(
+        AcademicYear, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='scan_events'
+    )
+    device_id = models.CharField(max_length=50, blank=True, null=True)
+
+    scanned_at = models.DateTimeField()  # Reader timestamp (server time if the reader sent none)
+    scan_date = models.DateField()
+    session = models.CharField(max_length=10, blank=True, null=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    received_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'scan_events'
+        ordering = ['scanned_at']
+        indexes = [
+            models.Index(fields=['scan_date', 'student']),
+            models.Index(fields=['card_uid']),
+            models.Index(fields=['received_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.card_uid} @ {self.scanned_at} ({self.outcome})"
+
+
+class ClassDailyStats(models.Model):
+    """Running per-class counts for one day, kept in step with Attendance (see attendance/utils/class_stats.py)"""
+    class_stats_id = UUIDv7Field(primary_key=True, editable=False)
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='daily_stats')
+    stats_date = models.DateField()
+
+    # Plain integers: a decrement racing a reconcile must not fail the request
+    morning_scanned = models.IntegerField(default=0)
+    afternoon_scanned = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    excused = models.IntegerField(default=0)  # Active students with an approved excuse that day
+    total_active = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'class_daily_stats'
+        # Dashboards look rows up by this key
+        unique_together = [['class_obj', 'stats_date']]
+        ordering = ['-stats_date']
+        verbose_name = 'Class daily stats'
+        verbose_name_plural = 'Class daily stats'
+
+    def __str__(self):
+        return f"{self.class_obj.class_name} - {self.stats_date}"
+
+
 class AttendancePeriod(models.Model):
     """Per-period attendance tracking (NEW - COMPLETELY SAFE)"""
     PERIOD_STATUS_CHOICES = [
@@ -0,0 +1,175 @@
+"""
+Append-only log of every gate tap (ScanEvent).
+
+Scans are answered first and logged behind: each tap is appended to an
+in-process buffer and a background thread writes the buffer out every
+SCAN_EVENT_FLUSH_INTERVAL seconds, or as soon as SCAN_EVENT_BUFFER_SIZE taps
+are waiting. On PostgreSQL the rows go in with one COPY, elsewhere with
+bulk_create. If the database is unreachable, the taps stay buffered (up to
+SCAN_EVENT_BUFFER_MAX) and are retried.
+
+The log is not lossless: taps past SCAN_EVENT_BUFFER_MAX, and taps still
+buffered when a process exits with the database down, are dropped. Every
+drop is logged and counted per scan day in the default cache
+(dropped_scan_events), so the rebuild can leave those days alone.
+
+Attendance stays the live projection written by scan_service; the log keeps
+the taps it rejects too, and `manage.py rebuild_attendance` re-derives
+Attendance from it.
+"""
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections, router
+from django.utils import timezone
+import atexit
+import logging
+import threading
+
+from .models import ScanEvent, generate_uuid7
+
+
+logger = logging.getLogger(__name__)
+
+COPY_COLUMNS = [
+	'event_id', 'card_uid', 'student_id', 'academic_year_id', 'device_id',
+	'scanned_at', 'scan_date', 'session', 'outcome', 'received_at',
+]
+
+DROPPED_KEY_PREFIX = 'attendance:scan-events:dropped:'
+# Long enough for a rebuild of the school year
+DROPPED_KEY_TIMEOUT = 400 * 24 * 60 * 60
+
+_lock = threading.Lock()
+_buffer = []
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_flusher = None
+
+
+def _enabled():
+	return getattr(settings, 'SCAN_EVENT_LOG', True)
+
+
+def log_scan(outcome, card_uid, device_id, scan_datetime, student_id=None, academic_year_id=None, session=None):
+	"""Queue one tap for the event log; cheap enough for the request path"""
+	if not _enabled():
+		return
+	local_dt = timezone.localtime(scan_datetime)
+	row = (
+		generate_uuid7(), (card_uid or '')[:32], student_id, academic_year_id, device_id,
+		scan_datetime, local_dt.date(), session, outcome, timezone.now(),
+	)
+	with _lock:
+		_buffer.append(row)
+		full = len(_buffer) >= getattr(settings, 'SCAN_EVENT_BUFFER_SIZE', 200)
+	_start_flusher()
+	if full:
+		_wakeup.set()
+
+
+def _write(rows):
+	db = router.db_for_write(ScanEvent)
+	connection = connections[db]
+	if connection.vendor == 'postgresql':
+		with connection.cursor() as cursor:
+			copy_sql = f"COPY {ScanEvent._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN"
+			with cursor.cursor.copy(copy_sql) as copy:
+				for row in rows:
+					copy.write_row(row)
+		return
+	ScanEvent.objects.using(db).bulk_create([
+		ScanEvent(**dict(zip(COPY_COLUMNS, row))) for row in rows
+	], batch_size=500)
+
+
+def _dropped_key(day):
+	return f'{DROPPED_KEY_PREFIX}{day.isoformat()}'
+
+
+def _report_drops(rows):
+	"""Log dropped taps and count them per scan day where the rebuild can see them"""
+	days = Counter(row[COPY_COLUMNS.index('scan_date')] for row in rows)
+	logger.error(
+		'Scan event log dropped %d events (%s)', len(rows),
+		', '.join(f'{day}: {count}' for day, count in sorted(days.items()))
+	)
+	for day, count in days.items():
+		try:
+			try:
+				cache.incr(_dropped_key(day), count)
+			except ValueError:
+				if not cache.add(_dropped_key(day), count, DROPPED_KEY_TIMEOUT):
+					cache.incr(_dropped_key(day), count)
+		except Exception:
+			# The cache may be down with the database; the log line above still records it
+			logger.exception('Could not record dropped scan events for %s', day)
+
+
+def dropped_scan_events(days):
+	"""{day: number of taps the log is known to have dropped} for the days that lost any"""
+	found = cache.get_many([_dropped_key(day) for day in days])
+	return {day: found[_dropped_key(day)] for day in days if found.get(_dropped_key(day))}
+
+
+def flush_scan_events():
+	"""Write out everything buffered so far; returns the number of events written"""
+	with _lock:
+		rows = _buffer[:]
+		del _buffer[:]
+	if not rows:
+		return 0
+	try:
+		_write(rows)
+	except Exception:
+		with _lock:
+			# Put them back in front, dropping the oldest if the outage goes on too long
+			_buffer[:0] = rows
+			overflow = len(_buffer) - getattr(settings, 'SCAN_EVENT_BUFFER_MAX', 10000)
+			dropped = _buffer[:max(0, overflow)]
+			del _buffer[:len(dropped)]
+		if dropped:
+			_report_drops(dropped)
+		raise
+	return len(rows)
+
+
+def _flush_forever():
+	interval = getattr(settings, 'SCAN_EVENT_FLUSH_INTERVAL', 1.0)
+	while not _stopping.is_set():
+		_wakeup.wait(interval)
+		_wakeup.clear()
+		try:
+			flush_scan_events()
+		except Exception:
+			logger.exception('Writing scan events failed')
+		finally:
+			close_old_connections()
+
+
+def _start_flusher():
+	global _flusher
+	if _flusher is not None and _flusher.is_alive():
+		return
+	with _lock:
+		if _flusher is None or not _flusher.is_alive():
+			_flusher = threading.Thread(target=_flush_forever, name='scan-event-flusher', daemon=True)
+			_flusher.start()
+
+
+@atexit.register
+def _flush_at_exit():
+	# Let a write in progress finish rather than dying with the process
+	_stopping.set()
+	_wakeup.set()
+	if _flusher is not None:
+		_flusher.join(timeout=getattr(settings, 'SCAN_EVENT_EXIT_TIMEOUT', 5.0))
+	try:
+		flush_scan_events()
+	except Exception:
+		logger.exception('Writing scan events at exit failed')
+		with _lock:
+			rows = _buffer[:]
+			del _buffer[:]
+		if rows:
+			_report_drops(rows)
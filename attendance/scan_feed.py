@@ -0,0 +1,227 @@
+"""
+Live feed of recorded gate scans for the teacher dashboard stream.
+
+record_scan publishes each scan it records (publish_scan). On PostgreSQL a
+background thread sends the waiting scans with NOTIFY on CHANNEL, batched
+into as few notifications as fit, so a scan only pays for a list append.
+Each ASGI worker process keeps one LISTEN connection (started with its first
+stream) and hands every scan to the streams subscribed to its class. On
+other databases the feed stays inside the process.
+
+A stream that falls behind, or that may have missed scans while the LISTEN
+connection was re-established, gets a {'type': 'resync'} event and reloads
+the full stats.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+import asyncio
+import json
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'attendance_scans'
+# PostgreSQL refuses NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7500
+MAX_OUTBOX = 5000
+QUEUE_SIZE = 100
+
+RESYNC = {'type': 'resync'}
+
+_lock = threading.Lock()
+_outbox = []
+_wakeup = threading.Event()
+_sender = None
+
+_subscriptions = {}
+_listeners = {}
+
+
+def _enabled():
+	return getattr(settings, 'SCAN_FEED', True)
+
+
+def _uses_notify():
+	return connections[DEFAULT_DB_ALIAS].vendor == 'postgresql'
+
+
+def publish_scan(student, session, scan_datetime, status, is_late=False):
+	"""Announce a recorded scan of a StudentCard to the dashboards of its class"""
+	if not _enabled() or student.class_id is None:
+		return
+	event = {
+		'type': 'scan',
+		'class_id': str(student.class_id),
+		'student_id': str(student.student_id),
+		'student_name': student.full_name,
+		'class_name': student.class_label,
+		'session': session,
+		'time': scan_datetime.strftime('%H:%M:%S'),
+		'status': status,
+		'is_late': is_late,
+	}
+	if not _uses_notify():
+		_dispatch([event])
+		return
+	with _lock:
+		_outbox.append(event)
+		# Nobody can be told about scans the database never heard of; keep the newest
+		del _outbox[:-MAX_OUTBOX]
+	_start_sender()
+	_wakeup.set()
+
+
+def _payloads(events):
+	"""JSON arrays of events, each small enough for one NOTIFY"""
+	batch, size = [], 2
+	for event in events:
+		encoded = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+		length = len(encoded.encode()) + 1
+		if batch and size + length > MAX_PAYLOAD_BYTES:
+			yield '[' + ','.join(batch) + ']'
+			batch, size = [], 2
+		batch.append(encoded)
+		size += length
+	if batch:
+		yield '[' + ','.join(batch) + ']'
+
+
+def _send_forever():
+	while True:
+		_wakeup.wait()
+		_wakeup.clear()
+		with _lock:
+			events = _outbox[:]
+			del _outbox[:]
+		if not events:
+			continue
+		try:
+			with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+				for payload in _payloads(events):
+					cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+		except Exception:
+			logger.exception('Publishing %d scans to the dashboard feed failed', len(events))
+		finally:
+			close_old_connections()
+
+
+def _start_sender():
+	global _sender
+	if _sender is not None and _sender.is_alive():
+		return
+	with _lock:
+		if _sender is None or not _sender.is_alive():
+			_sender = threading.Thread(target=_send_forever, name='scan-feed-sender', daemon=True)
+			_sender.start()
+
+
+class Subscription:
+	"""Scans for a set of classes, delivered to an asyncio queue on the subscriber's loop"""
+
+	def __init__(self, class_ids):
+		self.class_ids = {str(class_id) for class_id in class_ids}
+		self.loop = asyncio.get_running_loop()
+		self.queue = asyncio.Queue(QUEUE_SIZE)
+
+	def _put(self, event):
+		try:
+			self.queue.put_nowait(event)
+		except asyncio.QueueFull:
+			# The browser fell behind: drop the backlog and have it reload the stats
+			while not self.queue.empty():
+				self.queue.get_nowait()
+			self.queue.put_nowait(RESYNC)
+
+	def deliver(self, event):
+		try:
+			self.loop.call_soon_threadsafe(self._put, event)
+		except RuntimeError:
+			# The loop is gone; the stream's cleanup will unsubscribe it
+			pass
+
+	async def get(self):
+		return await self.queue.get()
+
+
+def subscribe(class_ids):
+	"""Start receiving scans for these classes; call from the event loop serving the stream"""
+	subscription = Subscription(class_ids)
+	with _lock:
+		for class_id in subscription.class_ids:
+			_subscriptions.setdefault(class_id, set()).add(subscription)
+	if _uses_notify():
+		_ensure_listener(subscription.loop)
+	return subscription
+
+
+def unsubscribe(subscription):
+	with _lock:
+		for class_id in subscription.class_ids:
+			subscribers = _subscriptions.get(class_id)
+			if subscribers is not None:
+				subscribers.discard(subscription)
+				if not subscribers:
+					del _subscriptions[class_id]
+
+
+def _dispatch(events):
+	with _lock:
+		targets = [
+			(subscription, event)
+			for event in events
+			for subscription in _subscriptions.get(event.get('class_id'), ())
+		]
+	for subscription, event in targets:
+		subscription.deliver(event)
+
+
+def _resync_all():
+	with _lock:
+		subscriptions = {subscription for subscribers in _subscriptions.values() for subscription in subscribers}
+	for subscription in subscriptions:
+		subscription.deliver(RESYNC)
+
+
+def _ensure_listener(loop):
+	task = _listeners.get(loop)
+	if task is None or task.done():
+		_listeners[loop] = loop.create_task(_listen())
+
+
+def _listen_params():
+	params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+	# Django's cursor and adapter settings don't apply to a bare LISTEN connection
+	for key in ('cursor_factory', 'context', 'prepare_threshold', 'pool'):
+		params.pop(key, None)
+	return params
+
+
+async def _listen():
+	"""One LISTEN connection per event loop, re-established with backoff"""
+	from psycopg import AsyncConnection
+
+	delay = 1
+	connected_before = False
+	while True:
+		try:
+			connection = await AsyncConnection.connect(autocommit=True, **_listen_params())
+			async with connection:
+				await connection.execute(f'LISTEN {CHANNEL}')
+				if connected_before:
+					# Scans published while we were away are lost; streams reload their stats
+					_resync_all()
+				connected_before = True
+				delay = 1
+				async for notify in connection.notifies():
+					try:
+						_dispatch(json.loads(notify.payload))
+					except ValueError:
+						logger.warning('Ignoring malformed scan feed payload')
+		except asyncio.CancelledError:
+			raise
+		except Exception:
+			logger.exception('Scan feed LISTEN connection failed, retrying in %ds', delay)
+		await asyncio.sleep(delay)
+		delay = min(delay * 2, 30)
@@ -0,0 +1,352 @@
+"""
+Write-behind journal for gate scans (fast-ack mode).
+
+With SCAN_FAST_ACK on, a scan is checked against the cached roster, appended
+to a local SQLite file in WAL mode with synchronous=FULL (every append is
+fsync'd before the reader gets its answer) and a background drainer writes
+the journaled scans to Attendance in batches through process_scan_batch.
+
+Entries are only marked applied after their batch commits, so anything left
+over from a crash or restart is replayed. Replays are harmless: the scan
+upsert is first-scan-wins, so applying the same entry twice leaves the same
+Attendance row - each scan takes effect exactly once. With fast-ack on, the
+drainer starts with the app (AppConfig.ready), so a restart replays what is
+pending without waiting for the next scan.
+
+A batch that fails for anything but a database outage is retried one entry at
+a time, so one bad entry can't hold back the rest. An entry that keeps failing
+on its own is dead-lettered after SCAN_JOURNAL_MAX_ATTEMPTS tries: it stays in
+the journal with its error but is no longer drained.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils import timezone
+from datetime import timedelta
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from .models import AcademicYear, generate_uuid7
+from .scan_service import (
+	error_payload, parse_scan_datetime, scan_session,
+	provisional_scan_payload, process_scan_batch,
+)
+from .utils.roster_cache import get_student_card
+from .utils.academic_year import get_active_academic_year
+from .utils.scan_metrics import NULL_TIMER
+from .scan_events import log_scan
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+	CREATE TABLE IF NOT EXISTS scan_journal (
+		seq INTEGER PRIMARY KEY AUTOINCREMENT,
+		event_id TEXT NOT NULL UNIQUE,
+		card_uid TEXT NOT NULL,
+		device_id TEXT,
+		scan_timestamp TEXT NOT NULL,
+		scan_date TEXT NOT NULL,
+		session TEXT NOT NULL,
+		received_at TEXT NOT NULL,
+		claimed_by TEXT,
+		claimed_at REAL,
+		applied_at TEXT,
+		result TEXT,
+		failed_attempts INTEGER NOT NULL DEFAULT 0,
+		dead_lettered_at TEXT
+	);
+	CREATE INDEX IF NOT EXISTS scan_journal_pending ON scan_journal (applied_at, seq);
+	CREATE INDEX IF NOT EXISTS scan_journal_card_day ON scan_journal (card_uid, scan_date, session);
+"""
+# Columns added after the first release; journals created before get them on open
+ADDED_COLUMNS = {
+	'failed_attempts': 'failed_attempts INTEGER NOT NULL DEFAULT 0',
+	'dead_lettered_at': 'dead_lettered_at TEXT',
+}
+# Errors that say nothing about the entries themselves; the whole batch waits for the database
+DATABASE_DOWN = (OperationalError, InterfaceError)
+
+
+class ScanJournal:
+	"""Append-only scan journal in a local SQLite file, one connection per thread"""
+
+	def __init__(self, path):
+		self.path = str(path)
+		self._local = threading.local()
+
+	def _connection(self):
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			directory = os.path.dirname(self.path)
+			if directory:
+				os.makedirs(directory, exist_ok=True)
+			conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=FULL')
+			conn.executescript(SCHEMA)
+			self._add_columns(conn)
+			self._local.conn = conn
+		return conn
+
+	def _add_columns(self, conn):
+		columns = {row[1] for row in conn.execute('PRAGMA table_info(scan_journal)')}
+		for column, definition in ADDED_COLUMNS.items():
+			if column not in columns:
+				try:
+					conn.execute(f'ALTER TABLE scan_journal ADD COLUMN {definition}')
+				except sqlite3.OperationalError:
+					# Another process added it first
+					pass
+
+	def append(self, card_uid, device_id, scan_datetime, session):
+		"""Durably record a scan; returns its event id"""
+		event_id = str(generate_uuid7())
+		local_dt = timezone.localtime(scan_datetime)
+		self._connection().execute(
+			'INSERT INTO scan_journal (event_id, card_uid, device_id, scan_timestamp, scan_date, session, received_at) '
+			'VALUES (?, ?, ?, ?, ?, ?, ?)',
+			(
+				event_id, card_uid, device_id,
+				local_dt.strftime('%Y-%m-%d %H:%M:%S'), local_dt.date().isoformat(), session,
+				timezone.now().isoformat(),
+			)
+		)
+		return event_id
+
+	def first_scans(self, card_uid, scan_date):
+		"""{session: local scan time} of the earliest journaled scans for a card on a day"""
+		rows = self._connection().execute(
+			'SELECT session, MIN(scan_timestamp) FROM scan_journal '
+			'WHERE card_uid = ? AND scan_date = ? GROUP BY session',
+			(card_uid, scan_date.isoformat())
+		).fetchall()
+		return {session: parse_scan_datetime(scan_timestamp) for session, scan_timestamp in rows}
+
+	def claim(self, owner, limit, claim_timeout):
+		"""Reserve up to `limit` unapplied entries, oldest first; stale claims are taken over"""
+		conn = self._connection()
+		now = time.time()
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			rows = conn.execute(
+				'SELECT seq, card_uid, device_id, scan_timestamp FROM scan_journal '
+				'WHERE applied_at IS NULL AND dead_lettered_at IS NULL AND (claimed_at IS NULL OR claimed_at < ?) '
+				'ORDER BY seq LIMIT ?',
+				(now - claim_timeout, limit)
+			).fetchall()
+			conn.executemany(
+				'UPDATE scan_journal SET claimed_by = ?, claimed_at = ? WHERE seq = ?',
+				[(owner, now, row[0]) for row in rows]
+			)
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+		return rows
+
+	def mark_applied(self, results):
+		"""results: [(seq, result_dict)] for entries whose batch has committed"""
+		applied_at = timezone.now().isoformat()
+		conn = self._connection()
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			conn.executemany(
+				'UPDATE scan_journal SET applied_at = ?, result = ? WHERE seq = ?',
+				[(applied_at, json.dumps(result, ensure_ascii=False), seq) for seq, result in results]
+			)
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+
+	def record_failure(self, seq, error, max_attempts):
+		"""Count a failed try of one entry; releases it for a retry or dead-letters it. True if dead-lettered"""
+		conn = self._connection()
+		conn.execute('BEGIN IMMEDIATE')
+		try:
+			conn.execute(
+				'UPDATE scan_journal SET failed_attempts = failed_attempts + 1, claimed_by = NULL, claimed_at = NULL, '
+				'result = ? WHERE seq = ?',
+				(json.dumps({'error': error}, ensure_ascii=False), seq)
+			)
+			dead = conn.execute(
+				'UPDATE scan_journal SET dead_lettered_at = ? WHERE seq = ? AND failed_attempts >= ?',
+				(timezone.now().isoformat(), seq, max_attempts)
+			).rowcount
+			conn.execute('COMMIT')
+		except Exception:
+			conn.execute('ROLLBACK')
+			raise
+		return bool(dead)
+
+	def pending_count(self):
+		return self._connection().execute(
+			'SELECT COUNT(*) FROM scan_journal WHERE applied_at IS NULL AND dead_lettered_at IS NULL'
+		).fetchone()[0]
+
+	def dead_letter_count(self):
+		return self._connection().execute(
+			'SELECT COUNT(*) FROM scan_journal WHERE dead_lettered_at IS NOT NULL'
+		).fetchone()[0]
+
+	def purge_applied(self, older_than):
+		"""Drop applied entries received before `older_than`; returns how many were removed"""
+		return self._connection().execute(
+			'DELETE FROM scan_journal WHERE applied_at IS NOT NULL AND received_at < ?',
+			(older_than.isoformat(),)
+		).rowcount
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+	global _journal
+	with _journal_lock:
+		if _journal is None:
+			_journal = ScanJournal(settings.SCAN_JOURNAL_PATH)
+	return _journal
+
+
+def journal_scan(card_uid, device_id, timestamp_str, timer=NULL_TIMER):
+	"""
+	Fast-ack scan: validate from cache, journal it, answer straight away; returns (payload, http_status).
+	Rejected taps go to the scan event log here; journaled ones are logged when the drainer applies them.
+	"""
+	# Pin the scan time now so a late drain doesn't move it
+	scan_datetime = timezone.localtime(parse_scan_datetime(timestamp_str))
+	if not card_uid:
+		log_scan('missing_card', card_uid, device_id, scan_datetime)
+		return error_payload('Card UID is required', 'Lỗi: Không có thẻ'), 400
+
+	student = get_student_card(card_uid)
+	if student is None:
+		log_scan('unknown_card', card_uid, device_id, scan_datetime)
+		return error_payload('Card not found or inactive', 'Thẻ không hợp lệ'), 404
+
+	try:
+		academic_year = get_active_academic_year()
+	except AcademicYear.DoesNotExist:
+		log_scan('no_academic_year', card_uid, device_id, scan_datetime, student.student_id)
+		return error_payload('No active academic year', 'Lỗi hệ thống'), 400
+
+	session = scan_session(scan_datetime, student.grade_level)
+	timer.mark('lookup')
+	if session is None:
+		log_scan('outside_window', card_uid, device_id, scan_datetime, student.student_id, academic_year.academic_year_id)
+		return provisional_scan_payload(student, scan_datetime, session), 200
+
+	journal = get_journal()
+	first_scans = journal.first_scans(card_uid, scan_datetime.date())
+	if session in first_scans:
+		timer.mark('journal')
+		log_scan('duplicate', card_uid, device_id, scan_datetime, student.student_id, academic_year.academic_year_id, session)
+		return provisional_scan_payload(student, scan_datetime, session, first_scan=first_scans[session]), 200
+
+	journal.append(card_uid, device_id, scan_datetime, session)
+	start_drainer()
+	timer.mark('journal')
+	return provisional_scan_payload(student, scan_datetime, session, morning_scan=first_scans.get('morning')), 200
+
+
+def drain_journal(batch_size=None, owner=None):
+	"""Apply one batch of journaled scans to Attendance; returns how many entries were applied"""
+	journal = get_journal()
+	batch_size = batch_size or getattr(settings, 'SCAN_JOURNAL_BATCH_SIZE', 200)
+	owner = owner or f'{os.getpid()}:{threading.get_ident()}'
+	claim_timeout = getattr(settings, 'SCAN_JOURNAL_CLAIM_TIMEOUT', 60)
+
+	entries = journal.claim(owner, batch_size, claim_timeout)
+	if not entries:
+		return 0
+
+	try:
+		_apply(journal, entries)
+	except DATABASE_DOWN:
+		raise
+	except Exception:
+		logger.exception('Applying a batch of %d journaled scans failed, retrying them one by one', len(entries))
+		return _apply_one_by_one(journal, entries)
+	return len(entries)
+
+
+def _apply(journal, entries):
+	results = process_scan_batch([
+		{'card_uid': card_uid, 'device_id': device_id, 'timestamp': scan_timestamp}
+		for seq, card_uid, device_id, scan_timestamp in entries
+	])
+	journal.mark_applied([
+		(entry[0], dict(payload, http_status=status))
+		for entry, (payload, status) in zip(entries, results)
+	])
+
+
+def _apply_one_by_one(journal, entries):
+	"""Apply each entry alone; returns how many were applied or dead-lettered"""
+	max_attempts = getattr(settings, 'SCAN_JOURNAL_MAX_ATTEMPTS', 5)
+	done = 0
+	for entry in entries:
+		try:
+			_apply(journal, [entry])
+		except DATABASE_DOWN:
+			raise
+		except Exception as e:
+			close_old_connections()
+			if journal.record_failure(entry[0], repr(e), max_attempts):
+				logger.error('Dead-lettered journaled scan %s (card %s) after %d attempts: %r', entry[0], entry[1], max_attempts, e)
+				done += 1
+			continue
+		done += 1
+	return done
+
+
+_drainer = None
+_drainer_lock = threading.Lock()
+
+
+def _drain_forever():
+	interval = getattr(settings, 'SCAN_JOURNAL_DRAIN_INTERVAL', 1.0)
+	# Started from AppConfig.ready(), before the other apps have finished loading
+	while not apps.ready:
+		time.sleep(0.1)
+	while True:
+		try:
+			applied = drain_journal()
+		except Exception:
+			# Database unreachable or similar - entries stay journaled and are retried
+			logger.exception('Draining the scan journal failed')
+			applied = 0
+		finally:
+			close_old_connections()
+		if not applied:
+			time.sleep(interval)
+
+
+def start_drainer():
+	"""Start this process' background drainer; it first replays whatever is still pending"""
+	global _drainer
+	with _drainer_lock:
+		if _drainer is None or not _drainer.is_alive():
+			_drainer = threading.Thread(target=_drain_forever, name='scan-journal-drainer', daemon=True)
+			_drainer.start()
+
+
+def start_drainer_at_startup():
+	"""From AppConfig.ready(): with fast-ack on, replay what a previous process left pending right away"""
+	if not getattr(settings, 'SCAN_FAST_ACK', False):
+		return
+	# Other management commands (migrate, shell, drain_scan_journal itself) serve no scans
+	if os.path.basename(sys.argv[0]) == 'manage.py' and sys.argv[1:2] != ['runserver']:
+		return
+	start_drainer()
+
+
+def purge_journal(days):
+	return get_journal().purge_applied(timezone.now() - timedelta(days=days))
@@ -0,0 +1,128 @@
+"""
+Response profiles for gate readers.
+
+The default profile is the verbose JSON the web tools and older firmware use.
+Readers can ask for the compact profile with an `X-Scan-Profile: compact`
+header or `"v": 2` in the request body: short keys, a numeric status and the
+LCD text already cut into 16-character rows for the 16x2 display. Adding
+`Accept: application/msgpack` returns the same structure as MessagePack.
+"""
+from django.http import HttpResponse, JsonResponse
+
+from .utils.lcd import to_ascii_vietnamese
+
+try:
+	import msgpack
+except ImportError:  # optional - compact JSON is used instead
+	msgpack = None
+
+
+LCD_COLUMNS = 16
+LCD_ROWS = 2
+
+STATUS_CODES = {
+	'success': 0,
+	'info': 1,
+	'warning': 2,
+	'error': 3,
+}
+
+# Verbose key -> compact key, for the fields the firmware actually uses
+COMPACT_KEYS = {
+	'class': 'c',
+	'scan_time': 't',
+	'scan_status': 'st',
+	'first_scan_time': 'f',
+	'morning_scan': 'm',
+	'to_number': 'tn',
+	'seat_number': 'sn',
+	'queued': 'q',
+}
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Fixed phrases wider than the display -> the wording the 16-column rows use
+LCD_SHORT_PHRASES = {
+	to_ascii_vietnamese(phrase): to_ascii_vietnamese(short)
+	for phrase, short in (
+		('Chưa quét buổi sáng', 'Chưa quét sáng'),
+		('Đã quét buổi sáng!', 'Đã quét sáng!'),
+		('Đã quét buổi chiều!', 'Đã quét chiều!'),
+		('Ngoài giờ quét thẻ', 'Ngoài giờ quét!'),
+		('Lỗi: Không có thẻ', 'Không có thẻ'),
+	)
+}
+
+
+def lcd_row(line):
+	"""Fit one line into 16 columns: the short form of a fixed phrase, else cut at the last word that fits"""
+	line = LCD_SHORT_PHRASES.get(line, line)
+	if len(line) <= LCD_COLUMNS:
+		return line
+	cut = line.rfind(' ', 0, LCD_COLUMNS + 1)
+	# A single word longer than the row has to be cut mid-word
+	return line[:cut] if cut > 0 else line[:LCD_COLUMNS]
+
+
+def lcd_rows(lcd_message, name=None):
+	"""
+	Cut an LCD message into at most two 16-char rows. With more lines, the row showing
+	`name` (the student's ASCII name) stays, then the last line (the status note) and
+	then the first, in their original order; the greeting goes first. Each row is
+	fitted by lcd_row, so words are never split unless one alone is too wide.
+	"""
+	lines = (lcd_message or '').split('\n')
+	if len(lines) > LCD_ROWS:
+		last = len(lines) - 1
+		named = [index for index, line in enumerate(lines) if name and name in line]
+		priority = named[:1] + [last, 0] + list(range(1, last))
+		keep = sorted(list(dict.fromkeys(priority))[:LCD_ROWS])
+		lines = [lines[index] for index in keep]
+	return [lcd_row(line) for line in lines]
+
+
+def compact_payload(payload):
+	compact = {'s': STATUS_CODES.get(payload.get('status'), STATUS_CODES['error'])}
+	name = to_ascii_vietnamese(payload['student']) if payload.get('student') else None
+	compact['lcd'] = lcd_rows(payload.get('lcd_message'), name)
+	if name:
+		compact['n'] = name
+	if 'is_late' in payload:
+		compact['lt'] = 1 if payload['is_late'] else 0
+	for key, short_key in COMPACT_KEYS.items():
+		if payload.get(key) is not None:
+			compact[short_key] = payload[key]
+	return compact
+
+
+def wants_compact(request, data=None):
+	if request.headers.get('X-Scan-Profile', '').lower() == 'compact':
+		return True
+	return isinstance(data, dict) and str(data.get('v')) == '2'
+
+
+def _render(request, body, status):
+	if msgpack is not None and any(t in request.headers.get('Accept', '') for t in MSGPACK_TYPES):
+		return HttpResponse(msgpack.packb(body), content_type='application/msgpack', status=status)
+	return JsonResponse(body, status=status, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+
+def scan_response(request, payload, status, data=None):
+	"""Render a scan result in the profile the reader asked for"""
+	if not wants_compact(request, data):
+		return JsonResponse(payload, status=status)
+	return _render(request, compact_payload(payload), status)
+
+
+def batch_response(request, results, data=None):
+	"""Render per-event batch results; compact entries carry their own status as 'h'"""
+	if not wants_compact(request, data):
+		return JsonResponse({
+			'status': 'success',
+			'count': len(results),
+			'results': [dict(payload, http_status=status) for payload, status in results]
+		})
+	return _render(request, {
+		's': STATUS_CODES['success'],
+		'r': [dict(compact_payload(payload), h=status) for payload, status in results]
+	}, 200)
@@ -0,0 +1,538 @@
+"""
+Gate scan business rules shared by the single and batch scan endpoints.
+
+Every entry point returns (payload, http_status) pairs; the views only turn
+them into HTTP responses. Attendance rows are written with one conditional
+INSERT ... ON CONFLICT DO UPDATE per scan, backed by the unique
+(student, check_in_date) constraint, so concurrent gates can't double-record.
+A recorded scan bumps its class's ClassDailyStats counters in the same
+transaction.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction, router, connections, close_old_connections
+from django.utils import timezone
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from .models import Attendance, AcademicYear, generate_uuid7
+from .utils.lcd import to_ascii_vietnamese
+from .utils.roster_cache import get_student_card, get_student_cards
+from .utils.academic_year import get_active_academic_year
+from .utils.excuse_index import excuse_for_day
+from .utils.scan_policy import get_scan_policy
+from .utils.scan_metrics import NULL_TIMER
+from .utils.dashboard_stats import attendance_changed
+from .utils.class_stats import LATE_STATUSES, add_counts
+from .utils.recent_scans import scan_event, push_scan
+from .scan_events import log_scan
+from .scan_feed import publish_scan
+
+
+VN_TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+
+DEFAULT_DEVICE_ID = 'gate_reader_01'
+
+# Fixed LCD phrases, transliterated once; student names come pre-transliterated
+# on the roster cache's StudentCard.ascii_name
+LCD_HELLO = to_ascii_vietnamese('Xin chào')
+LCD_EXCUSED = to_ascii_vietnamese('Bạn có phép nghỉ')
+LCD_GOOD_MORNING = to_ascii_vietnamese('Chào buổi sáng!')
+LCD_GOOD_AFTERNOON = to_ascii_vietnamese('Chào buổi chiều!')
+LCD_LATE = to_ascii_vietnamese('Bạn đến trễ!')
+LCD_NO_MORNING_SCAN = to_ascii_vietnamese('Chưa quét buổi sáng')
+LCD_ALREADY_MORNING = to_ascii_vietnamese('Đã quét buổi sáng!')
+LCD_ALREADY_AFTERNOON = to_ascii_vietnamese('Đã quét buổi chiều!')
+LCD_OUTSIDE_HOURS = to_ascii_vietnamese('Ngoài giờ quét thẻ')
+LCD_STATUS_LATE = to_ascii_vietnamese('Trễ')
+LCD_STATUS_MORNING = to_ascii_vietnamese('Đã quét sáng')
+LCD_STATUS_AFTERNOON = to_ascii_vietnamese('Đã quét chiều')
+
+def error_payload(message, lcd_text):
+	return {
+		'status': 'error',
+		'message': message,
+		'lcd_message': to_ascii_vietnamese(lcd_text)
+	}
+
+
+def parse_scan_datetime(timestamp_str):
+	"""Parse the ESP32 timestamp ("2026-01-05 06:15:44", local time) or fall back to server time"""
+	if timestamp_str:
+		try:
+			naive_dt = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+			return naive_dt.replace(tzinfo=VN_TZ)
+		except (TypeError, ValueError):
+			# Fallback to server time if timestamp format is wrong
+			pass
+	# Use server time (already in Asia/Ho_Chi_Minh timezone)
+	return timezone.now()
+
+
+def scan_session(scan_datetime, grade_level=None):
+	"""Return 'morning', 'afternoon' or None when outside the allowed scan windows"""
+	return get_scan_policy(scan_datetime.isoweekday(), grade_level).session(scan_datetime.time())
+
+
+def is_late_scan(scan_datetime, grade_level=None):
+	return get_scan_policy(scan_datetime.isoweekday(), grade_level).is_late(scan_datetime.time())
+
+
+def _outside_window_payload(student, scan_datetime):
+	return {
+		'status': 'warning',
+		'message': 'Scan outside allowed time',
+		'lcd_message': LCD_OUTSIDE_HOURS,
+		'student': student.full_name,
+		'scan_time': scan_datetime.strftime('%H:%M:%S')
+	}
+
+
+def _excused_payload(student, scan_datetime, excused):
+	# Student has approved excuse but still came to school
+	return {
+		'status': 'info',
+		'message': 'Student has excused absence but scanned',
+		'lcd_message': f'{LCD_HELLO} {student.ascii_name}!\n{LCD_EXCUSED}',
+		'student': student.full_name,
+		'class': student.class_label,
+		'scan_time': scan_datetime.strftime('%H:%M:%S'),
+		'excuse_reason': excused.reason
+	}
+
+
+def _morning_payload(student, scan_datetime, is_late):
+	if is_late:
+		status_message = LCD_STATUS_LATE
+		lcd_greeting = f'{LCD_LATE}\n{student.ascii_name}'
+	else:
+		status_message = LCD_STATUS_MORNING
+		lcd_greeting = f'{LCD_GOOD_MORNING}\n{student.ascii_name}'
+
+	return {
+		'status': 'success',
+		'message': 'Morning gate scan recorded',
+		'lcd_message': lcd_greeting,
+		'student': student.full_name,
+		'class': student.class_label,
+		'student_role': student.role_display,
+		'to_number': student.to_number,
+		'seat_number': student.seat_number,
+		'scan_time': scan_datetime.strftime('%H:%M:%S'),
+		'scan_status': status_message,
+		'is_late': is_late
+	}
+
+
+def _afternoon_payload(student, scan_datetime, morning_time):
+	return {
+		'status': 'success',
+		'message': 'Afternoon gate scan recorded',
+		'lcd_message': f'{LCD_GOOD_AFTERNOON}\n{student.ascii_name}',
+		'student': student.full_name,
+		'class': student.class_label,
+		'student_role': student.role_display,
+		'to_number': student.to_number,
+		'seat_number': student.seat_number,
+		'scan_time': scan_datetime.strftime('%H:%M:%S'),
+		'scan_status': LCD_STATUS_AFTERNOON,
+		'morning_scan': timezone.localtime(morning_time).strftime('%H:%M:%S'),
+		'afternoon_scan': scan_datetime.strftime('%H:%M:%S')
+	}
+
+
+def _already_scanned_payload(student, scan_datetime, session, first_scan):
+	existing_time = timezone.localtime(first_scan)
+	if session == 'morning':
+		message = 'Already scanned this morning'
+		lcd_msg = f'{LCD_ALREADY_MORNING}\n{existing_time.strftime("%H:%M")}'
+	else:
+		message = 'Already scanned this afternoon'
+		lcd_msg = f'{LCD_ALREADY_AFTERNOON}\n{existing_time.strftime("%H:%M")}'
+
+	return {
+		'status': 'warning',
+		'message': message,
+		'lcd_message': lcd_msg,
+		'student': student.full_name,
+		'class': student.class_label,
+		'first_scan_time': existing_time.strftime('%H:%M:%S'),
+		'current_scan_time': scan_datetime.strftime('%H:%M:%S')
+	}
+
+
+def _no_morning_scan_payload(student, scan_datetime):
+	# Scanned afternoon but not morning - unusual
+	return {
+		'status': 'warning',
+		'message': 'Afternoon scan without morning scan',
+		'lcd_message': f'{LCD_GOOD_AFTERNOON}\n{student.ascii_name}\n{LCD_NO_MORNING_SCAN}',
+		'student': student.full_name,
+		'class': student.class_label,
+		'scan_time': scan_datetime.strftime('%H:%M:%S'),
+		'note': 'Student did not scan in morning'
+	}
+
+
+# First scan wins: the row is inserted, or updated only while the morning slot is still empty
+# (with the day's rows pre-created by `manage.py prepare_day`, always the update branch).
+# check_in_time/scanned_card_uid are the old single-scan fields, kept for backward compatibility.
+MORNING_UPSERT_SQL = """
+	INSERT INTO attendance AS a (
+		attendance_id, student_id, academic_year_id, check_in_date,
+		check_in_time, scanned_card_uid, morning_gate_scan_time, morning_scanned_card_uid,
+		status, device_id, is_verified_by_teacher, created_at, updated_at
+	)
+	VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+	ON CONFLICT (student_id, check_in_date) DO UPDATE SET
+		morning_gate_scan_time = EXCLUDED.morning_gate_scan_time,
+		morning_scanned_card_uid = EXCLUDED.morning_scanned_card_uid,
+		status = EXCLUDED.status,
+		device_id = EXCLUDED.device_id,
+		check_in_time = COALESCE(a.check_in_time, EXCLUDED.check_in_time),
+		scanned_card_uid = CASE WHEN a.check_in_time IS NULL THEN EXCLUDED.scanned_card_uid ELSE a.scanned_card_uid END,
+		updated_at = EXCLUDED.updated_at
+	WHERE a.morning_gate_scan_time IS NULL
+	RETURNING attendance_id, morning_gate_scan_time, afternoon_gate_scan_time
+"""
+
+# A missing row is created as 'no_scan' (same as the old get_or_create); an existing one
+# only takes the afternoon scan if the student scanned this morning and not yet this afternoon.
+AFTERNOON_UPSERT_SQL = """
+	INSERT INTO attendance AS a (
+		attendance_id, student_id, academic_year_id, check_in_date,
+		status, device_id, is_verified_by_teacher, created_at, updated_at
+	)
+	VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+	ON CONFLICT (student_id, check_in_date) DO UPDATE SET
+		afternoon_gate_scan_time = %s,
+		afternoon_scanned_card_uid = %s,
+		status = 'scanned_both',
+		updated_at = EXCLUDED.updated_at
+	WHERE a.morning_gate_scan_time IS NOT NULL AND a.afternoon_gate_scan_time IS NULL
+	RETURNING attendance_id, morning_gate_scan_time, afternoon_gate_scan_time
+"""
+
+# The afternoon scan replaces a 'late_arrival' status, so the class's late counter has to
+# drop. On PostgreSQL the whole statement sees the snapshot from before the update, so a
+# CTE returns the replaced status in the same round trip.
+AFTERNOON_UPSERT_PREVIOUS_SQL = (
+	'WITH previous AS (SELECT status FROM attendance WHERE student_id = %s AND check_in_date = %s)'
+	+ AFTERNOON_UPSERT_SQL.replace(
+		'RETURNING attendance_id, morning_gate_scan_time, afternoon_gate_scan_time',
+		'RETURNING attendance_id, morning_gate_scan_time, afternoon_gate_scan_time, '
+		'(SELECT status FROM previous) AS previous_status'
+	)
+)
+
+
+def _prep(field_name, value, connection):
+	return Attendance._meta.get_field(field_name).get_db_prep_save(value, connection)
+
+
+def _upsert(sql, params, db):
+	"""
+	Run an upsert and return the affected row, or None when the ON CONFLICT condition
+	rejected the update. Goes through raw() so the backend converts the RETURNING values.
+	"""
+	connection = connections[db]
+	prepared = [_prep(field_name, value, connection) for field_name, value in params]
+	rows = list(Attendance.objects.raw(sql, prepared, using=db))
+	return rows[0] if rows else None
+
+
+def _scan_recorded(student, session, scan_datetime, status, db, is_late=False):
+	"""Tell the dashboards once the scan is committed: ETag version, live stream and recent-scans buffer"""
+	event = scan_event(student.full_name, student.class_name, scan_datetime, status, session)
+
+	def announce():
+		attendance_changed(student.class_id)
+		publish_scan(student, session, scan_datetime, status, is_late)
+		push_scan(student.class_id, scan_datetime.date(), event)
+
+	# Right away outside a transaction; after COMMIT inside process_scan_batch's
+	transaction.on_commit(announce, using=db)
+
+
+def record_scan(student, academic_year, card_uid, device_id, scan_datetime, session):
+	"""Write a morning or afternoon gate scan with a single statement; returns (payload, ScanEvent outcome)"""
+	db = router.db_for_write(Attendance)
+	now = timezone.now()
+	scan_date = scan_datetime.date()
+	insert_params = [
+		('attendance_id', generate_uuid7()),
+		('student', student.student_id),
+		('academic_year', academic_year.academic_year_id),
+		('check_in_date', scan_date),
+	]
+
+	if session == 'morning':
+		is_late = is_late_scan(scan_datetime, student.grade_level)
+		with transaction.atomic(using=db, savepoint=False):
+			row = _upsert(MORNING_UPSERT_SQL, insert_params + [
+				('check_in_time', scan_datetime),
+				('scanned_card_uid', card_uid),
+				('morning_gate_scan_time', scan_datetime),
+				('morning_scanned_card_uid', card_uid),
+				('status', 'late_arrival' if is_late else 'scanned_morning'),
+				('device_id', device_id),
+				('is_verified_by_teacher', False),
+				('created_at', now),
+				('updated_at', now),
+			], db)
+			if row is not None:
+				add_counts(student.class_id, scan_date, db, morning_scanned=1, late=int(is_late))
+		if row is not None:
+			_scan_recorded(student, session, scan_datetime, 'late_arrival' if is_late else 'scanned_morning', db, is_late)
+			return _morning_payload(student, scan_datetime, is_late), 'recorded'
+
+		# Already scanned this morning - the only case that needs a second read
+		first_scan = Attendance.objects.using(db).filter(
+			student_id=student.student_id,
+			check_in_date=scan_date
+		).values_list('morning_gate_scan_time', flat=True).first()
+		return _already_scanned_payload(student, scan_datetime, session, first_scan), 'duplicate'
+
+	afternoon_params = insert_params + [
+		('status', 'no_scan'),
+		('device_id', device_id),
+		('is_verified_by_teacher', False),
+		('created_at', now),
+		('updated_at', now),
+		('afternoon_gate_scan_time', scan_datetime),
+		('afternoon_scanned_card_uid', card_uid),
+	]
+	with transaction.atomic(using=db, savepoint=False):
+		if connections[db].vendor == 'postgresql':
+			row = _upsert(AFTERNOON_UPSERT_PREVIOUS_SQL, [
+				('student', student.student_id), ('check_in_date', scan_date),
+			] + afternoon_params, db)
+			previous_status = row.previous_status if row is not None else None
+		else:
+			# SQLite's RETURNING sees the new row; its writes are serialised, so reading first is exact
+			previous_status = Attendance.objects.using(db).filter(
+				student_id=student.student_id, check_in_date=scan_date
+			).values_list('status', flat=True).first()
+			row = _upsert(AFTERNOON_UPSERT_SQL, afternoon_params, db)
+		if row is not None and row.afternoon_gate_scan_time is not None:
+			add_counts(
+				student.class_id, scan_date, db,
+				afternoon_scanned=1, late=-int(previous_status in LATE_STATUSES)
+			)
+	if row is not None:
+		if row.afternoon_gate_scan_time is None:
+			# Freshly inserted 'no_scan' row - there was no morning scan
+			return _no_morning_scan_payload(student, scan_datetime), 'no_morning_scan'
+		_scan_recorded(student, session, scan_datetime, 'scanned_both', db)
+		return _afternoon_payload(student, scan_datetime, row.morning_gate_scan_time), 'recorded'
+
+	existing = Attendance.objects.using(db).filter(
+		student_id=student.student_id,
+		check_in_date=scan_date
+	).values('morning_gate_scan_time', 'afternoon_gate_scan_time').first()
+	if not existing['morning_gate_scan_time']:
+		return _no_morning_scan_payload(student, scan_datetime), 'no_morning_scan'
+	return _already_scanned_payload(student, scan_datetime, session, existing['afternoon_gate_scan_time']), 'duplicate'
+
+
+# Attendance fields derived from a day's taps (see project_day)
+PROJECTED_FIELDS = [
+	'check_in_time', 'scanned_card_uid',
+	'morning_gate_scan_time', 'morning_scanned_card_uid',
+	'afternoon_gate_scan_time', 'afternoon_scanned_card_uid',
+	'status', 'device_id',
+]
+
+
+def project_day(taps, grade_level=None):
+	"""
+	Replay one student's taps for one day through the same rules as record_scan.
+	taps: [(scanned_at, card_uid, device_id)] in scan order. Returns the PROJECTED_FIELDS
+	values, or None when no tap falls in a scan window (no row would have been written).
+	"""
+	fields = None
+	for scanned_at, card_uid, device_id in taps:
+		local_dt = timezone.localtime(scanned_at)
+		session = scan_session(local_dt, grade_level)
+		if session is None:
+			continue
+		if fields is None:
+			fields = dict.fromkeys(PROJECTED_FIELDS)
+			fields.update(status='no_scan', device_id=device_id)
+
+		if session == 'morning':
+			if fields['morning_gate_scan_time'] is None:
+				fields.update(
+					morning_gate_scan_time=scanned_at,
+					morning_scanned_card_uid=card_uid,
+					status='late_arrival' if is_late_scan(local_dt, grade_level) else 'scanned_morning',
+				)
+				if fields['check_in_time'] is None:
+					fields.update(check_in_time=scanned_at, scanned_card_uid=card_uid)
+		elif fields['morning_gate_scan_time'] is not None and fields['afternoon_gate_scan_time'] is None:
+			fields.update(
+				afternoon_gate_scan_time=scanned_at,
+				afternoon_scanned_card_uid=card_uid,
+				status='scanned_both',
+			)
+	return fields
+
+
+def provisional_scan_payload(student, scan_datetime, session, first_scan=None, morning_scan=None):
+	"""
+	Reply for a scan that was journaled but not written yet (fast-ack mode).
+	first_scan/morning_scan are what this host has already journaled for the student today.
+	"""
+	if session is None:
+		return _outside_window_payload(student, scan_datetime)
+	if first_scan is not None:
+		return _already_scanned_payload(student, scan_datetime, session, first_scan)
+	if session == 'morning':
+		payload = _morning_payload(student, scan_datetime, is_late_scan(scan_datetime, student.grade_level))
+	elif morning_scan is not None:
+		payload = _afternoon_payload(student, scan_datetime, morning_scan)
+	else:
+		# The morning scan may have gone through another gate - greet and let the drainer decide
+		payload = _afternoon_payload(student, scan_datetime, scan_datetime)
+		payload.pop('morning_scan')
+	payload['queued'] = True
+	return payload
+
+
+def process_scan(card_uid, device_id, timestamp_str, timer=NULL_TIMER):
+	"""Handle a single gate scan; returns (payload, http_status)"""
+	scan_datetime = parse_scan_datetime(timestamp_str)
+	if not card_uid:
+		log_scan('missing_card', card_uid, device_id, scan_datetime)
+		return error_payload('Card UID is required', 'Lỗi: Không có thẻ'), 400
+
+	# Find student by Card UID (served from the in-process roster cache)
+	student = get_student_card(card_uid)
+	if student is None:
+		log_scan('unknown_card', card_uid, device_id, scan_datetime)
+		return error_payload('Card not found or inactive', 'Thẻ không hợp lệ'), 404
+
+	# Get current academic year
+	try:
+		academic_year = get_active_academic_year()
+	except AcademicYear.DoesNotExist:
+		log_scan('no_academic_year', card_uid, device_id, scan_datetime, student.student_id)
+		return error_payload('No active academic year', 'Lỗi hệ thống'), 400
+
+	scan_date = scan_datetime.date()
+	timer.mark('lookup')
+
+	# Determine if this is morning or afternoon scan
+	session = scan_session(scan_datetime, student.grade_level)
+	if session is None:
+		log_scan('outside_window', card_uid, device_id, scan_datetime, student.student_id, academic_year.academic_year_id)
+		return _outside_window_payload(student, scan_datetime), 200
+
+	# Check for excused absence (per-day index, no query once the day is loaded)
+	excused = excuse_for_day(student.student_id, scan_date)
+	timer.mark('excuse')
+	if excused:
+		log_scan('excused', card_uid, device_id, scan_datetime, student.student_id, academic_year.academic_year_id, session)
+		return _excused_payload(student, scan_datetime, excused), 200
+
+	payload, outcome = record_scan(student, academic_year, card_uid, device_id, scan_datetime, session)
+	timer.mark('upsert')
+	log_scan(outcome, card_uid, device_id, scan_datetime, student.student_id, academic_year.academic_year_id, session)
+	return payload, 200
+
+
+def process_scan_batch(events):
+	"""
+	Handle a buffered list of gate scans from one reader.
+
+	Students are resolved together and excuses come from the per-day index; every
+	scan is then written with the same single-statement upsert as the single
+	endpoint, all inside one transaction. Returns one (payload, http_status)
+	per event, in the order received.
+	"""
+	results = [None] * len(events)
+	scans = []
+	# (outcome, card_uid, device_id, scan_datetime, student_id, academic_year_id, session), logged once committed
+	taps = []
+
+	def device_of(event):
+		return (event.get('device_id') if isinstance(event, dict) else None) or DEFAULT_DEVICE_ID
+
+	for index, event in enumerate(events):
+		if not isinstance(event, dict) or not event.get('card_uid'):
+			results[index] = (error_payload('Card UID is required', 'Lỗi: Không có thẻ'), 400)
+			timestamp = event.get('timestamp') if isinstance(event, dict) else None
+			taps.append(('missing_card', None, device_of(event), parse_scan_datetime(timestamp), None, None, None))
+			continue
+		scans.append((index, event))
+
+	cards = get_student_cards([event['card_uid'] for index, event in scans])
+
+	try:
+		academic_year = get_active_academic_year()
+	except AcademicYear.DoesNotExist:
+		academic_year = None
+
+	pending = []
+	for index, event in scans:
+		scan_datetime = parse_scan_datetime(event.get('timestamp'))
+		tap = (event['card_uid'], device_of(event), scan_datetime)
+		student = cards.get(event['card_uid'])
+		if student is None:
+			results[index] = (error_payload('Card not found or inactive', 'Thẻ không hợp lệ'), 404)
+			taps.append(('unknown_card', *tap, None, None, None))
+			continue
+		if academic_year is None:
+			results[index] = (error_payload('No active academic year', 'Lỗi hệ thống'), 400)
+			taps.append(('no_academic_year', *tap, student.student_id, None, None))
+			continue
+
+		session = scan_session(scan_datetime, student.grade_level)
+		if session is None:
+			results[index] = (_outside_window_payload(student, scan_datetime), 200)
+			taps.append(('outside_window', *tap, student.student_id, academic_year.academic_year_id, None))
+			continue
+
+		pending.append((index, tap, student, scan_datetime, session))
+
+	if pending:
+		with transaction.atomic(using=router.db_for_write(Attendance)):
+			for index, tap, student, scan_datetime, session in pending:
+				excused = excuse_for_day(student.student_id, scan_datetime.date())
+				if excused:
+					results[index] = (_excused_payload(student, scan_datetime, excused), 200)
+					taps.append(('excused', *tap, student.student_id, academic_year.academic_year_id, session))
+					continue
+
+				card_uid, device_id, _ = tap
+				payload, outcome = record_scan(student, academic_year, card_uid, device_id, scan_datetime, session)
+				results[index] = (payload, 200)
+				taps.append((outcome, *tap, student.student_id, academic_year.academic_year_id, session))
+
+	for tap in taps:
+		log_scan(*tap)
+	return results
+
+
+def _process_scan_in_thread(card_uid, device_id, timestamp_str, timer):
+	# Worker threads don't see request_finished, so honour CONN_MAX_AGE here
+	close_old_connections()
+	timer.mark('dispatch')
+	try:
+		return process_scan(card_uid, device_id, timestamp_str, timer)
+	finally:
+		close_old_connections()
+
+
+async def aprocess_scan(card_uid, device_id, timestamp_str, timer=NULL_TIMER):
+	"""
+	Async entry point for the ASGI scan view.
+
+	Django's async ORM methods (aget, afirst, ...) hand every query to a single
+	thread-sensitive executor, which serialises all scans in the process. The
+	whole scan instead runs as one hop on the shared thread pool, so concurrent
+	taps wait on the database in parallel while the event loop keeps the
+	connections open.
+	"""
+	return await sync_to_async(_process_scan_in_thread, thread_sensitive=False)(
+		card_uid, device_id, timestamp_str, timer
+	)
@@ -0,0 +1,58 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Students, Class, AcademicYear, ExcusedAbsence, SchoolPeriod, ScanWindowOverride, Device
+from .utils.roster_cache import invalidate_roster
+from .utils.academic_year import invalidate_academic_year
+from .utils.excuse_index import invalidate_excuses
+from .utils.scan_policy import invalidate_scan_policy
+from .utils.device_keys import invalidate_device_keys
+from .utils.class_stats import recount_roster
+from .utils.dashboard_stats import attendance_changed
+
+
+@receiver([post_save, post_delete], sender=Students)
+@receiver([post_save, post_delete], sender=Class)
+def roster_changed(sender, **kwargs):
+	"""Card lookups carry student and class data, so reload them on any change"""
+	invalidate_roster()
+
+
+@receiver([post_save, post_delete], sender=Students)
+def class_roster_changed(sender, instance, **kwargs):
+	"""Recount active and excused students on the class's counters from today on (a class move is left to reconcile)"""
+	if instance.student_class_id is not None:
+		recount_roster([instance.student_class_id], timezone.localdate())
+		attendance_changed(instance.student_class_id)
+
+
+@receiver([post_save, post_delete], sender=AcademicYear)
+def academic_year_changed(sender, **kwargs):
+	"""The active year changed (or was renamed) - class labels on cached cards change with it"""
+	invalidate_academic_year()
+	invalidate_roster()
+
+
+@receiver([post_save, post_delete], sender=ExcusedAbsence)
+def excuses_changed(sender, instance, **kwargs):
+	"""Excuses are created, approved, rejected and cancelled through saves/deletes"""
+	invalidate_excuses()
+	# The student may be going away with the excuse (cascade), so don't follow instance.student
+	class_id = Students.objects.filter(student_id=instance.student_id).values_list('student_class_id', flat=True).first()
+	if class_id is not None:
+		recount_roster([class_id], instance.start_date, instance.end_date)
+		attendance_changed(class_id)
+
+
+@receiver([post_save, post_delete], sender=SchoolPeriod)
+@receiver([post_save, post_delete], sender=ScanWindowOverride)
+def scan_policy_changed(sender, **kwargs):
+	"""Bell times or gate hours changed - recompile the scan windows"""
+	invalidate_scan_policy()
+
+
+@receiver([post_save, post_delete], sender=Device)
+def devices_changed(sender, **kwargs):
+	"""A reader was added, disabled or given a new secret"""
+	invalidate_device_keys()
@@ -1,3 +1,191 @@
-from django.test import TestCase
+import json
+from datetime import date, time
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.utils import timezone
+
+from .models import AcademicYear, Attendance, Class, ClassDailyStats, SchoolPeriod, ScanWindowOverride, Students
+from .scan_service import DEFAULT_DEVICE_ID
+from .utils import scan_dedup
+from .utils.class_stats import count_classes
+from .utils.scan_policy import get_scan_policy
+
+
+SCAN_URL = '/api/attendance-scan/'
+ASYNC_SCAN_URL = '/api/attendance-scan/async/'
+BATCH_URL = '/api/attendance-scan/batch/'
+
+# A Monday; without SchoolPeriod rows the default windows apply (late after 07:00)
+SCAN_DAY = date(2025, 10, 6)
+
+
+@override_settings(SCAN_EVENT_LOG=False, SCAN_FAST_ACK=False)
+class ScanTestCase(TestCase):
+    """A class of three students in the active year, with the shared caches emptied"""
+
+    def setUp(self):
+        cache.clear()
+        self.academic_year = AcademicYear.objects.create(academic_start_year='2025', academic_end_year='2026')
+        self.class_obj = Class.objects.create(class_name='6A1', grade_level=6, academic_year=self.academic_year)
+        self.students = [
+            Students.objects.create(
+                student_card_uid=f'CARD{i:04d}',
+                student_full_name=f'Nguyễn Văn An {i}',
+                student_class=self.class_obj,
+                to_number=1,
+                seat_number=i,
+            )
+            for i in range(3)
+        ]
+
+    def scan(self, card_uid, scan_time, **extra):
+        body = {'card_uid': card_uid, 'device_id': 'ESP32_GATE_001', 'timestamp': f'{SCAN_DAY} {scan_time}'}
+        body.update(extra)
+        return Client().post(SCAN_URL, json.dumps(body), content_type='application/json')
+
+
+class ClassDailyStatsTests(ScanTestCase):
+    def stats(self):
+        return ClassDailyStats.objects.filter(class_obj=self.class_obj, stats_date=SCAN_DAY).values(
+            'morning_scanned', 'afternoon_scanned', 'late', 'excused', 'total_active'
+        ).get()
+
+    def assertMatchesRecount(self):
+        self.assertEqual(self.stats(), count_classes([self.class_obj.class_id], SCAN_DAY)[str(self.class_obj.class_id)])
+
+    def test_afternoon_scan_replaces_late_status(self):
+        self.assertEqual(self.scan('CARD0000', '07:20:00').json()['status'], 'success')
+        self.assertEqual(self.stats()['late'], 1)
+        self.assertMatchesRecount()
+
+        self.scan('CARD0000', '13:25:00')
+        stats = self.stats()
+        self.assertEqual(stats['late'], 0)
+        self.assertEqual(stats['afternoon_scanned'], 1)
+        self.assertMatchesRecount()
+
+    def test_afternoon_scan_keeps_other_students_late(self):
+        self.scan('CARD0000', '07:20:00')
+        self.scan('CARD0001', '07:30:00')
+        self.scan('CARD0000', '13:25:00')
+        self.assertEqual(self.stats()['late'], 1)
+        self.assertMatchesRecount()
+
+    def test_on_time_student_afternoon_scan(self):
+        self.scan('CARD0002', '06:45:00')
+        self.scan('CARD0002', '13:20:00')
+        stats = self.stats()
+        self.assertEqual((stats['morning_scanned'], stats['afternoon_scanned'], stats['late']), (1, 1, 0))
+        self.assertMatchesRecount()
+
+    def test_afternoon_scan_without_morning_is_not_counted(self):
+        self.assertEqual(self.scan('CARD0002', '13:20:00').json()['status'], 'warning')
+        self.assertFalse(ClassDailyStats.objects.filter(afternoon_scanned__gt=0).exists())
+
+
+class MalformedScanBodyTests(ScanTestCase):
+    BODIES = ('[1, 2]', '"CARD0000"', '42', '{"card_uid": ["CARD0000"]}', '{"card_uid": "CARD0000", "device_id": 7}')
+
+    def test_single_endpoint_answers_400(self):
+        for body in self.BODIES:
+            with self.subTest(body=body):
+                response = Client().post(SCAN_URL, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+        self.assertFalse(Attendance.objects.exists())
+
+    async def test_async_endpoint_answers_400(self):
+        for body in self.BODIES:
+            with self.subTest(body=body):
+                response = await AsyncClient().post(ASYNC_SCAN_URL, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+
+    def test_invalid_json_answers_400(self):
+        response = Client().post(SCAN_URL, '{"card_uid": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ScanReplayTests(ScanTestCase):
+    def test_event_without_device_uses_default_device(self):
+        event = {'card_uid': 'CARD0000', 'timestamp': '2025-10-06 06:30:00'}
+        self.assertEqual(scan_dedup.scan_event_key(event), scan_dedup.scan_event_key(event, DEFAULT_DEVICE_ID))
+        self.assertEqual(scan_dedup.scan_event_key(event), scan_dedup.scan_event_key(dict(event, device_id='')))
+
+    def test_event_id_takes_precedence_over_tap(self):
+        first = scan_dedup.scan_event_key({'card_uid': 'CARD0000', 'timestamp': '2025-10-06 06:30:00', 'event_id': 'e1'})
+        retry = scan_dedup.scan_event_key({'card_uid': 'CARD0000', 'timestamp': '2025-10-06 06:30:09', 'event_id': 'e1'})
+        self.assertEqual(first, retry)
+        self.assertIsNone(scan_dedup.scan_event_key({'card_uid': 'CARD0000'}))
+        self.assertNotEqual(first, scan_dedup.scan_event_key({'event_id': 'e1'}, 'ESP32_GATE_002'))
+
+    @override_settings(SCAN_DEDUP_WINDOW=0)
+    def test_zero_window_disables_keys(self):
+        self.assertIsNone(scan_dedup.scan_event_key({'event_id': 'e1'}))
+
+    def test_claim_answers_duplicates_until_released(self):
+        key = scan_dedup.scan_event_key({'event_id': 'e1'})
+        self.assertIsNone(scan_dedup.claim(key))
+        self.assertEqual(scan_dedup.claim(key), scan_dedup.IN_PROGRESS)
+        scan_dedup.remember(key, {'status': 'success'}, 200)
+        self.assertEqual(scan_dedup.claim(key), ({'status': 'success'}, 200))
+
+    def test_errors_release_the_claim(self):
+        key = scan_dedup.scan_event_key({'event_id': 'e2'})
+        self.assertIsNone(scan_dedup.claim(key))
+        scan_dedup.remember(key, {'status': 'error'}, 404)
+        self.assertIsNone(scan_dedup.claim(key))
+
+    def test_retried_tap_gets_the_first_answer(self):
+        first = self.scan('CARD0000', '06:30:00')
+        retry = self.scan('CARD0000', '06:30:00')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(timezone.localtime(Attendance.objects.get().morning_gate_scan_time).time(), time(6, 30))
+
+    def test_single_and_batch_share_keys_without_device(self):
+        event = {'card_uid': 'CARD0001', 'timestamp': f'{SCAN_DAY} 06:40:00'}
+        first = Client().post(SCAN_URL, json.dumps(event), content_type='application/json').json()
+        batch = Client().post(BATCH_URL, json.dumps([event]), content_type='application/json').json()
+        # Batch results also carry their own http_status
+        self.assertEqual(batch['results'][0], dict(first, http_status=200))
+
+
+class ScanPolicyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_defaults_without_bell_schedule(self):
+        policy = get_scan_policy(1)
+        self.assertEqual(policy.session(time(6, 0)), 'morning')
+        self.assertEqual(policy.session(time(11, 0)), 'morning')
+        self.assertIsNone(policy.session(time(12, 0)))
+        self.assertEqual(policy.session(time(20, 0)), 'afternoon')
+        self.assertFalse(policy.is_late(time(7, 0)))
+        self.assertTrue(policy.is_late(time(7, 0, 1)))
+
+    @override_settings(SCAN_WINDOW_LEAD_MINUTES=30)
+    def test_windows_follow_the_bell_schedule(self):
+        SchoolPeriod.objects.create(period_number=1, period_name='Tiết 1', start_time=time(7, 15), end_time=time(8, 0))
+        SchoolPeriod.objects.create(period_number=5, period_name='Tiết 5', start_time=time(10, 30), end_time=time(11, 15))
+        SchoolPeriod.objects.create(period_number=6, period_name='Tiết 6', start_time=time(13, 30), end_time=time(14, 15))
+        windows = get_scan_policy(1).windows
+        self.assertEqual(windows['morning_start'], time(6, 45))
+        self.assertEqual(windows['late_cutoff'], time(7, 15))
+        self.assertEqual(windows['morning_end'], time(11, 15))
+        self.assertEqual(windows['afternoon_start'], time(13, 0))
+        self.assertEqual(windows['afternoon_end'], time(14, 15))
+
+    def test_overrides_apply_by_weekday_and_grade(self):
+        ScanWindowOverride.objects.create(day_of_week=6, late_cutoff=time(7, 30))
+        ScanWindowOverride.objects.create(day_of_week=6, grade_level=9, late_cutoff=time(7, 45))
+        self.assertEqual(get_scan_policy(1).windows['late_cutoff'], time(7, 0))
+        self.assertEqual(get_scan_policy(6).windows['late_cutoff'], time(7, 30))
+        self.assertEqual(get_scan_policy(6, 9).windows['late_cutoff'], time(7, 45))
+
+    def test_out_of_order_override_is_skipped(self):
+        # save() skips clean(), as a bulk import would
+        ScanWindowOverride.objects.create(day_of_week=2, late_cutoff=time(12, 0))
+        with self.assertLogs('attendance.utils.scan_policy', 'ERROR'):
+            policy = get_scan_policy(2)
+        self.assertEqual(policy.windows['late_cutoff'], time(7, 0))
@@ -17,6 +17,7 @@ urlpatterns = [
 	path('teacher/student/<uuid:student_id>/', views.teacher_student_detail, name='teacher_student_detail'),
 	path('teacher/history/', views.teacher_attendance_history, name='teacher_attendance_history'),
 	path('api/teacher/dashboard-stats/', api_views.teacher_dashboard_stats, name='teacher_dashboard_stats'),
+	path('api/teacher/dashboard-stream/', api_views.teacher_dashboard_stream, name='teacher_dashboard_stream'),
 	
 	# Teacher actions
 	path('teacher/mark-attendance/<uuid:student_id>/', views.teacher_mark_attendance, name='teacher_mark_attendance'),
@@ -55,4 +56,7 @@ urlpatterns = [
 	
 	# API
 	path('api/attendance-scan/', api_views.attendance_scan, name='attendance_scan'),
+	path('api/attendance-scan/async/', api_views.attendance_scan_async, name='attendance_scan_async'),
+	path('api/attendance-scan/batch/', api_views.attendance_scan_batch, name='attendance_scan_batch'),
+	path('metrics', api_views.scan_metrics, name='scan_metrics'),
 ]
@@ -0,0 +1,44 @@
+from ..models import AcademicYear
+from .cache_version import get_version, bump_version
+import threading
+
+
+ACADEMIC_YEAR_VERSION = 'academic_year'
+
+_lock = threading.Lock()
+_cached_version = None
+_cached_years = None
+
+
+def get_active_academic_year():
+	"""
+	Return the active AcademicYear, cached per process until an AcademicYear is saved or deleted
+	(or for LOCAL_CACHE_TTL seconds; see cache_version.py).
+	Raises AcademicYear.DoesNotExist or MultipleObjectsReturned like AcademicYear.objects.get() would.
+	"""
+	global _cached_version, _cached_years
+
+	version = get_version(ACADEMIC_YEAR_VERSION)
+	with _lock:
+		if _cached_version == version:
+			years = _cached_years
+		else:
+			# Two are enough to tell that more than one year is marked active
+			years = list(AcademicYear.objects.filter(academic_year_active_status=True).order_by('pk')[:2])
+			_cached_version = version
+			_cached_years = years
+
+	if not years:
+		raise AcademicYear.DoesNotExist('No active academic year')
+	if len(years) > 1:
+		raise AcademicYear.MultipleObjectsReturned('More than one academic year is marked active')
+	return years[0]
+
+
+def invalidate_academic_year():
+	"""Make every process re-read the active academic year"""
+	global _cached_version
+
+	bump_version(ACADEMIC_YEAR_VERSION)
+	with _lock:
+		_cached_version = None
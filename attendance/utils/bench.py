@@ -0,0 +1,49 @@
+import json
+
+from ..scan_profiles import STATUS_CODES
+
+
+# Outcome suffix of a response that isn't a scan reply (a redirect, an HTML error page, ...)
+UNPARSED = ':unparsed'
+
+
+def percentile(sorted_samples, pct):
+	"""Nearest-rank percentile of an already sorted list"""
+	if not sorted_samples:
+		return None
+	rank = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples)) - 1))
+	return sorted_samples[rank]
+
+
+def latency_summary(samples_ms, elapsed_s, errors=0):
+	"""Throughput and latency percentiles for a benchmark run, ready for json.dumps"""
+	samples = sorted(samples_ms)
+	return {
+		'requests': len(samples),
+		'errors': errors,
+		'elapsed_s': round(elapsed_s, 3),
+		'requests_per_s': round(len(samples) / elapsed_s, 1) if elapsed_s else None,
+		'p50_ms': round(percentile(samples, 50), 2) if samples else None,
+		'p95_ms': round(percentile(samples, 95), 2) if samples else None,
+		'p99_ms': round(percentile(samples, 99), 2) if samples else None,
+		'max_ms': round(samples[-1], 2) if samples else None,
+	}
+
+
+def scan_outcome(status_code, content):
+	"""'<http status>:<payload status>' so duplicates and late taps show up separately"""
+	try:
+		payload = json.loads(content)
+	except ValueError:
+		return f'{status_code}{UNPARSED}'
+	if not isinstance(payload, dict):
+		return f'{status_code}{UNPARSED}'
+	if 's' in payload:
+		codes = {code: name for name, code in STATUS_CODES.items()}
+		return f'{status_code}:{codes.get(payload["s"], payload["s"])}'
+	return f'{status_code}:{payload.get("status")}'
+
+
+def unparsed_outcomes(outcomes):
+	"""The outcomes of responses that never reached the scan view"""
+	return {outcome: count for outcome, count in outcomes.items() if outcome.endswith(UNPARSED)}
@@ -0,0 +1,76 @@
+"""
+Version counters for the in-process caches (roster, academic year, excuses,
+scan policy, device keys) and the per-class dashboard versions.
+
+The counters live in Django's default cache, so a bump in one worker reaches
+the others only when CACHES is shared (CACHE_URL; see settings.py and the
+attendance.W001 check). As a fallback every version also rolls over each
+LOCAL_CACHE_TTL seconds, so a process that never sees a bump still reloads
+within that time.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import time
+
+
+# Backends whose data stays inside one process
+LOCAL_BACKENDS = (
+	'django.core.cache.backends.locmem.LocMemCache',
+	'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _version_key(name):
+	return f'attendance:version:{name}'
+
+
+def _seed():
+	# Start from the clock so a version evicted from the cache never goes backwards
+	return int(time.time() * 1000)
+
+
+def cache_is_shared():
+	"""True when every worker process sees the same default cache"""
+	if getattr(settings, 'WEB_CONCURRENCY', 1) <= 1:
+		return True
+	return settings.CACHES['default']['BACKEND'] not in LOCAL_BACKENDS
+
+
+def _stamp(version):
+	ttl = getattr(settings, 'LOCAL_CACHE_TTL', 60)
+	if not ttl:
+		return version
+	return f'{version}.{int(time.time() // ttl)}'
+
+
+def _current(name):
+	key = _version_key(name)
+	version = cache.get(key)
+	if version is None:
+		cache.add(key, _seed(), timeout=None)
+		version = cache.get(key)
+	return version
+
+
+def get_version(name):
+	"""Current version of a named in-process cache; compare it for equality only"""
+	return _stamp(_current(name))
+
+
+def bump_version(name):
+	"""Invalidate every process' copy of a named cache"""
+	key = _version_key(name)
+	try:
+		return cache.incr(key)
+	except ValueError:
+		cache.add(key, _seed(), timeout=None)
+		return cache.get(key)
+
+
+def get_versions(names):
+	"""Current versions of several named caches in one cache round trip"""
+	found = cache.get_many([_version_key(name) for name in names])
+	return {
+		name: _stamp(found.get(_version_key(name)) or _current(name))
+		for name in names
+	}
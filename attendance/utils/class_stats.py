@@ -0,0 +1,167 @@
+"""
+Per-class daily counters (ClassDailyStats).
+
+Dashboards read a class's numbers for the day from its (class, date) row
+instead of counting Attendance through the student joins. The scan counters
+and `late` move with F() increments inside the transaction that changed the
+Attendance row (record_scan, teacher_mark_attendance); `excused` and
+`total_active` are recounted for the class when one of its students or
+excuses changes (see attendance/signals.py).
+
+A day's rows are created by `manage.py prepare_day`, or by the first change
+of the day, from a full count. `manage.py reconcile_class_stats` recounts
+them and repairs any drift (e.g. a teacher's 'late' overwritten by a scan).
+"""
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, FilteredRelation, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import ClassDailyStats, ExcusedAbsence, Students
+
+
+# Old manual status and the gate scan status
+LATE_STATUSES = ('late', 'late_arrival')
+COUNTERS = ['morning_scanned', 'afternoon_scanned', 'late', 'excused', 'total_active']
+
+
+def _excuses_on(day):
+	"""Approved excuses of active students covering `day` (a date or an OuterRef)"""
+	return ExcusedAbsence.objects.filter(
+		student__student_active_status=True,
+		approved_by_homeroom=True,
+		start_date__lte=day,
+		end_date__gte=day,
+	).order_by()
+
+
+def count_classes(class_ids, day, using=None):
+	"""{str(class_id): counters} counted from Attendance, Students and ExcusedAbsence"""
+	counts = {str(class_id): dict.fromkeys(COUNTERS, 0) for class_id in class_ids}
+	if not counts:
+		return counts
+
+	rows = Students.objects.using(using).filter(student_class_id__in=class_ids).annotate(
+		today=FilteredRelation('attendances', condition=Q(attendances__check_in_date=day))
+	).order_by().values('student_class_id').annotate(
+		total_active=Count('student_id', filter=Q(student_active_status=True)),
+		morning_scanned=Count('today__attendance_id', filter=Q(today__morning_gate_scan_time__isnull=False)),
+		afternoon_scanned=Count('today__attendance_id', filter=Q(today__afternoon_gate_scan_time__isnull=False)),
+		late=Count('today__attendance_id', filter=Q(today__status__in=LATE_STATUSES)),
+	)
+	for row in rows:
+		counts[str(row.pop('student_class_id'))].update(row)
+
+	excused = _excuses_on(day).using(using).filter(
+		student__student_class_id__in=class_ids
+	).values('student__student_class_id').annotate(students=Count('student_id', distinct=True))
+	for row in excused:
+		counts[str(row['student__student_class_id'])]['excused'] = row['students']
+	return counts
+
+
+def get_class_stats(class_ids, day):
+	"""{str(class_id): counters} from the day's rows; classes without a row yet are counted"""
+	stats = {
+		str(row.pop('class_obj_id')): row
+		for row in ClassDailyStats.objects.filter(class_obj_id__in=class_ids, stats_date=day).values(
+			'class_obj_id', *COUNTERS
+		)
+	}
+	missing = [class_id for class_id in class_ids if str(class_id) not in stats]
+	if missing:
+		stats.update(count_classes(missing, day))
+	return stats
+
+
+def _create_row(class_id, day, using):
+	"""Insert a counted row; False if another transaction got there first"""
+	try:
+		with transaction.atomic(using=using):
+			ClassDailyStats.objects.using(using).create(
+				class_obj_id=class_id, stats_date=day, **count_classes([class_id], day, using)[str(class_id)]
+			)
+		return True
+	except IntegrityError:
+		return False
+
+
+def add_counts(class_id, day, using=None, **deltas):
+	"""Apply counter deltas to a class's row for the day; call inside the transaction that changed Attendance"""
+	deltas = {field: delta for field, delta in deltas.items() if delta}
+	if class_id is None or not deltas:
+		return
+	using = using or router.db_for_write(ClassDailyStats)
+	rows = ClassDailyStats.objects.using(using).filter(class_obj_id=class_id, stats_date=day)
+	increments = {field: F(field) + delta for field, delta in deltas.items()}
+	if rows.update(**increments):
+		return
+	# No row yet: the count sees this transaction's own write, so it already includes the change
+	if not _create_row(class_id, day, using):
+		rows.update(**increments)
+
+
+def recount_roster(class_ids, since, until=None):
+	"""Recount total_active and excused on the rows of these classes dated since..until"""
+	rows = ClassDailyStats.objects.filter(class_obj_id__in=class_ids, stats_date__gte=since)
+	if until is not None:
+		rows = rows.filter(stats_date__lte=until)
+	active = Students.objects.filter(
+		student_class_id=OuterRef('class_obj_id'), student_active_status=True
+	).order_by().values('student_class_id').annotate(students=Count('student_id')).values('students')
+	excused = _excuses_on(OuterRef('stats_date')).filter(
+		student__student_class_id=OuterRef('class_obj_id')
+	).values('student__student_class_id').annotate(
+		students=Count('student_id', distinct=True)
+	).values('students')
+	return rows.update(
+		total_active=Coalesce(Subquery(active), 0),
+		excused=Coalesce(Subquery(excused), 0),
+	)
+
+
+def prepare_class_days(class_ids, day):
+	"""Create the day's missing rows from a full count; returns how many were missing"""
+	existing = {
+		str(class_id) for class_id in
+		ClassDailyStats.objects.filter(class_obj_id__in=class_ids, stats_date=day).values_list('class_obj_id', flat=True)
+	}
+	missing = [class_id for class_id in class_ids if str(class_id) not in existing]
+	counts = count_classes(missing, day)
+	# A scan may create a row meanwhile; its count wins
+	ClassDailyStats.objects.bulk_create([
+		ClassDailyStats(class_obj_id=class_id, stats_date=day, **counts[str(class_id)])
+		for class_id in missing
+	], ignore_conflicts=True)
+	return len(missing)
+
+
+def reconcile_day(class_ids, day, create=True):
+	"""
+	Recount the day's rows and fix the ones that drifted; returns (created, repaired).
+	Classes without a row get one unless `create` is False.
+	The rows are locked first, so scans committing meanwhile either are in the
+	count or apply their increment after it.
+	"""
+	with transaction.atomic():
+		rows = {
+			str(row.class_obj_id): row
+			for row in ClassDailyStats.objects.select_for_update().filter(class_obj_id__in=class_ids, stats_date=day)
+		}
+		counts = count_classes(class_ids, day)
+		repaired = []
+		now = timezone.now()
+		for class_id, row in rows.items():
+			expected = counts[class_id]
+			if any(getattr(row, field) != value for field, value in expected.items()):
+				for field, value in expected.items():
+					setattr(row, field, value)
+				row.updated_at = now
+				repaired.append(row)
+		ClassDailyStats.objects.bulk_update(repaired, COUNTERS + ['updated_at'])
+		created = [
+			ClassDailyStats(class_obj_id=class_id, stats_date=day, **counts[str(class_id)])
+			for class_id in class_ids if create and str(class_id) not in rows
+		]
+		ClassDailyStats.objects.bulk_create(created, ignore_conflicts=True)
+	return len(created), len(repaired)
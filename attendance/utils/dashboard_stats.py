@@ -0,0 +1,99 @@
+"""
+Today's gate-scan numbers for the teacher dashboard.
+
+The counts are the sum of the classes' ClassDailyStats rows for the day (see
+class_stats.py), and the recent-scans feed comes from the classes' ring
+buffers in the cache (see recent_scans.py). The result is kept in Django's cache for
+DASHBOARD_STATS_TTL seconds under the dashboard's ETag, so every teacher
+polling the same classes shares one computation.
+
+Each class has an attendance version that gate scans and the teacher
+mark/verify endpoints bump (attendance_changed). The ETag is built from the
+date and the versions of the dashboard's classes alone, so an unchanged poll
+is answered with 304 before anything is aggregated. That needs the versions in
+a cache every worker shares; on a process-local cache the endpoint sends no
+ETag. Stats are computed on the primary and never cached from a replica.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router
+import hashlib
+
+from ..models import ClassDailyStats
+from .class_stats import get_class_stats
+from .recent_scans import get_recent_scans
+from .cache_version import get_versions, bump_version
+
+
+KEY_PREFIX = 'attendance:dashboard-stats:'
+RECENT_SCANS = 10
+
+EMPTY_STATS = {
+	'total_students': 0,
+	'present_count': 0,
+	'late_count': 0,
+	'absent_count': 0,
+	'excused_count': 0,
+	'morning_scanned': 0,
+	'afternoon_scanned': 0,
+	'recent_scans': [],
+}
+
+
+def _cache():
+	return caches[getattr(settings, 'DASHBOARD_STATS_CACHE', 'default')]
+
+
+def _class_version(class_id):
+	return f'class-attendance:{class_id}'
+
+
+def attendance_changed(class_id):
+	"""Called when a student of this class gets scanned, marked or verified"""
+	if class_id is not None:
+		bump_version(_class_version(class_id))
+
+
+def dashboard_etag(class_ids, day):
+	"""Quoted ETag for the stats of these classes on a day; changes whenever one of them does"""
+	class_ids = sorted(str(class_id) for class_id in class_ids)
+	versions = get_versions([_class_version(class_id) for class_id in class_ids])
+	state = ','.join(f'{class_id}:{versions[_class_version(class_id)]}' for class_id in class_ids)
+	return '"%s"' % hashlib.sha1(f'{day.isoformat()}|{state}'.encode()).hexdigest()
+
+
+def _counts(class_ids, day):
+	classes = get_class_stats(class_ids, day).values()
+	return {
+		'total_students': sum(counters['total_active'] for counters in classes),
+		'morning_scanned': sum(counters['morning_scanned'] for counters in classes),
+		'afternoon_scanned': sum(counters['afternoon_scanned'] for counters in classes),
+		'late_count': sum(counters['late'] for counters in classes),
+		'excused_count': sum(counters['excused'] for counters in classes),
+	}
+
+
+def compute_dashboard_stats(class_ids, day):
+	if not class_ids:
+		return dict(EMPTY_STATS)
+	stats = _counts(class_ids, day)
+	stats['present_count'] = stats['morning_scanned']  # Consider morning scan as "present"
+	# Absent = total students - students who scanned morning
+	stats['absent_count'] = stats['total_students'] - stats['morning_scanned']
+	stats['recent_scans'] = get_recent_scans(class_ids, day, getattr(settings, 'DASHBOARD_RECENT_SCANS', RECENT_SCANS))
+	return stats
+
+
+def get_dashboard_stats(class_ids, day, etag=None):
+	"""Stats for a set of classes on a day, shared through the cache for a few seconds"""
+	ttl = getattr(settings, 'DASHBOARD_STATS_TTL', 5)
+	if not ttl or not class_ids or router.db_for_read(ClassDailyStats) != DEFAULT_DB_ALIAS:
+		# Numbers read from a lagging replica must not be stored under the current version
+		return compute_dashboard_stats(class_ids, day)
+
+	key = KEY_PREFIX + (etag or dashboard_etag(class_ids, day)).strip('"')
+	stats = _cache().get(key)
+	if stats is None:
+		stats = compute_dashboard_stats(class_ids, day)
+		_cache().set(key, stats, ttl)
+	return stats
@@ -0,0 +1,48 @@
+"""
+Device id -> signing secret for gate request verification.
+
+All active Device rows are loaded in one query the first time a reader
+signs a request and kept in process memory, so verifying a scan costs no
+database reads. Saving or deleting a Device (see attendance/signals.py) bumps
+the version and every process reloads on its next request (within
+LOCAL_CACHE_TTL when CACHES isn't shared; see cache_version.py).
+"""
+import threading
+
+from ..models import Device
+from .cache_version import get_version, bump_version
+
+
+DEVICES_VERSION = 'devices'
+
+_lock = threading.Lock()
+_secrets = {}
+_loaded_version = None
+
+
+def _warm(version):
+	global _loaded_version
+
+	_secrets.clear()
+	for device_id, secret in Device.objects.filter(is_active=True).values_list('device_id', 'secret'):
+		_secrets[device_id] = secret.encode()
+	_loaded_version = version
+
+
+def get_device_secret(device_id):
+	"""HMAC key (bytes) of an active device, or None for unknown and disabled devices"""
+	version = get_version(DEVICES_VERSION)
+	with _lock:
+		if _loaded_version != version:
+			_warm(version)
+		return _secrets.get(device_id)
+
+
+def invalidate_device_keys():
+	"""Drop cached keys in this process and every other one"""
+	global _loaded_version
+
+	bump_version(DEVICES_VERSION)
+	with _lock:
+		_secrets.clear()
+		_loaded_version = None
@@ -0,0 +1,122 @@
+"""
+Per-day index of approved excused absences.
+
+Only a handful of students have an excuse on any given day, so instead of
+querying ExcusedAbsence on every gate tap and every period roll call, each
+process loads the day's approved excuses once and answers from a dict keyed by
+student_id. Saving or deleting an ExcusedAbsence (see attendance/signals.py)
+bumps the version, so every process rebuilds the day on its next lookup
+(within LOCAL_CACHE_TTL when CACHES isn't shared; see cache_version.py).
+"""
+from collections import OrderedDict, namedtuple
+import threading
+
+from ..models import ExcusedAbsence
+from .cache_version import get_version, bump_version
+
+
+EXCUSES_VERSION = 'excuses'
+
+# Morning/afternoon split used by ExcusedAbsence.applies_to_period
+LAST_MORNING_PERIOD = 5
+
+# Days kept per process (today plus a few recent/upcoming ones)
+MAX_DAYS = 7
+
+
+class ExcuseEntry(namedtuple('ExcuseEntry', ['excuse_id', 'student_id', 'absence_type', 'periods', 'reason'])):
+	"""Approved excuse as stored in the index; `periods` is only set for specific_periods"""
+	__slots__ = ()
+
+	def applies_to_period(self, period_number):
+		if self.absence_type == 'full_day':
+			return True
+		if self.absence_type == 'morning':
+			return period_number <= LAST_MORNING_PERIOD
+		if self.absence_type == 'afternoon':
+			return period_number > LAST_MORNING_PERIOD
+		if self.absence_type == 'specific_periods':
+			return period_number in self.periods
+		return False
+
+
+_lock = threading.Lock()
+_days = OrderedDict()
+_loaded_version = None
+
+
+def _parse_periods(specific_periods):
+	return frozenset(
+		int(part) for part in (specific_periods or '').split(',')
+		if part.strip().isdigit()
+	)
+
+
+def _load_day(day):
+	"""student_id -> tuple of entries, latest start first like ExcusedAbsence ordering"""
+	index = {}
+	rows = ExcusedAbsence.objects.filter(
+		start_date__lte=day,
+		end_date__gte=day,
+		approved_by_homeroom=True
+	).order_by('-start_date').values_list(
+		'excuse_id', 'student_id', 'absence_type', 'specific_periods', 'reason'
+	)
+	for excuse_id, student_id, absence_type, specific_periods, reason in rows:
+		entry = ExcuseEntry(
+			excuse_id=excuse_id,
+			student_id=student_id,
+			absence_type=absence_type,
+			periods=_parse_periods(specific_periods) if absence_type == 'specific_periods' else None,
+			reason=reason,
+		)
+		index[student_id] = index.get(student_id, ()) + (entry,)
+	return index
+
+
+def get_day_index(day):
+	"""All approved excuses covering `day`, keyed by student_id"""
+	global _loaded_version
+
+	version = get_version(EXCUSES_VERSION)
+	with _lock:
+		if _loaded_version != version:
+			_days.clear()
+			_loaded_version = version
+		index = _days.get(day)
+		if index is not None:
+			_days.move_to_end(day)
+			return index
+
+	index = _load_day(day)
+
+	with _lock:
+		if _loaded_version == version:
+			_days[day] = index
+			while len(_days) > MAX_DAYS:
+				_days.popitem(last=False)
+	return index
+
+
+def excuse_for_day(student_id, day):
+	"""The excuse a gate scan reports for this student on `day`, or None"""
+	entries = get_day_index(day).get(student_id)
+	return entries[0] if entries else None
+
+
+def period_excuse(entries, period_number):
+	"""The first of a student's entries (from get_day_index) covering this period, or None"""
+	for entry in entries:
+		if entry.applies_to_period(period_number):
+			return entry
+	return None
+
+
+def invalidate_excuses():
+	"""Make every process rebuild its excuse index"""
+	global _loaded_version
+
+	bump_version(EXCUSES_VERSION)
+	with _lock:
+		_days.clear()
+		_loaded_version = None
@@ -0,0 +1,40 @@
+from functools import lru_cache
+
+
+# Vietnamese letter -> ASCII letter, lower case; upper case is derived below
+_VIETNAMESE_TO_ASCII = {
+	'à': 'a', 'á': 'a', 'ả': 'a', 'ã': 'a', 'ạ': 'a',
+	'ă': 'a', 'ằ': 'a', 'ắ': 'a', 'ẳ': 'a', 'ẵ': 'a', 'ặ': 'a',
+	'â': 'a', 'ầ': 'a', 'ấ': 'a', 'ẩ': 'a', 'ẫ': 'a', 'ậ': 'a',
+	'đ': 'd',
+	'è': 'e', 'é': 'e', 'ẻ': 'e', 'ẽ': 'e', 'ẹ': 'e',
+	'ê': 'e', 'ề': 'e', 'ế': 'e', 'ể': 'e', 'ễ': 'e', 'ệ': 'e',
+	'ì': 'i', 'í': 'i', 'ỉ': 'i', 'ĩ': 'i', 'ị': 'i',
+	'ò': 'o', 'ó': 'o', 'ỏ': 'o', 'õ': 'o', 'ọ': 'o',
+	'ô': 'o', 'ồ': 'o', 'ố': 'o', 'ổ': 'o', 'ỗ': 'o', 'ộ': 'o',
+	'ơ': 'o', 'ờ': 'o', 'ớ': 'o', 'ở': 'o', 'ỡ': 'o', 'ợ': 'o',
+	'ù': 'u', 'ú': 'u', 'ủ': 'u', 'ũ': 'u', 'ụ': 'u',
+	'ư': 'u', 'ừ': 'u', 'ứ': 'u', 'ử': 'u', 'ữ': 'u', 'ự': 'u',
+	'ỳ': 'y', 'ý': 'y', 'ỷ': 'y', 'ỹ': 'y', 'ỵ': 'y',
+}
+
+
+def _build_table():
+	table = {}
+	for vn_char, ascii_char in _VIETNAMESE_TO_ASCII.items():
+		table[ord(vn_char)] = ascii_char
+		table[ord(vn_char.upper())] = ascii_char.upper()
+	# Text typed in decomposed form (e.g. "a" + U+0301) - dropping the combining
+	# marks leaves the base letter, so one translate() pass covers both forms
+	for mark in range(0x0300, 0x0370):
+		table[mark] = None
+	return table
+
+
+_ASCII_TABLE = _build_table()
+
+
+@lru_cache(maxsize=4096)
+def to_ascii_vietnamese(text):
+	"""Convert Vietnamese characters to ASCII-friendly equivalents for LCD display"""
+	return text.translate(_ASCII_TABLE)
@@ -0,0 +1,135 @@
+"""
+Per-class ring buffer of the day's latest gate scans, for the dashboard feed.
+
+record_scan pushes every recorded scan (push_scan): one atomic incr of the
+class's counter picks the slot, and the event is written to slot
+counter % RECENT_SCANS_BUFFER, so the buffer holds the newest events without
+any read-modify-write. get_recent_scans reads the counters and the slots of
+all the teacher's classes in two cache round trips and never touches
+Attendance, so the feed can be longer than the old 10 rows at no extra cost.
+
+A class whose counter isn't in the cache (first read of the day, eviction,
+restart with the local-memory cache) is loaded once from Attendance and
+seeded; pushes to a class that was never seeded are dropped, since the load
+will find them. The buffers only work when every worker shares the cache
+(cache_is_shared): with several workers on a process-local cache, each
+would see only its own pushes, so the feed is read from Attendance instead.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, F, Value
+from django.utils import timezone
+
+from ..models import Attendance
+from .cache_version import cache_is_shared
+
+
+KEY_PREFIX = 'attendance:recent-scans:'
+# Keys outlive their day a little, for dashboards left open past midnight
+KEY_TIMEOUT = 2 * 24 * 60 * 60
+
+
+def _size():
+	return max(1, getattr(settings, 'RECENT_SCANS_BUFFER', 50))
+
+
+def _counter_key(class_id, day):
+	return f'{KEY_PREFIX}{class_id}:{day.isoformat()}'
+
+
+def _slot_key(class_id, day, sequence):
+	return f'{_counter_key(class_id, day)}:{sequence % _size()}'
+
+
+def scan_event(student_name, class_name, scan_datetime, status, scan_type):
+	return {
+		'student_name': student_name,
+		'class_name': class_name,
+		'time': timezone.localtime(scan_datetime).strftime('%H:%M:%S'),
+		'status': status,
+		'scan_type': scan_type,
+		# Sort key across classes; dropped from the API output
+		'scanned_at': scan_datetime.timestamp(),
+	}
+
+
+def push_scan(class_id, day, event):
+	"""Append a recorded scan to its class's buffer for the day"""
+	if class_id is None or not cache_is_shared():
+		return
+	try:
+		sequence = cache.incr(_counter_key(class_id, day))
+	except ValueError:
+		# Not seeded yet; the first read loads it from Attendance, this scan included
+		return
+	cache.set(_slot_key(class_id, day, sequence), dict(event, sequence=sequence), KEY_TIMEOUT)
+
+
+def _load(class_ids, day):
+	"""The day's scans of these classes from Attendance, newest first, grouped by class"""
+	today = Attendance.objects.filter(student__student_class_id__in=class_ids, check_in_date=day)
+	fields = [
+		'student__student_class_id', 'student__student_full_name', 'student__student_class__class_name',
+		'status', 'scan_time', 'scan_type',
+	]
+
+	def session(field, name):
+		return today.filter(**{f'{field}__isnull': False}).annotate(
+			scan_time=F(field),
+			scan_type=Value(name, output_field=CharField()),
+		).order_by().values_list(*fields)
+
+	rows = session('morning_gate_scan_time', 'morning').union(
+		session('afternoon_gate_scan_time', 'afternoon'), all=True
+	).order_by('-scan_time')
+	events = defaultdict(list)
+	for class_id, student_name, class_name, status, scan_time, scan_type in rows:
+		events[str(class_id)].append(scan_event(student_name, class_name, scan_time, status, scan_type))
+	return events
+
+
+def _seed(class_ids, day):
+	"""Load classes missing from the cache and start their buffers; returns their events"""
+	size = _size()
+	loaded = _load(class_ids, day)
+	for class_id in class_ids:
+		events = loaded[str(class_id)][:size]
+		if not cache.add(_counter_key(class_id, day), len(events), KEY_TIMEOUT):
+			# Another request seeded it meanwhile
+			continue
+		cache.set_many({
+			_slot_key(class_id, day, sequence): dict(event, sequence=sequence)
+			for sequence, event in enumerate(reversed(events), start=1)
+		}, KEY_TIMEOUT)
+	return [event for class_id in class_ids for event in loaded[str(class_id)][:size]]
+
+
+def _strip(events, limit):
+	events.sort(key=lambda event: event['scanned_at'], reverse=True)
+	return [
+		{key: value for key, value in event.items() if key not in ('scanned_at', 'sequence')}
+		for event in events[:limit]
+	]
+
+
+def get_recent_scans(class_ids, day, limit):
+	"""The newest `limit` scans across these classes, from their buffers"""
+	if not cache_is_shared():
+		return _strip([event for events in _load(class_ids, day).values() for event in events], limit)
+
+	size = _size()
+	counters = cache.get_many([_counter_key(class_id, day) for class_id in class_ids])
+	missing = [class_id for class_id in class_ids if _counter_key(class_id, day) not in counters]
+	events = _seed(missing, day) if missing else []
+
+	wanted = {}
+	for class_id in class_ids:
+		last = counters.get(_counter_key(class_id, day))
+		for sequence in range(max(1, (last or 0) - size + 1), (last or 0) + 1):
+			wanted[_slot_key(class_id, day, sequence)] = sequence
+	if wanted:
+		slots = cache.get_many(list(wanted))
+		# A slot already reused by a newer push is skipped; that event was beyond the window
+		events += [event for key, event in slots.items() if event.get('sequence') == wanted[key]]
+	return _strip(events, limit)
@@ -0,0 +1,130 @@
+"""
+Card UID -> student lookup for the gate scan endpoints.
+
+The whole active roster is loaded in one query the first time a card is
+scanned and kept in process memory as compact StudentCard records, so scans
+of known cards need no database reads. Saves/deletes of Students and Class
+(see attendance/signals.py) bump the roster version, which makes every
+process reload on its next scan - given a shared CACHES backend; otherwise
+other processes reload within LOCAL_CACHE_TTL (see cache_version.py).
+"""
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+import threading
+
+from ..models import Students
+from .cache_version import get_version, bump_version
+from .lcd import to_ascii_vietnamese
+
+
+ROSTER_VERSION = 'roster'
+
+StudentCard = namedtuple('StudentCard', [
+	'student_id',
+	'full_name',
+	'ascii_name',
+	'class_id',
+	'class_label',
+	'class_name',
+	'grade_level',
+	'role_display',
+	'to_number',
+	'seat_number',
+])
+
+_lock = threading.Lock()
+_cards = OrderedDict()
+_loaded_version = None
+_complete = False
+
+
+def _max_entries():
+	return getattr(settings, 'ROSTER_CACHE_MAX_ENTRIES', 5000)
+
+
+def _to_card(student):
+	return StudentCard(
+		student_id=student.student_id,
+		full_name=student.student_full_name,
+		ascii_name=to_ascii_vietnamese(student.student_full_name),
+		class_id=student.student_class_id,
+		class_label=str(student.student_class),
+		class_name=student.student_class.class_name if student.student_class else None,
+		grade_level=student.student_class.grade_level if student.student_class else None,
+		role_display=student.get_student_role_display(),
+		to_number=student.to_number,
+		seat_number=student.seat_number,
+	)
+
+
+def _active_students():
+	return Students.objects.filter(
+		student_active_status=True
+	).select_related('student_class__academic_year')
+
+
+def _warm(version):
+	"""Load the active roster, up to the cache bound"""
+	global _loaded_version, _complete
+
+	max_entries = _max_entries()
+	students = list(_active_students().order_by()[:max_entries + 1])
+
+	_cards.clear()
+	for student in students[:max_entries]:
+		_cards[student.student_card_uid] = _to_card(student)
+
+	# When the whole roster fits, a miss means the card is unknown
+	_complete = len(students) <= max_entries
+	_loaded_version = version
+
+
+def get_student_card(card_uid):
+	"""Return the StudentCard for an active card, or None if the card is unknown or inactive"""
+	return get_student_cards([card_uid]).get(card_uid)
+
+
+def get_student_cards(card_uids):
+	"""Resolve several cards at once; unknown or inactive cards are left out of the result"""
+	version = get_version(ROSTER_VERSION)
+	found = {}
+	missing = []
+
+	with _lock:
+		if _loaded_version != version:
+			_warm(version)
+
+		for card_uid in set(card_uids):
+			card = _cards.get(card_uid)
+			if card is not None:
+				_cards.move_to_end(card_uid)
+				found[card_uid] = card
+			elif not _complete:
+				missing.append(card_uid)
+
+	if not missing:
+		return found
+
+	# Roster is larger than the cache bound - look the rest up in one query
+	loaded = {
+		student.student_card_uid: _to_card(student)
+		for student in _active_students().filter(student_card_uid__in=missing)
+	}
+	found.update(loaded)
+
+	with _lock:
+		if _loaded_version == version:
+			_cards.update(loaded)
+			while len(_cards) > _max_entries():
+				_cards.popitem(last=False)
+	return found
+
+
+def invalidate_roster():
+	"""Drop cached cards in this process and every other one"""
+	global _loaded_version
+
+	bump_version(ROSTER_VERSION)
+	with _lock:
+		_cards.clear()
+		_loaded_version = None
@@ -0,0 +1,148 @@
+"""
+Replay protection for gate scan submissions.
+
+A reader whose HTTP call timed out after the server committed will retry the
+same tap. Each scan is identified by the client's `event_id` or, failing that,
+by device_id + card_uid + timestamp. The answer is kept in Django's cache for
+SCAN_DEDUP_WINDOW seconds, so a retry gets the original response back
+(e.g. the greeting, not "Đã quét buổi sáng") without touching Attendance.
+
+The first request for an event claims its key with cache.add, which is atomic,
+before processing; a duplicate arriving while that request is still running is
+told so (409) instead of recording the tap a second time. Only 200 answers are
+remembered; any other outcome releases the claim, as errors are worth retrying
+for real. The cache backend bounds the table (expiry plus its own culling); use
+a shared backend so retries landing on another worker are recognised too.
+"""
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+
+from ..scan_service import DEFAULT_DEVICE_ID
+from .lcd import to_ascii_vietnamese
+
+
+KEY_PREFIX = 'attendance:scan-event:'
+
+# Placeholder stored while the claiming request runs; short-lived so a crashed
+# worker doesn't block a reader's retries for the whole window
+PENDING = 'pending'
+PENDING_TIMEOUT = 30
+
+IN_PROGRESS = ({
+	'status': 'info',
+	'message': 'This scan is still being processed',
+	'lcd_message': to_ascii_vietnamese('Đang xử lý...'),
+}, 409)
+
+
+def _cache():
+	return caches[getattr(settings, 'SCAN_DEDUP_CACHE', 'default')]
+
+
+def _window():
+	return getattr(settings, 'SCAN_DEDUP_WINDOW', 600)
+
+
+def scan_event_key(event, device_id=None):
+	"""Cache key for one scan event, or None when it can't be identified"""
+	if not isinstance(event, dict) or not _window():
+		return None
+	# Same fallback as the scan itself, so every path keys a reader-less event alike
+	device_id = device_id or event.get('device_id') or DEFAULT_DEVICE_ID
+	if event.get('event_id'):
+		identity = f"id|{device_id}|{event['event_id']}"
+	elif event.get('card_uid') and event.get('timestamp'):
+		# Without a reader timestamp two genuine taps would look identical
+		identity = f"tap|{device_id}|{event['card_uid']}|{event['timestamp']}"
+	else:
+		return None
+	return KEY_PREFIX + hashlib.sha1(identity.encode()).hexdigest()
+
+
+def _answer(value):
+	return IN_PROGRESS if value == PENDING else value
+
+
+def claim(key):
+	"""
+	None when the caller now owns this event and should process it, else the
+	(payload, http_status) to answer with: the first response, or IN_PROGRESS.
+	"""
+	if key is None:
+		return None
+	cache = _cache()
+	if cache.add(key, PENDING, PENDING_TIMEOUT):
+		return None
+	value = cache.get(key)
+	# Expired between the two calls: nobody holds it any more
+	return _answer(value) if value is not None else None
+
+
+def remember(key, payload, status):
+	"""Store a claimed event's answer, or release the claim when it isn't a 200"""
+	if key is None:
+		return
+	if status == 200:
+		_cache().set(key, (payload, status), _window())
+	else:
+		release(key)
+
+
+def release(key):
+	"""Give up a claim without an answer (the request failed)"""
+	if key is not None:
+		_cache().delete(key)
+
+
+async def aclaim(key):
+	if key is None:
+		return None
+	cache = _cache()
+	if await cache.aadd(key, PENDING, PENDING_TIMEOUT):
+		return None
+	value = await cache.aget(key)
+	return _answer(value) if value is not None else None
+
+
+async def aremember(key, payload, status):
+	if key is None:
+		return
+	if status == 200:
+		await _cache().aset(key, (payload, status), _window())
+	else:
+		await arelease(key)
+
+
+async def arelease(key):
+	if key is not None:
+		await _cache().adelete(key)
+
+
+def claim_many(keys):
+	"""
+	key -> (payload, http_status) for the events already answered or in progress
+	elsewhere; every other key is claimed for the caller, as in claim.
+	"""
+	cache = _cache()
+	keys = [key for key in dict.fromkeys(keys) if key is not None]
+	found = cache.get_many(keys)
+	for key in keys:
+		if key not in found and not cache.add(key, PENDING, PENDING_TIMEOUT):
+			found[key] = cache.get(key)
+	return {key: _answer(value) for key, value in found.items() if value is not None}
+
+
+def remember_many(answers):
+	"""Store {key: (payload, http_status)} for claimed events, releasing the ones that aren't a 200"""
+	answers = {key: answer for key, answer in answers.items() if key is not None}
+	remembered = {key: answer for key, answer in answers.items() if answer[1] == 200}
+	if remembered:
+		_cache().set_many(remembered, _window())
+	release_many(key for key in answers if key not in remembered)
+
+
+def release_many(keys):
+	keys = [key for key in keys if key is not None]
+	if keys:
+		_cache().delete_many(keys)
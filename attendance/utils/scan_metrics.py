@@ -0,0 +1,232 @@
+"""
+In-process metrics for the gate scan pipeline.
+
+Each scan carries a ScanTimer that marks the end of every stage (parse,
+lookup, excuse, upsert, render, ...). When the scan finishes, the stage times
+go into fixed-bucket histograms and the outcome is counted, both overall and
+per device. Recording is a bisect plus a few integer increments under one
+lock, so it is cheap enough to leave on in production.
+
+Counters are per process: with several workers, scrape each one or dump a
+snapshot per process (SCAN_METRICS_SNAPSHOT_DIR) and add them up. Snapshots
+are written by a background thread at most every SCAN_METRICS_SNAPSHOT_INTERVAL
+seconds, never on the scan's own thread.
+"""
+from bisect import bisect_left
+from collections import Counter
+from django.conf import settings
+from time import perf_counter
+import json
+import logging
+import os
+import threading
+
+
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+OTHER_DEVICE = 'other'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_histograms = {}
+_outcomes = Counter()
+_devices = Counter()
+_next_snapshot = 0.0
+_snapshot_due = threading.Event()
+_writer = None
+
+
+class _Histogram:
+	__slots__ = ('counts', 'sum', 'count')
+
+	def __init__(self):
+		self.counts = [0] * (len(BUCKETS) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+
+class ScanTimer:
+	"""Stage stopwatch for one scan: mark(stage) closes the stage that just ran"""
+	__slots__ = ('started', 'last', 'stages')
+
+	def __init__(self):
+		self.started = self.last = perf_counter()
+		self.stages = []
+
+	def mark(self, stage):
+		now = perf_counter()
+		self.stages.append((stage, now - self.last))
+		self.last = now
+
+	def finish(self, outcome=None, device_id=None, total='total'):
+		"""`total` names the end-to-end histogram; a whole batch goes under its own so it can't skew the per-scan one"""
+		self.stages.append((total, perf_counter() - self.started))
+		record(self.stages, outcome, device_id)
+
+
+class _NullTimer:
+	__slots__ = ()
+
+	def mark(self, stage):
+		pass
+
+	def finish(self, outcome=None, device_id=None, total='total'):
+		pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def start_timer():
+	if not getattr(settings, 'SCAN_METRICS_ENABLED', True):
+		return NULL_TIMER
+	return ScanTimer()
+
+
+def record(stages, outcome=None, device_id=None):
+	"""Add (stage, seconds) pairs to the histograms and count the outcome, if given"""
+	global _next_snapshot
+	buckets = [(stage, bisect_left(BUCKETS, seconds), seconds) for stage, seconds in stages]
+	snapshot_due = False
+
+	with _lock:
+		for stage, bucket, seconds in buckets:
+			histogram = _histograms.get(stage)
+			if histogram is None:
+				histogram = _histograms[stage] = _Histogram()
+			histogram.counts[bucket] += 1
+			histogram.sum += seconds
+			histogram.count += 1
+		if outcome is not None:
+			_count(outcome, device_id)
+
+		interval = _snapshot_interval()
+		if interval:
+			now = perf_counter()
+			if now >= _next_snapshot:
+				_next_snapshot = now + interval
+				snapshot_due = True
+
+	if snapshot_due:
+		_start_writer()
+		_snapshot_due.set()
+
+
+def count_scan(outcome, device_id=None):
+	"""Count one scan outcome without timings (used for the events of a batch)"""
+	with _lock:
+		_count(outcome, device_id)
+
+
+def _count(outcome, device_id):
+	_outcomes[outcome] += 1
+	# device_id comes from the request body, so cap how many distinct ones we keep
+	if device_id is not None:
+		key = (str(device_id), outcome)
+		if key not in _devices and len(_devices) >= getattr(settings, 'SCAN_METRICS_MAX_DEVICES', 500):
+			key = (OTHER_DEVICE, outcome)
+		_devices[key] += 1
+
+
+def _snapshot_interval():
+	if not getattr(settings, 'SCAN_METRICS_SNAPSHOT_DIR', None):
+		return 0
+	return getattr(settings, 'SCAN_METRICS_SNAPSHOT_INTERVAL', 60)
+
+
+def snapshot():
+	"""Current counters as plain data, ready for json.dumps"""
+	with _lock:
+		return {
+			'pid': os.getpid(),
+			'buckets': list(BUCKETS),
+			'stages': {
+				stage: {'counts': list(h.counts), 'sum': h.sum, 'count': h.count}
+				for stage, h in _histograms.items()
+			},
+			'outcomes': dict(_outcomes),
+			'devices': [
+				{'device_id': device_id, 'outcome': outcome, 'count': count}
+				for (device_id, outcome), count in _devices.items()
+			],
+		}
+
+
+def dump_snapshot(directory=None):
+	"""Write this process's snapshot to <dir>/scan-metrics-<pid>.json; returns the path"""
+	directory = directory or settings.SCAN_METRICS_SNAPSHOT_DIR
+	os.makedirs(directory, exist_ok=True)
+	path = os.path.join(directory, f'scan-metrics-{os.getpid()}.json')
+	tmp_path = f'{path}.tmp'
+	with open(tmp_path, 'w') as f:
+		json.dump(snapshot(), f)
+	os.replace(tmp_path, path)
+	return path
+
+
+def _write_snapshots():
+	while True:
+		_snapshot_due.wait()
+		_snapshot_due.clear()
+		try:
+			dump_snapshot()
+		except OSError:
+			logger.warning('Writing the scan metrics snapshot failed', exc_info=True)
+
+
+def _start_writer():
+	global _writer
+	if _writer is not None and _writer.is_alive():
+		return
+	with _lock:
+		if _writer is None or not _writer.is_alive():
+			_writer = threading.Thread(target=_write_snapshots, name='scan-metrics-snapshot', daemon=True)
+			_writer.start()
+
+
+def _label(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+	"""Prometheus text exposition of the current counters"""
+	data = snapshot()
+	bounds = [str(bound) for bound in BUCKETS] + ['+Inf']
+	lines = [
+		'# HELP attendance_scan_stage_seconds Time spent in each stage of the gate scan pipeline',
+		'# TYPE attendance_scan_stage_seconds histogram',
+	]
+	for stage, histogram in sorted(data['stages'].items()):
+		cumulative = 0
+		for bound, count in zip(bounds, histogram['counts']):
+			cumulative += count
+			lines.append(f'attendance_scan_stage_seconds_bucket{{stage="{_label(stage)}",le="{bound}"}} {cumulative}')
+		lines.append(f'attendance_scan_stage_seconds_sum{{stage="{_label(stage)}"}} {histogram["sum"]:.6f}')
+		lines.append(f'attendance_scan_stage_seconds_count{{stage="{_label(stage)}"}} {histogram["count"]}')
+
+	lines += [
+		'# HELP attendance_scans_total Gate scans by outcome',
+		'# TYPE attendance_scans_total counter',
+	]
+	for outcome, count in sorted(data['outcomes'].items()):
+		lines.append(f'attendance_scans_total{{outcome="{_label(outcome)}"}} {count}')
+
+	lines += [
+		'# HELP attendance_scans_by_device_total Gate scans by reader and outcome',
+		'# TYPE attendance_scans_by_device_total counter',
+	]
+	for entry in sorted(data['devices'], key=lambda e: (e['device_id'], e['outcome'])):
+		lines.append(
+			f'attendance_scans_by_device_total{{device_id="{_label(entry["device_id"])}",'
+			f'outcome="{_label(entry["outcome"])}"}} {entry["count"]}'
+		)
+	return '\n'.join(lines) + '\n'
+
+
+def reset():
+	with _lock:
+		_histograms.clear()
+		_outcomes.clear()
+		_devices.clear()
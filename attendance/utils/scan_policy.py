@@ -0,0 +1,216 @@
+"""
+Gate scan time-window policy.
+
+The morning/afternoon scan windows and the late cutoff are derived from the
+bell schedule (SchoolPeriod) and adjusted by ScanWindowOverride rows for a
+weekday, a grade or both. Each (weekday, grade) policy is compiled once into
+a sorted array of window edges, so classifying a scan is one bisect on an
+integer. Saving or deleting a SchoolPeriod or ScanWindowOverride (see
+attendance/signals.py) bumps the version and every process recompiles
+(within LOCAL_CACHE_TTL when CACHES isn't shared; see cache_version.py).
+
+Without any SchoolPeriod rows the built-in defaults below apply. The bisect
+needs the windows in order; an override that would break the order is
+rejected by ScanWindowOverride.clean() and, if one gets in anyway, skipped
+with an error in the log when the policy is compiled.
+"""
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from django.conf import settings
+import logging
+import threading
+
+from ..models import SchoolPeriod, ScanWindowOverride
+from .cache_version import get_version, bump_version
+
+
+logger = logging.getLogger(__name__)
+
+SCAN_POLICY_VERSION = 'scan_policy'
+
+# Defaults when the bell schedule doesn't say otherwise
+MORNING_START = time(6, 0)    # 6:00 AM
+MORNING_END = time(11, 0)     # 11:00 AM
+AFTERNOON_START = time(13, 0) # 1:00 PM
+AFTERNOON_END = time(20, 0)   # 8:00 PM
+LATE_CUTOFF = time(7, 0)      # 7:00 AM - late if after this
+
+# Periods up to this number are morning periods (matches ExcusedAbsence.applies_to_period)
+LAST_MORNING_PERIOD = 5
+
+WINDOW_FIELDS = ('morning_start', 'morning_end', 'late_cutoff', 'afternoon_start', 'afternoon_end')
+# The order the window times must keep; the morning window closes before the afternoon one opens
+WINDOW_ORDER = ('morning_start', 'late_cutoff', 'morning_end', 'afternoon_start', 'afternoon_end')
+ORDER_MESSAGE = 'Times must run morning start <= late cutoff <= morning end < afternoon start <= afternoon end'
+
+_lock = threading.Lock()
+_loaded_version = None
+_base = None
+_overrides = None
+_policies = {}
+
+
+def _micros(t):
+	return ((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond
+
+
+class ScanPolicy:
+	"""Compiled windows for one weekday and grade"""
+	__slots__ = ('windows', 'edges', 'sessions', 'late_cutoff')
+
+	def __init__(self, windows):
+		self.windows = windows
+		# Windows are inclusive at both ends, so each closes one microsecond after its end time
+		self.edges = [
+			_micros(windows['morning_start']), _micros(windows['morning_end']) + 1,
+			_micros(windows['afternoon_start']), _micros(windows['afternoon_end']) + 1,
+		]
+		self.sessions = (None, 'morning', None, 'afternoon', None)
+		self.late_cutoff = _micros(windows['late_cutoff'])
+
+	def session(self, scan_time):
+		"""'morning', 'afternoon' or None (outside both windows)"""
+		return self.sessions[bisect_right(self.edges, _micros(scan_time))]
+
+	def is_late(self, scan_time):
+		return _micros(scan_time) > self.late_cutoff
+
+
+def windows_in_order(windows):
+	"""True when the given window times (None = not set) keep WINDOW_ORDER"""
+	given = [windows[field] for field in WINDOW_ORDER if windows.get(field) is not None]
+	if given != sorted(given):
+		return False
+	return windows.get('morning_end') is None or windows.get('afternoon_start') is None or (
+		windows['morning_end'] < windows['afternoon_start']
+	)
+
+
+def _shift(t, minutes):
+	shifted = datetime.combine(datetime.min.date() + timedelta(days=1), t) + timedelta(minutes=minutes)
+	return shifted.time()
+
+
+def _base_windows(periods):
+	"""Windows from the bell schedule: the gate opens SCAN_WINDOW_LEAD_MINUTES before a session's first period"""
+	lead = -getattr(settings, 'SCAN_WINDOW_LEAD_MINUTES', 60)
+	windows = {
+		'morning_start': MORNING_START,
+		'morning_end': MORNING_END,
+		'late_cutoff': LATE_CUTOFF,
+		'afternoon_start': AFTERNOON_START,
+		'afternoon_end': AFTERNOON_END,
+	}
+	morning = [p for p in periods if p[0] <= LAST_MORNING_PERIOD]
+	afternoon = [p for p in periods if p[0] > LAST_MORNING_PERIOD]
+	if morning:
+		windows['late_cutoff'] = morning[0][1]
+		windows['morning_start'] = _shift(morning[0][1], lead)
+		windows['morning_end'] = max(end for _, _, end in morning)
+	if afternoon:
+		windows['afternoon_start'] = _shift(afternoon[0][1], lead)
+		windows['afternoon_end'] = max(end for _, _, end in afternoon)
+	if not windows_in_order(windows):
+		logger.error('Scan windows from the bell schedule are out of order, using the defaults: %s', windows)
+		return _base_windows([])
+	return windows
+
+
+def _load():
+	periods = list(
+		SchoolPeriod.objects.filter(is_active=True)
+		.order_by('period_number')
+		.values_list('period_number', 'start_time', 'end_time')
+	)
+	overrides = list(
+		ScanWindowOverride.objects.filter(is_active=True)
+		.values('override_id', 'day_of_week', 'grade_level', *WINDOW_FIELDS)
+	)
+	return _base_windows(periods), overrides
+
+
+def _merge(base, overrides, weekday, grade_level):
+	"""The windows for a weekday and grade, and the overrides skipped for breaking their order"""
+	windows = dict(base)
+	matching = [
+		o for o in overrides
+		if o['day_of_week'] in (None, weekday) and o['grade_level'] in (None, grade_level)
+	]
+	# Least specific first: everyday/all grades, weekday only, grade only, weekday + grade
+	matching.sort(key=lambda o: (o['grade_level'] is not None, o['day_of_week'] is not None))
+	skipped = []
+	for override in matching:
+		merged = dict(windows)
+		merged.update({field: override[field] for field in WINDOW_FIELDS if override[field] is not None})
+		if windows_in_order(merged):
+			windows = merged
+		else:
+			skipped.append(override)
+	return windows, skipped
+
+
+def _compile(base, overrides, weekday, grade_level):
+	windows, skipped = _merge(base, overrides, weekday, grade_level)
+	for override in skipped:
+		logger.error(
+			'Skipping scan window override %s for weekday %s, grade %s: %s',
+			override['override_id'], weekday, grade_level, ORDER_MESSAGE
+		)
+	return ScanPolicy(windows)
+
+
+def misordered_scopes(override):
+	"""
+	(weekday, grade) pairs an unsaved or changed override would leave with windows out of
+	order, given the bell schedule and the other active overrides
+	"""
+	base, overrides = _load()
+	overrides = [o for o in overrides if o['override_id'] != override.pk]
+	candidate = {field: getattr(override, field) for field in ('override_id', 'day_of_week', 'grade_level', *WINDOW_FIELDS)}
+	weekdays = [override.day_of_week] if override.day_of_week is not None else range(1, 8)
+	grades = {override.grade_level} if override.grade_level is not None else (
+		{None} | {o['grade_level'] for o in overrides}
+	)
+	return [
+		(weekday, grade_level)
+		for weekday in weekdays
+		for grade_level in sorted(grades, key=lambda grade: (grade is not None, grade))
+		if candidate in _merge(base, overrides + [candidate], weekday, grade_level)[1]
+	]
+
+
+def get_scan_policy(weekday, grade_level=None):
+	"""Compiled policy for an ISO weekday (1 = Monday) and grade, cached per process"""
+	global _loaded_version, _base, _overrides
+
+	version = get_version(SCAN_POLICY_VERSION)
+	key = (weekday, grade_level)
+	with _lock:
+		if _loaded_version == version:
+			policy = _policies.get(key)
+			if policy is not None:
+				return policy
+			base, overrides = _base, _overrides
+		else:
+			base = None
+
+	if base is None:
+		base, overrides = _load()
+
+	policy = _compile(base, overrides, weekday, grade_level)
+	with _lock:
+		if _loaded_version != version:
+			_policies.clear()
+			_loaded_version, _base, _overrides = version, base, overrides
+		_policies[key] = policy
+	return policy
+
+
+def invalidate_scan_policy():
+	"""Make every process recompile its scan windows"""
+	global _loaded_version
+
+	bump_version(SCAN_POLICY_VERSION)
+	with _lock:
+		_policies.clear()
+		_loaded_version = None
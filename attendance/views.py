@@ -4,6 +4,8 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Q
 from datetime import datetime, timedelta
 from .models import (
 	Teachers, Class, Students, Attendance, AttendancePeriod,
@@ -13,6 +15,15 @@ from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
 from collections import defaultdict
 import json
+from .utils.academic_year import get_active_academic_year
+from .utils.excuse_index import get_day_index, period_excuse
+from .utils.dashboard_stats import attendance_changed
+from .utils.class_stats import LATE_STATUSES, add_counts, get_class_stats
+from .db_router import use_replica
+
+# prepare_day creates a 'no_scan' row for every student ahead of the scans;
+# a day only counts once something was recorded on it
+RECORDED_DAY = ~Q(status='no_scan') | Q(morning_gate_scan_time__isnull=False) | Q(afternoon_gate_scan_time__isnull=False)
 
 # Simple login view
 def login_view(request):
@@ -120,6 +131,7 @@ def parent_dashboard(request):
 	# Calculate stats for last 30 days
 	thirty_days_ago = today - timedelta(days=30)
 	month_attendance = Attendance.objects.filter(
+		RECORDED_DAY,
 		student=student,
 		check_in_date__gte=thirty_days_ago
 	)
@@ -178,6 +190,7 @@ def parent_dashboard(request):
 
 
 @login_required
+@use_replica
 def teacher_dashboard(request):
 	"""Teacher dashboard - today's attendance overview"""
 	
@@ -202,21 +215,14 @@ def teacher_dashboard(request):
 	local_now = timezone.localtime(now)
 	today = local_now.date()
 	
-	# Statistics for all teacher's classes
-	total_students = Students.objects.filter(
-		student_class__in=teacher_classes,
-		student_active_status=True
-	).count()
+	# Statistics for all teacher's classes, from their counters for today
+	class_stats = get_class_stats([class_obj.class_id for class_obj in teacher_classes], today).values()
+	total_students = sum(counters['total_active'] for counters in class_stats)
 	
-	# Today's attendance
-	today_attendance = Attendance.objects.filter(
-		student__student_class__in=teacher_classes,
-		check_in_date=today
-	)
-	
-	present_count = today_attendance.filter(status='attended').count()
-	late_count = today_attendance.filter(status='late').count()
-	absent_count = total_students - (present_count + late_count)
+	# Consider morning scan as "present", like the live stats API
+	present_count = sum(counters['morning_scanned'] for counters in class_stats)
+	late_count = sum(counters['late'] for counters in class_stats)
+	absent_count = total_students - present_count
 	
 	# Recent scans (last 10)
 	recent_scans = Attendance.objects.filter(
@@ -341,44 +347,47 @@ def teacher_mark_attendance(request, student_id):
 	
 	# Get active academic year
 	try:
-		academic_year = AcademicYear.objects.get(academic_year_active_status=True)
+		academic_year = get_active_academic_year()
 	except AcademicYear.DoesNotExist:
 		return JsonResponse({'error': 'No active academic year'}, status=400)
 	
-	# Check if already marked today
-	existing = Attendance.objects.filter(
-		student=student,
-		check_in_date=today
-	).first()
-	
-	if existing:
-		# Update existing record
-		existing.status = status
-		existing.is_verified_by_teacher = True
-		existing.verified_at = timezone.now()
-		existing.save()
-		
-		return JsonResponse({
-			'success': True,
-			'message': 'Attendance updated',
-			'status': status
-		})
-	else:
-		# Create new record
-		attendance = Attendance.objects.create(
+	with transaction.atomic():
+		# Check if already marked today (locked, so the late counter moves from the status it really had)
+		existing = Attendance.objects.select_for_update().filter(
 			student=student,
-			academic_year=academic_year,
-			status=status,
-			is_verified_by_teacher=True,
-			verified_at=timezone.now(),
-			device_id='manual_entry'
-		)
+			check_in_date=today
+		).first()
 		
-		return JsonResponse({
-			'success': True,
-			'message': 'Attendance marked',
-			'status': status
-		})
+		if existing:
+			# Update existing record
+			was_late = existing.status in LATE_STATUSES
+			existing.status = status
+			existing.is_verified_by_teacher = True
+			existing.verified_at = timezone.now()
+			existing.save()
+			message = 'Attendance updated'
+		else:
+			# Create new record
+			was_late = False
+			Attendance.objects.create(
+				student=student,
+				academic_year=academic_year,
+				check_in_date=today,
+				status=status,
+				is_verified_by_teacher=True,
+				verified_at=timezone.now(),
+				device_id='manual_entry'
+			)
+			message = 'Attendance marked'
+		
+		add_counts(student.student_class_id, today, late=int(status in LATE_STATUSES) - int(was_late))
+	attendance_changed(student.student_class_id)
+	
+	return JsonResponse({
+		'success': True,
+		'message': message,
+		'status': status
+	})
 
 
 @login_required
@@ -400,6 +409,7 @@ def teacher_verify_attendance(request, attendance_id):
 	attendance.is_verified_by_teacher = True
 	attendance.verified_at = timezone.now()
 	attendance.save()
+	attendance_changed(attendance.student.student_class_id)
 	
 	return JsonResponse({
 		'success': True,
@@ -468,6 +478,7 @@ def teacher_students(request):
 	for student in students:
 		# Get attendance records for last 30 days
 		attendance_records = Attendance.objects.filter(
+			RECORDED_DAY,
 			student=student,
 			check_in_date__gte=thirty_days_ago,
 			check_in_date__lte=today
@@ -529,9 +540,14 @@ def teacher_student_detail(request, student_id):
 	).order_by('-check_in_date')[:30]
 	
 	# Calculate stats
-	total_days = recent_attendance.count()
-	present_days = recent_attendance.filter(status='attended').count()
-	late_days = recent_attendance.filter(status='late').count()
+	recorded_days = Attendance.objects.filter(
+		RECORDED_DAY,
+		student=student,
+		check_in_date__gte=thirty_days_ago
+	)
+	total_days = recorded_days.count()
+	present_days = recorded_days.filter(status='attended').count()
+	late_days = recorded_days.filter(status='late').count()
 	absent_days = 30 - total_days  # Approximate
 	
 	context = {
@@ -549,6 +565,7 @@ def teacher_student_detail(request, student_id):
 
 
 @login_required
+@use_replica
 def teacher_attendance_history(request):
 	"""View attendance history with date filters"""
 	
@@ -608,6 +625,7 @@ def teacher_attendance_history(request):
 	return render(request, 'teacher/attendance_history.html', context)
 
 @login_required
+@use_replica
 def parent_dashboard(request):
 	"""Parent dashboard - view their child's attendance"""
 	
@@ -638,6 +656,7 @@ def parent_dashboard(request):
 	# Calculate stats for last 30 days
 	thirty_days_ago = today - timedelta(days=30)
 	month_attendance = Attendance.objects.filter(
+		RECORDED_DAY,
 		student=student,
 		check_in_date__gte=thirty_days_ago
 	)
@@ -667,6 +686,7 @@ def parent_dashboard(request):
 
 
 @login_required
+@use_replica
 def parent_attendance_history(request):
 	"""Parent view detailed attendance history of their child"""
 	
@@ -736,7 +756,7 @@ def parent_attendance_history(request):
 		})
 	
 	# Calculate summary stats for the date range
-	total_days_in_range = attendance_records.count()
+	total_days_in_range = attendance_records.filter(RECORDED_DAY).count()
 	total_periods_in_range = period_records.count()
 	present_periods_in_range = period_records.filter(status='present').count()
 	late_periods_in_range = period_records.filter(status='late').count()
@@ -764,6 +784,7 @@ def parent_attendance_history(request):
 	return render(request, 'parent/attendance_history.html', context)
 
 @login_required
+@use_replica
 def teacher_current_classes(request):
 	"""Show classes teacher is teaching today with their periods"""
 	if not hasattr(request.user, 'teacher_profile'):
@@ -779,7 +800,7 @@ def teacher_current_classes(request):
 	weekday = local_now.isoweekday()
 
 	try:
-		active_year = AcademicYear.objects.get(academic_year_active_status=True)
+		active_year = get_active_academic_year()
 	except AcademicYear.DoesNotExist:
 		return render(request, 'teacher/current_classes.html', {
 			'error': 'Không tìm thấy năm học đang hoạt động'
@@ -803,23 +824,18 @@ def teacher_current_classes(request):
 			current_schedule = schedule
 			break
 
-	# Get attendance summary for each class
+	# Get attendance summary for each class (today's counters, one row per class)
+	class_stats = get_class_stats({schedule.class_obj_id for schedule in schedules_today}, today)
 	schedules_with_stats = []
 	for schedule in schedules_today:
 		class_obj = schedule.class_obj
+		counters = class_stats[str(class_obj.class_id)]
 		
 		# Total students in class
-		total_students = Students.objects.filter(
-			student_class=class_obj,
-			student_active_status=True
-		).count()
+		total_students = counters['total_active']
 		
 		# Gate scans today
-		morning_scanned = Attendance.objects.filter(
-			student__student_class=class_obj,
-			check_in_date=today,
-			morning_gate_scan_time__isnull=False
-		).count()
+		morning_scanned = counters['morning_scanned']
 		
 		# Period attendance (if marked)
 		period_marked = AttendancePeriod.objects.filter(
@@ -896,18 +912,13 @@ def teacher_take_period_attendance(request, schedule_id):
 	for att in gate_attendance:
 		gate_attendance_dict[att.student.student_id] = att
 
-	# Get excused absences for today
+	# Get excused absences covering this period (one lookup of the per-day excuse index)
+	day_excuses = get_day_index(today)
 	excused_dict = {}
-	excused_absences = ExcusedAbsence.objects.filter(
-		student__in=students,
-		start_date__lte=today,
-		end_date__gte=today,
-		approved_by_homeroom=True
-	)
-	for excuse in excused_absences:
-		# Check if excuse applies to this period
-		if excuse.applies_to_period(period_number):
-			excused_dict[excuse.student.student_id] = excuse
+	for student in students:
+		excuse = period_excuse(day_excuses.get(student.student_id, ()), period_number)
+		if excuse:
+			excused_dict[student.student_id] = {'student': student, 'reason': excuse.reason}
 
 	# Get or create period attendance records
 	period_records = {}
@@ -933,7 +944,7 @@ def teacher_take_period_attendance(request, schedule_id):
 			if student.student_id in excused_dict:
 				# Student has approved excuse
 				record.status = 'excused'
-				record.notes = f"Excused: {excused_dict[student.student_id].reason}"
+				record.notes = f"Excused: {excused_dict[student.student_id]['reason']}"
 			elif daily_attendance and daily_attendance.morning_gate_scan_time:
 				# Student scanned gate in morning
 				if daily_attendance.status == 'late_arrival':
@@ -1091,6 +1102,7 @@ def teacher_save_period_attendance(request, schedule_id):
 
 
 @login_required
+@use_replica
 def teacher_period_attendance_summary(request):
 	"""View summary of all periods marked today"""
 	if not hasattr(request.user, 'teacher_profile'):
@@ -1103,7 +1115,7 @@ def teacher_period_attendance_summary(request):
 	weekday = local_now.isoweekday()
 
 	try:
-		active_year = AcademicYear.objects.get(academic_year_active_status=True)
+		active_year = get_active_academic_year()
 	except AcademicYear.DoesNotExist:
 		return render(request, 'teacher/period_summary.html', {
 			'error': 'No active academic year'
@@ -1388,6 +1400,7 @@ def teacher_reject_excuse(request, excuse_id):
 		'message': f'Đã từ chối đơn xin phép của {student_name}'
 	})
 
+@use_replica
 def teacher_my_schedule(request):
 	"""Teacher views their daily/weekly teaching schedule"""
 	
@@ -1413,7 +1426,7 @@ def teacher_my_schedule(request):
 		selected_day = today_weekday  
 	
 	try:
-		active_year = AcademicYear.objects.get(academic_year_active_status=True)
+		active_year = get_active_academic_year()
 	except AcademicYear.DoesNotExist:
 		return render(request, 'teacher/my_schedule.html', {
 			'error': 'No active academic year'
@@ -1501,6 +1514,7 @@ def teacher_my_schedule(request):
 
 
 @login_required
+@use_replica
 def parent_student_timetable(request):
 	"""Parent views their child's weekly timetable"""
 	
@@ -1516,7 +1530,7 @@ def parent_student_timetable(request):
 	today_weekday = now.isoweekday()
 	
 	try:
-		active_year = AcademicYear.objects.get(academic_year_active_status=True)
+		active_year = get_active_academic_year()
 	except AcademicYear.DoesNotExist:
 		return render(request, 'parent/student_timetable.html', {
 			'error': 'No active academic year'
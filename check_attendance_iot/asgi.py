@@ -3,6 +3,11 @@ ASGI config for check_attendance_iot project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Gate readers can use the async scan endpoint (/api/attendance-scan/async/),
+which doesn't tie up a worker thread per tap when served from here, e.g.:
+
+    uvicorn check_attendance_iot.asgi:application --workers 2
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
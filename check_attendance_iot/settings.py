@@ -101,6 +101,7 @@ DATABASES = {
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
         "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
         'OPTIONS': {
             'sslmode': 'verify-ca',
             'sslrootcert': BASE_DIR / 'certs' / 'ca.pem',
@@ -108,8 +109,121 @@ DATABASES = {
     }
 }
 
-
-
+# psycopg connection pool per worker process: TLS handshakes happen when the
+# pool opens or replaces a connection, not per request. Size it so that
+# workers x DB_POOL_MAX_SIZE stays under the server's max_connections.
+# Benchmark with `manage.py bench_db_connections`.
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+if DB_POOL:
+    from psycopg_pool import ConnectionPool
+
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        # Seconds a request waits for a free connection before failing
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        # Idle connections above min_size are closed after this many seconds
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        # Connections are recycled after this many seconds
+        "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    }
+    # Health check on checkout: one round trip, catches connections the server dropped
+    if os.getenv("DB_POOL_CHECK", "True") == "True":
+        DATABASES["default"]["OPTIONS"]["pool"]["check"] = ConnectionPool.check_connection
+    # The pool owns the connections; Django must hand them back after each request
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = False
+
+# Optional streaming replica for dashboards, histories, reports and timetables
+# (attendance/db_router.py). Scans and other writes always use the primary.
+if os.getenv("DB_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.getenv("DB_REPLICA_HOST"),
+        "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "USER": os.getenv("DB_REPLICA_USERNAME", DATABASES["default"]["USER"]),
+        "PASSWORD": os.getenv("DB_REPLICA_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_ROUTERS = ['attendance.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'attendance.db_router.PrimaryPinMiddleware'
+    )
+# Staleness tolerance: a replica further behind is skipped, and a browser that
+# just wrote reads from the primary for this long
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+
+
+# Cache shared by every worker process: it carries the version counters that
+# tell each worker to reload its in-memory roster, academic year, excuses, scan
+# windows and device keys, plus the dashboard stats, ETags and recent scans.
+#   CACHE_URL=redis://127.0.0.1:6379/1   Redis (needs the redis package)
+#   CACHE_URL=db://attendance_cache      database table (run `manage.py createcachetable`)
+# Unset, each process gets its own local-memory cache, which is only correct
+# with a single worker (the attendance.W001 check warns otherwise).
+CACHE_URL = os.getenv("CACHE_URL", "")
+if CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith("db://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": CACHE_URL[len("db://"):] or "attendance_cache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+# Worker processes serving the app (gunicorn/uvicorn read the same variable)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# In-process caches also reload after this many seconds, in case a version
+# bump never reached them (0 disables)
+LOCAL_CACHE_TTL = int(os.getenv("LOCAL_CACHE_TTL", "60"))
+
+
+# Gate scans
+# Fast-ack: answer the reader as soon as the scan is journaled locally and
+# write Attendance in the background (see attendance/scan_journal.py)
+SCAN_FAST_ACK = os.getenv("SCAN_FAST_ACK", "False") == "True"
+SCAN_JOURNAL_PATH = os.getenv("SCAN_JOURNAL_PATH", BASE_DIR / 'scan_journal.sqlite3')
+# Per-stage scan timings served at /metrics (attendance/utils/scan_metrics.py);
+# set SCAN_METRICS_SNAPSHOT_DIR to also dump each worker's counters to disk
+SCAN_METRICS_ENABLED = os.getenv("SCAN_METRICS_ENABLED", "True") == "True"
+SCAN_METRICS_SNAPSHOT_DIR = os.getenv("SCAN_METRICS_SNAPSHOT_DIR") or None
+# Bearer token /metrics requires; without one it only checks REMOTE_ADDR, which
+# behind nginx is the proxy's own address for every client
+SCAN_METRICS_TOKEN = os.getenv("SCAN_METRICS_TOKEN") or None
+# Seconds a scan's answer is kept for replaying client retries (0 disables)
+SCAN_DEDUP_WINDOW = int(os.getenv("SCAN_DEDUP_WINDOW", "600"))
+# Append-only log of every tap (ScanEvent), written behind the response in bulk
+SCAN_EVENT_LOG = os.getenv("SCAN_EVENT_LOG", "True") == "True"
+# Recorded scans pushed to open teacher dashboards (attendance/scan_feed.py)
+SCAN_FEED = os.getenv("SCAN_FEED", "True") == "True"
+# Seconds teacher dashboard stats are shared between polls (0 disables)
+DASHBOARD_STATS_TTL = int(os.getenv("DASHBOARD_STATS_TTL", "5"))
+# Recent scans shown on the teacher dashboard, and kept per class in the cache
+DASHBOARD_RECENT_SCANS = int(os.getenv("DASHBOARD_RECENT_SCANS", "10"))
+RECENT_SCANS_BUFFER = int(os.getenv("RECENT_SCANS_BUFFER", "50"))
+# Readers sign scans with their Device secret (attendance/device_auth.py);
+# leave off until every reader is flashed with signing firmware
+DEVICE_AUTH_REQUIRED = os.getenv("DEVICE_AUTH_REQUIRED", "False") == "True"
+DEVICE_AUTH_MAX_SKEW = int(os.getenv("DEVICE_AUTH_MAX_SKEW", "300"))
+# Binary TCP/UDP transport for readers (`manage.py run_gate_listener`)
+GATE_LISTENER_PORT = int(os.getenv("GATE_LISTENER_PORT", "9750"))
+
+# Optional PostgreSQL partitioning of attendance/attendance_periods by date
+# ("month" or "year" = academic year); see `manage.py partition_attendance`
+ATTENDANCE_PARTITION_INTERVAL = os.getenv("ATTENDANCE_PARTITION_INTERVAL", "month")
 
 
 # Internationalization